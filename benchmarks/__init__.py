@@ -0,0 +1 @@
+"""Benchmarks for gmailconnector, that can be run as modules, e.g. ``python -m benchmarks.address``."""
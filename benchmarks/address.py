@@ -0,0 +1,88 @@
+"""Micro-benchmark for parsing email addresses with and without the IDNA fast path.
+
+>>> python -m benchmarks.address 1000000
+
+"""
+
+import random
+import string
+import sys
+import time
+from typing import Callable, List
+
+from idna.core import IDNAError
+from idna.core import encode as idna_encode
+
+from gmailconnector.validator.address import EmailAddress, encode_domain
+from gmailconnector.validator.exceptions import AddressFormatError
+
+DOMAINS = ("gmail.com", "yahoo.com", "outlook.com", "example.org", "bücher.de")
+
+
+def generate(count: int, seed: int = 0) -> List[str]:
+    """Generates a list of addresses spread across a handful of domains."""
+    rand = random.Random(seed)
+    return [
+        "".join(rand.choices(string.ascii_lowercase, k=8)) + "@" + rand.choice(DOMAINS)
+        for _ in range(count)
+    ]
+
+
+def baseline(address: str) -> str:
+    """Parses an address the way ``EmailAddress`` did before the fast path."""
+    try:
+        user, domain = address.rsplit("@", 1)
+    except ValueError:
+        raise AddressFormatError
+    if not user:
+        raise AddressFormatError("Empty user")
+    try:
+        domain = idna_encode(domain).decode("ascii")
+    except IDNAError as error:
+        raise AddressFormatError(error)
+    return "@".join((user, domain))
+
+
+def timed(name: str, count: int, func: Callable[[], None]) -> float:
+    """Runs the function and prints the throughput."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24}{elapsed:>10.3f}s{count / elapsed:>16,.0f} addresses/s")
+    return elapsed
+
+
+def check_errors() -> None:
+    """Ensures the fast path raises the same errors as the IDNA encoder."""
+    for address in ("user", "@gmail.com", "user@", "user@-gmail.com", "user@a..com"):
+        try:
+            baseline(address)
+        except AddressFormatError as error:
+            expected = str(error)
+        try:
+            EmailAddress(address)
+        except AddressFormatError as error:
+            assert str(error) == expected, (address, str(error), expected)
+        else:
+            raise AssertionError(f"{address!r} was accepted")
+
+
+def main(count: int = 1_000_000) -> None:
+    """Compares the baseline parser, the fast path and ``parse_many``."""
+    check_errors()
+    addresses = generate(count)
+    print(f"Parsing {count:,} addresses")
+    slow = timed("baseline (idna)", count, lambda: [baseline(a) for a in addresses])
+    encode_domain.cache_clear()
+    fast = timed("EmailAddress", count, lambda: [EmailAddress(a) for a in addresses])
+    encode_domain.cache_clear()
+    bulk = timed(
+        "EmailAddress.parse_many",
+        count,
+        lambda: EmailAddress.parse_many(addresses),
+    )
+    print(f"Speedup: {slow / fast:.1f}x (single), {slow / bulk:.1f}x (parse_many)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
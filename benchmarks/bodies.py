@@ -0,0 +1,230 @@
+"""Benchmark for extracting the body of emails in mixed charsets, against the extraction that ``get_info`` used before.
+
+>>> python -m benchmarks.bodies 2000
+
+"""
+
+import base64
+import binascii
+import email
+import quopri
+import sys
+import time
+from email.message import Message
+from typing import Callable, List, Tuple
+
+from gmailconnector.attachments import is_attachment
+from gmailconnector.body import extract
+
+HTML = (
+    "<html><head><title>Title</title><style>p {{color: red}}</style></head><body>"
+    "<script>var tracking = 1;</script><h1>Hello</h1><p>{text}</p>"
+    "<ul><li>first</li><li>second</li></ul><p>Read <a href='https://example.com/a'>more</a> &amp; reply</p>"
+    "</body></html>"
+)
+
+
+def part(
+    content_type: str, text: str, charset: str, cte: str, label: str = None
+) -> bytes:
+    """Encodes text as a MIME part, optionally labeled with a charset other than the one it is encoded with."""
+    payload = text.encode(charset)
+    if cte == "base64":
+        payload = base64.encodebytes(payload)
+    elif cte == "quoted-printable":
+        payload = quopri.encodestring(payload)
+    label = charset if label is None else label
+    parameter = f"; charset={label}" if label else ""
+    return f"Content-Type: {content_type}{parameter}\r\nContent-Transfer-Encoding: {cte}\r\n\r\n".encode() + payload.replace(
+        b"\r\n", b"\n"
+    ).replace(
+        b"\n", b"\r\n"
+    )
+
+
+def multipart(subtype: str, *parts: bytes) -> bytes:
+    """Joins parts into a multipart entity, with a boundary of its own so that it can be nested."""
+    boundary = b"==%s-%d==" % (subtype.encode(), len(parts[0]))
+    body = b"".join(b"--" + boundary + b"\r\n" + each + b"\r\n" for each in parts)
+    return (
+        b'Content-Type: multipart/%s; boundary="%s"\r\n\r\n'
+        % (subtype.encode(), boundary)
+        + body
+        + b"--"
+        + boundary
+        + b"--\r\n"
+    )
+
+
+def message(entity: bytes) -> Message:
+    """Wraps an entity with the headers of an email, and parses it."""
+    return email.message_from_bytes(
+        b"From: Sender <sender@example.com>\r\nSubject: Sample\r\nMIME-Version: 1.0\r\n"
+        + entity
+    )
+
+
+def corpus() -> List[Tuple[str, Message, str]]:
+    """Builds messages in different charsets and structures, with a phrase that the body must contain."""
+    attachment = (
+        b"Content-Type: application/pdf\r\nContent-Disposition: attachment; filename=a.pdf\r\n"
+        b"Content-Transfer-Encoding: base64\r\n\r\n" + base64.encodebytes(b"%PDF" * 100)
+    )
+    cases = [
+        (
+            "utf-8 plain",
+            "Grüße aus München, ça va ?",
+            lambda t: part("text/plain", t, "utf-8", "8bit"),
+        ),
+        (
+            "latin-1 quoted-printable",
+            "Café crème à Noël",
+            lambda t: part("text/plain", t, "iso-8859-1", "quoted-printable"),
+        ),
+        (
+            "cp1252 labeled latin-1",
+            "“Smart quotes” cost 5 €",
+            lambda t: part("text/plain", t, "cp1252", "quoted-printable", "iso-8859-1"),
+        ),
+        (
+            "utf-8 labeled us-ascii",
+            "naïve résumé",
+            lambda t: part("text/plain", t, "utf-8", "8bit", "us-ascii"),
+        ),
+        (
+            "koi8-r base64",
+            "Привет, как дела?",
+            lambda t: part("text/plain", t, "koi8-r", "base64"),
+        ),
+        (
+            "shift_jis base64",
+            "こんにちは世界",
+            lambda t: part("text/plain", t, "shift_jis", "base64"),
+        ),
+        (
+            "gb2312 base64",
+            "你好，世界",
+            lambda t: part("text/plain", t, "gb2312", "base64"),
+        ),
+        (
+            "euc-kr labeled ks_c",
+            "안녕하세요",
+            lambda t: part("text/plain", t, "euc-kr", "base64", "ks_c_5601-1987"),
+        ),
+        (
+            "iso-2022-jp 7bit",
+            "日本語のメール",
+            lambda t: part("text/plain", t, "iso-2022-jp", "7bit"),
+        ),
+        (
+            "alternative utf-8",
+            "Zürich und Genf",
+            lambda t: multipart(
+                "alternative",
+                part("text/plain", t, "utf-8", "quoted-printable"),
+                part("text/html", HTML.format(text=t), "utf-8", "quoted-printable"),
+            ),
+        ),
+        (
+            "html only base64",
+            "Ελληνικά κείμενα",
+            lambda t: part("text/html", HTML.format(text=t), "utf-8", "base64"),
+        ),
+        (
+            "html meta charset",
+            "Кириллица в HTML",
+            lambda t: part(
+                "text/html",
+                "<meta charset='windows-1251'>" + HTML.format(text=t),
+                "windows-1251",
+                "8bit",
+                "",
+            ),
+        ),
+        (
+            "mixed with attachment",
+            "Voilà le fichier",
+            lambda t: multipart(
+                "mixed",
+                multipart(
+                    "alternative",
+                    part("text/plain", t, "iso-8859-15", "quoted-printable"),
+                    part(
+                        "text/html",
+                        HTML.format(text=t),
+                        "iso-8859-15",
+                        "quoted-printable",
+                    ),
+                ),
+                attachment,
+            ),
+        ),
+    ]
+    return [(name, message(build(text)), text) for name, text, build in cases]
+
+
+def legacy(original_email: Message) -> str:
+    """Body extraction of ``get_info`` before the body module, kept for comparison."""
+    if original_email.get_content_type() == "text/plain":
+        return original_email.get_payload(decode=True).decode("utf-8")
+    body = ""
+    for payload in original_email.get_payload():
+        if isinstance(payload, Message):
+            if is_attachment(payload):
+                continue
+            body += payload.as_string()
+        elif isinstance(payload, str):
+            body += payload
+        elif isinstance(payload, bytes):
+            try:
+                body += base64.b64decode(payload)
+            except binascii.Error:
+                body += payload.decode()
+    return body
+
+
+def correct(body: str, expected: str) -> bool:
+    """Checks that the phrase came through, and that no markup or encoded content is left."""
+    return (
+        expected in body
+        and "<" not in body
+        and "=\n" not in body
+        and "tracking" not in body
+    )
+
+
+def measure(
+    name: str,
+    function: Callable[[Message], str],
+    samples: List[Tuple[str, Message, str]],
+) -> None:
+    """Extracts the bodies of all the messages, and prints the rate and the cases that came out wrong."""
+    wrong, cases = set(), {case for case, _, _ in samples}
+    start = time.perf_counter()
+    for case, each, expected in samples:
+        try:
+            body = function(each)
+        except (UnicodeDecodeError, TypeError):
+            body = ""
+        if not correct(body, expected):
+            wrong.add(case)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<10}{len(samples) / elapsed:12,.0f} messages/s    correct: {len(cases) - len(wrong)}/{len(cases)}"
+    )
+    for case in sorted(wrong):
+        print(f"{'':<10}wrong: {case}")
+
+
+def main(count: int = 2000) -> None:
+    """Runs both extractions over the corpus repeated to the number of messages."""
+    cases = corpus()
+    samples = [cases[index % len(cases)] for index in range(count)]
+    measure("legacy", legacy, samples)
+    measure("extract", extract, samples)
+    name, each, _ = cases[-1]
+    print(f"\n{name}:\n{extract(each)}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,35 @@
+"""Benchmark for loading the settings, with and without the memoized config layer.
+
+>>> python -m benchmarks.config 20000
+
+"""
+
+import sys
+import time
+from typing import Callable
+
+from gmailconnector.models.config import EgressConfig, egress_config
+
+KWARGS = dict(gmail_user="bench@gmail.com", gmail_pass="bench")
+
+
+def measure(name: str, count: int, load: Callable[[], EgressConfig]) -> None:
+    """Prints the time taken to load the settings once."""
+    load()  # warm up
+    start = time.perf_counter()
+    for _ in range(count):
+        load()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28}{elapsed / count * 1e6:>10.2f} us per object")
+
+
+def main(count: int = 20_000) -> None:
+    """Compares building the settings every time against the memoized and prebuilt settings."""
+    config = egress_config(**KWARGS)
+    measure("EgressConfig(**kwargs)", count // 10, lambda: EgressConfig(**KWARGS))
+    measure("egress_config(**kwargs)", count, lambda: egress_config(**KWARGS))
+    measure("egress_config(config)", count, lambda: egress_config(config))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
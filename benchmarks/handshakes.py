@@ -0,0 +1,121 @@
+"""Benchmark for IMAP connections over TLS, with a fresh context each time against the shared context of ``tls``
+
+>>> python -m benchmarks.handshakes 200
+
+"""
+
+import imaplib
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable
+
+from gmailconnector import metrics, tls
+
+from .servers import IMAPHandler, Link, Mailbox, _Server
+
+
+class TLSServer(_Server):
+    """IMAP server that wraps every connection in TLS, with a self-signed certificate for ``localhost``"""
+
+    def __init__(self, context: ssl.SSLContext):
+        """Binds to a free port on the loopback interface."""
+        super().__init__(IMAPHandler, Link(), Mailbox(), False)
+        self.context = context
+
+    def get_request(self):
+        """Runs the handshake on the accepted connection."""
+        sock, address = super().get_request()
+        # replies are written in pieces, which must not wait for a delayed ACK
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self.context.wrap_socket(sock, server_side=True), address
+
+
+def certificate(directory: str) -> str:
+    """Creates a self-signed certificate for ``localhost`` with ``openssl``, and returns the path to the PEM file."""
+    path = os.path.join(directory, "localhost.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+            "-addext",
+            "subjectAltName=DNS:localhost",
+            "-keyout",
+            path,
+            "-out",
+            path,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return path
+
+
+def measure(
+    name: str, count: int, port: int, context: Callable[[], ssl.SSLContext]
+) -> None:
+    """Connects, logs in and logs out for the number of times, and prints the time taken for each connection."""
+    metrics.reset()
+    start = time.perf_counter()
+    for _ in range(count):
+        mail = imaplib.IMAP4_SSL("localhost", port, ssl_context=context())
+        mail.login("bench@gmail.com", "bench")
+        mail.logout()
+    elapsed = time.perf_counter() - start
+    handshakes = {
+        dict(labels).get("resumed"): value
+        for (counter, labels), value in metrics.counters.items()
+        if counter == "tls_handshakes"
+    }
+    report = f"{name:<16}{elapsed / count * 1000:8.2f} ms per connection"
+    if handshakes:  # counted only by the shared context
+        report += f"    resumed: {handshakes.get(True, 0):g}    full: {handshakes.get(False, 0):g}"
+    print(report)
+
+
+def main(count: int = 200) -> None:
+    """Compares a fresh default context per connection, as before, against the shared context."""
+    start = time.perf_counter()
+    for _ in range(10):
+        ssl.create_default_context()
+    print(
+        f"{'system certs':<16}{(time.perf_counter() - start) * 100:8.2f} ms to load for every fresh context"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = certificate(directory)
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(path)
+        server = TLSServer(server_context)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        metrics.enable()
+        try:
+            measure(
+                "fresh context",
+                count,
+                port,
+                lambda: ssl.create_default_context(cafile=path),
+            )
+            tls.set_context(tls.create_context(cafile=path))
+            measure("shared context", count, port, tls.context)
+        finally:
+            tls.set_context(None)
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
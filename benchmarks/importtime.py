@@ -0,0 +1,101 @@
+"""Import time of gmailconnector for common entry points, measured with ``python -X importtime`` against a budget.
+
+>>> python -m benchmarks.importtime
+
+Exits with status 1 if any entry point is over its budget, or loads a module that it should not.
+"""
+
+import statistics
+import subprocess
+import sys
+from typing import Dict, Set, Tuple
+
+# entry point: (statement, budget in milliseconds, modules that must not be loaded)
+BUDGETS: Dict[str, Tuple[str, float, Tuple[str, ...]]] = {
+    "package": (
+        "import gmailconnector",
+        25,  # mostly typing, for TYPE_CHECKING, which every entry point below loads anyway
+        ("pydantic", "smtplib", "imaplib", "dns", "pytz", "idna"),
+    ),
+    "SendSMS": (
+        "from gmailconnector import SendSMS",
+        300,
+        ("imaplib", "dns", "pytz", "idna", "email_validator"),
+    ),
+    "SendEmail": (
+        "from gmailconnector import SendEmail",
+        320,
+        ("imaplib", "dns", "pytz", "idna", "email_validator"),
+    ),
+    "ReadEmail": (
+        "from gmailconnector import ReadEmail",
+        320,
+        ("dns", "pytz", "idna", "email_validator"),
+    ),
+    "validate_email": (
+        "from gmailconnector import validate_email",
+        100,
+        ("pydantic", "imaplib", "dns", "pytz", "idna"),
+    ),
+}
+
+
+def importtime(statement: str) -> Tuple[float, Set[str]]:
+    """Runs a statement in a fresh interpreter, and returns the time taken by the imports and the modules loaded.
+
+    See Also:
+        Modules loaded by the interpreter on startup are excluded, using a run with an empty statement.
+    """
+    startup = parse(run("pass"))
+    imports = parse(run(statement))
+    loaded = {name for name in imports if name not in startup}
+    # Only the outermost imports are counted, since their time includes the nested ones
+    total = sum(
+        cumulative
+        for name, (cumulative, nested) in imports.items()
+        if name in loaded and not nested
+    )
+    return total / 1e3, loaded
+
+
+def run(statement: str) -> str:
+    """Runs a statement with ``-X importtime`` and returns the report."""
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        check=True,
+        stderr=subprocess.PIPE,
+        text=True,
+    ).stderr
+
+
+def parse(report: str) -> Dict[str, Tuple[int, bool]]:
+    """Parses the cumulative time of each module in microseconds, and whether it was imported by another module."""
+    imports = {}
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        imports[name.strip()] = (int(cumulative), name.startswith("   "))
+    return imports
+
+
+def main(runs: int = 5) -> None:
+    """Prints the median import time of each entry point, and exits with an error if over budget."""
+    failed = False
+    for entry, (statement, budget, forbidden) in BUDGETS.items():
+        results = [importtime(statement) for _ in range(runs)]
+        median = statistics.median(elapsed for elapsed, _ in results)
+        loaded = {name.split(".")[0] for name in results[0][1]}
+        unexpected = sorted(loaded.intersection(forbidden))
+        status = "ok"
+        if median > budget:
+            status = "OVER BUDGET"
+        if unexpected:
+            status = f"LOADS {', '.join(unexpected)}"
+        failed = failed or status != "ok"
+        print(f"{entry:<16}{median:>9.1f} ms{budget:>9.0f} ms budget    {status}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,67 @@
+"""Benchmark for encoding and decoding emails and responses, to be passed across processes.
+
+>>> python -m benchmarks.roundtrip 1000
+
+"""
+
+import pickle
+import sys
+import time
+from datetime import datetime, timezone
+from email.header import Header
+from typing import Any, Callable
+
+from gmailconnector import Response
+from gmailconnector.models.codec import decode, encode
+from gmailconnector.models.responder import Email
+
+
+def sample_email(index: int) -> Email:
+    """Creates an email like the ones yielded by ``read_mail``"""
+    return Email(
+        dictionary=dict(
+            sender=f"Sender {index}",
+            sender_email=f"sender{index}@example.com",
+            subject=Header(f"Sample message {index}"),
+            date_time=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            body="Lorem ipsum dolor sit amet, consectetur adipiscing elit.\r\n" * 10,
+            message_id=f"<{index}@example.com>",
+            in_reply_to=f"<{index - 1}@example.com>" if index else None,
+            references=[
+                f"<{each}@example.com>" for each in range(max(0, index - 3), index)
+            ],
+            thread_id=index // 10,
+        )
+    )
+
+
+def measure(
+    name: str, value: Any, dumps: Callable, loads: Callable, seconds: float = 1.0
+) -> None:
+    """Runs round trips for about a second, and prints the rate and the encoded size."""
+    data = dumps(value)
+    count, start = 0, time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        loads(dumps(value))
+        count += 1
+    print(f"{name:<28}{count / elapsed:12,.0f} round trips/s{len(data):12,} bytes")
+
+
+def main(count: int = 1000) -> None:
+    """Compares the binary and JSON encodings against pickle, for one email, a list of emails and a response."""
+    emails = [sample_email(index) for index in range(count)]
+    response = Response(
+        dictionary={"ok": True, "status": 200, "body": [b"1 2 3"], "count": 3}
+    )
+    for name, value in (
+        ("email", emails[0]),
+        (f"{count} emails", emails),
+        ("response", response),
+    ):
+        measure(f"{name} binary", value, encode, decode)
+        measure(f"{name} json", value, lambda item: encode(item, binary=False), decode)
+        measure(f"{name} pickle", value, pickle.dumps, pickle.loads)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,105 @@
+"""Benchmark for serializing and sending messages with ``as_string`` against the bytes-native path.
+
+>>> python -m benchmarks.serialization 200
+
+"""
+
+import os
+import smtplib
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from .template import offline_sender
+
+
+class NullSMTP(smtplib.SMTP):
+    """SMTP client that runs ``sendmail`` end to end, but discards the data instead of writing to a socket."""
+
+    def __init__(self):
+        """Skips the connection and pretends that the server supports ESMTP."""
+        super().__init__()
+        self.does_esmtp = True
+        self.ehlo_resp = b"null"
+        self.esmtp_features = {"size": ""}
+        self.bytes_sent = 0
+        self._command = ""
+
+    def putcmd(self, cmd, args=""):
+        """Remembers the last command to reply accordingly."""
+        self._command = cmd.lower()
+        super().putcmd(cmd, args)
+
+    def send(self, s):
+        """Counts the bytes that would have been written to the socket."""
+        self.bytes_sent += len(s)
+
+    def getreply(self):
+        """Accepts every command."""
+        if self._command == "data":
+            self._command = ""
+            return 354, b"go ahead"
+        return 250, b"ok"
+
+
+def measure(name: str, count: int, size: int, send: Callable[[], None]) -> None:
+    """Prints the throughput, and the peak memory allocated while sending a message as a multiple of its size."""
+    send()  # warm up
+    start = time.perf_counter()
+    for _ in range(count):
+        send()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    send()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<14}{count / elapsed:>12,.0f} msgs/s"
+        f"{peak / 1e3:>14,.1f} KB peak{peak / size:>8.1f}x message size"
+    )
+
+
+def main(count: int = 200) -> None:
+    """Compares both the paths for a small email and an email with attachments."""
+    sender = offline_sender()
+    sender.server = NullSMTP()
+    files = []
+    for _ in range(4):
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as file:
+            file.write(os.urandom(1024 * 1024))
+        files.append(file.name)
+    try:
+        for label, attachments in (("small", []), ("4 x 1 MB attachments", files)):
+            msg = sender.multipart_message(
+                subject="Benchmark",
+                recipient="bench@example.com",
+                sender="Bench",
+                body="Hello,\n\nThis is a benchmark.\n",
+                html_body="<p>This is a benchmark.</p>",
+                attachments=attachments,
+                filenames=[],
+                cc=None,
+            )
+            with sender.serialize(msg=msg) as payload:
+                size = len(payload)
+            print(f"{label} email: {size:,} bytes on the wire")
+            runs = count if attachments else count * 50
+
+            def as_string():
+                sender.server.sendmail("bench", ["bench@example.com"], msg.as_string())
+
+            def as_bytes():
+                with sender.serialize(msg=msg) as data:
+                    sender.transmit("bench", ["bench@example.com"], data)
+
+            measure("as_string", runs, size, as_string)
+            measure("bytes-native", runs, size, as_bytes)
+    finally:
+        for file in files:
+            os.remove(file)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
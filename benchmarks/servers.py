@@ -0,0 +1,1069 @@
+"""In-process stand-ins for Gmail's SMTP and IMAP servers and a DNS server, with configurable latency and bandwidth.
+
+>>> with local(latency=0.005) as servers:
+...     servers.mailbox.append("INBOX", b"Subject: Hello\\r\\n\\r\\nWorld\\r\\n")
+...     gmailconnector.ReadEmail(gmail_user="bench@gmail.com", gmail_pass="bench").instantiate("ALL")
+
+"""
+
+import base64
+import collections
+import contextlib
+import datetime
+import email.utils
+import functools
+import hashlib
+import imaplib
+import io
+import os
+import re
+import smtplib
+import socketserver
+import threading
+import time
+from email.header import decode_header, make_header
+from email.message import Message
+from email.parser import BytesHeaderParser
+from typing import (
+    Deque,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+
+from gmailconnector.compression import DeflateReader, DeflateWriter
+from gmailconnector.uids import compress
+
+LOCALHOST = "127.0.0.1"
+SENT = "[Gmail]/Sent Mail"
+FOLDERS = ("INBOX", SENT, "[Gmail]/All Mail", "[Gmail]/Trash")
+LITERAL = re.compile(rb"\{(\d+)\}\r\n$")
+TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|\(|\)|[^\s()]+')
+FETCH_ITEM = re.compile(
+    rb"(BODY(?:\.PEEK)?)\[([A-Z0-9.]*)(?: \(([^)]*)\))?\](?:<(\d+)\.(\d+)>)?|[A-Z0-9.-]+",
+    re.IGNORECASE,
+)
+
+
+class Link:
+    """Latency and bandwidth of the simulated network link.
+
+    Args:
+        latency: Seconds to wait before each reply from the server.
+        bandwidth: Bytes per second in either direction, ``0`` for unlimited.
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth: int = 0):
+        """Stores the settings of the link."""
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+
+class Throttle:
+    """Delays a connection to match the bandwidth of the link, sleeping only once the delay adds up to a millisecond."""
+
+    def __init__(self, link: Link):
+        """Starts with no pending delay."""
+        self.link = link
+        self.debt = 0.0
+
+    def __call__(self, size: int) -> None:
+        """Accounts for the bytes transferred."""
+        if not self.link.bandwidth:
+            return
+        self.debt += size / self.link.bandwidth
+        if self.debt >= 0.001:
+            time.sleep(self.debt)
+            self.debt = 0.0
+
+
+class StoredMessage:
+    """Message stored in a folder of the mailbox."""
+
+    __slots__ = ("uid", "data", "flags", "date", "_headers", "_parts")
+
+    def __init__(self, uid: int, data: bytes, flags: Set[str], date: datetime.datetime):
+        """Stores the raw message along with its flags and internal date."""
+        self.uid = uid
+        self.data = data
+        self.flags = flags
+        self.date = date
+        self._headers = None
+        self._parts = None
+
+    @property
+    def headers(self) -> Message:
+        """Headers of the message, parsed only when searched."""
+        if self._headers is None:
+            self._headers = BytesHeaderParser().parsebytes(self.data)
+        return self._headers
+
+    @property
+    def header_bytes(self) -> bytes:
+        """Raw header section of the message, including the blank line."""
+        end = self.data.find(b"\r\n\r\n")
+        return self.data if end < 0 else self.data[: end + 4]
+
+    def header_fields(self, names: Iterable[bytes]) -> bytes:
+        """Header lines with the given names along with their continuation lines, and the blank line."""
+        names = {name.lower() for name in names}
+        lines, keep = [], False
+        for line in self.header_bytes.splitlines(keepends=True)[:-1]:
+            if not line[:1].isspace():
+                keep = line.partition(b":")[0].strip().lower() in names
+            if keep:
+                lines.append(line)
+        return b"".join(lines) + b"\r\n"
+
+    @property
+    def gmail_id(self) -> int:
+        """Stand-in for ``X-GM-MSGID``, which is the same for a message in every folder."""
+        return int.from_bytes(hashlib.sha1(self.data).digest()[:8], "big") >> 1
+
+    @property
+    def gmail_thread_id(self) -> int:
+        """Stand-in for ``X-GM-THRID``, taken from the first message of the thread that the headers point to."""
+        root = (
+            self.headers.get("References", "").split()[:1]
+            or self.headers.get("In-Reply-To", "").split()[:1]
+            or self.headers.get("Message-ID", "").split()[:1]
+        )
+        seed = root[0].encode() if root else self.data
+        return int.from_bytes(hashlib.sha1(seed).digest()[:8], "big") >> 1
+
+    @property
+    def text_bytes(self) -> bytes:
+        """Raw body of the message."""
+        end = self.data.find(b"\r\n\r\n")
+        return b"" if end < 0 else self.data[end + 4 :]
+
+    def _part(self, start: int, end: int) -> "MimePart":
+        """Splits a part of the message at its boundaries into the nested parts, by their offsets."""
+        split = self.data.find(b"\r\n\r\n", start, end)
+        body = end if split < 0 else split + 4
+        headers = BytesHeaderParser().parsebytes(self.data[start:body])
+        children, attached = [], None
+        if headers.get_content_type() == "message/rfc822":
+            attached = self._part(body, end)
+        elif headers.get_content_maintype() == "multipart":
+            delimiter = b"--" + headers.get_param("boundary", "").encode()
+            position = self.data.find(delimiter, body, end)
+            while 0 <= position:
+                child = self.data.find(b"\r\n", position, end) + 2
+                following = self.data.find(b"\r\n" + delimiter, child, end)
+                if (
+                    self.data.startswith(b"--", position + len(delimiter))
+                    or following < 0
+                ):
+                    break
+                children.append(self._part(child, following))
+                position = following + 2
+        return MimePart(headers, body, end, children, attached)
+
+    def section(self, section: bytes) -> Tuple[int, int]:
+        """Offsets of the body of a numbered section like ``2`` or ``1.2``"""
+        if self._parts is None:
+            self._parts = self._part(0, len(self.data))
+        part = self._parts
+        for index in section.split(b"."):
+            if part.children:
+                part = part.children[int(index) - 1]
+            elif index != b"1":
+                raise ValueError(f"Unknown section {section.decode()}")
+        return part.start, part.end
+
+    @property
+    def bodystructure(self) -> bytes:
+        """``BODYSTRUCTURE`` of the message, built from the offsets of its parts."""
+        if self._parts is None:
+            self._parts = self._part(0, len(self.data))
+        return self._parts.structure()
+
+
+def quote(value: Optional[str]) -> bytes:
+    """Quotes a string for an IMAP response, or returns ``NIL``"""
+    if value is None:
+        return b"NIL"
+    return b'"%s"' % value.replace("\\", "\\\\").replace('"', '\\"').encode()
+
+
+def parameters(values: Iterable[Tuple[str, str]]) -> bytes:
+    """Formats MIME parameters as a parenthesized list, or returns ``NIL``"""
+    pairs = b" ".join(quote(name) + b" " + quote(value) for name, value in values)
+    return b"(%s)" % pairs if pairs else b"NIL"
+
+
+class MimePart(NamedTuple):
+    """Headers of a MIME part, along with the offsets of its body, the nested parts and the attached email."""
+
+    headers: Message
+    start: int
+    end: int
+    children: list
+    attached: Optional["MimePart"] = None
+
+    def structure(self) -> bytes:
+        """Formats the part as a ``BODYSTRUCTURE``, with ``NIL`` for the envelope of attached emails."""
+        maintype, subtype = (
+            self.headers.get_content_maintype(),
+            self.headers.get_content_subtype(),
+        )
+        params = [(k, v) for k, v in self.headers.get_params([])[1:]]
+        if self.children:
+            return b"(%s %s %s NIL NIL NIL)" % (
+                b"".join(child.structure() for child in self.children),
+                quote(subtype.upper()),
+                parameters(params),
+            )
+        disposition = self.headers.get_content_disposition()
+        filename = self.headers.get_param("filename", None, "content-disposition")
+        disposition = (
+            b"(%s %s)"
+            % (
+                quote(disposition),
+                parameters([("filename", filename)] if filename else []),
+            )
+            if disposition
+            else b"NIL"
+        )
+        fields = b"%s %s %s NIL NIL %s %d" % (
+            quote(maintype.upper()),
+            quote(subtype.upper()),
+            parameters(params),
+            quote(self.headers.get("Content-Transfer-Encoding", "7BIT").upper()),
+            self.end - self.start,
+        )
+        if maintype == "text":
+            fields += b" %d" % 0
+        elif self.attached:
+            fields += b" NIL %s %d" % (self.attached.structure(), 0)
+        return b"(%s NIL %s NIL NIL)" % (fields, disposition)
+
+
+class MailFolder:
+    """Folder of the mailbox with its messages and UID counters."""
+
+    def __init__(self, name: str, uidvalidity: int = 1):
+        """Creates an empty folder."""
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.messages: List[StoredMessage] = []
+
+
+class Mailbox:
+    """Folders shared by the SMTP and IMAP servers, so that sent messages show up in the sent folder.
+
+    >>> Mailbox
+
+    """
+
+    def __init__(self, folders: Iterable[str] = FOLDERS):
+        """Creates the folders."""
+        self.lock = threading.RLock()
+        self.folders: Dict[str, MailFolder] = {
+            name.upper() if name.upper() == "INBOX" else name: MailFolder(name)
+            for name in folders
+        }
+
+    def folder(self, name: str) -> Optional[MailFolder]:
+        """Gets a folder by its name, where ``INBOX`` is case-insensitive."""
+        return self.folders.get(name.upper() if name.upper() == "INBOX" else name)
+
+    def append(
+        self,
+        folder: str,
+        data: bytes,
+        flags: Iterable[str] = (),
+        date: datetime.datetime = None,
+    ) -> int:
+        """Appends a raw message to a folder and returns its UID."""
+        data = data.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+        with self.lock:
+            target = self.folder(folder)
+            uid = target.uidnext
+            target.uidnext += 1
+            target.messages.append(
+                StoredMessage(
+                    uid=uid,
+                    data=data,
+                    flags=set(flags),
+                    date=date or datetime.datetime.now(),
+                )
+            )
+            return uid
+
+
+class Servers(NamedTuple):
+    """Addresses of the running servers and the mailbox they share."""
+
+    smtp: Tuple[str, int]
+    imap: Tuple[str, int]
+    dns: Tuple[str, int]
+    mailbox: Mailbox
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    """TCP server that handles each connection in a daemon thread."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    block_on_close = False
+
+    def __init__(
+        self,
+        handler,
+        link: Link,
+        mailbox: Mailbox,
+        store_sent: bool,
+        max_rate: int = 0,
+    ):
+        """Binds to a free port on the loopback interface."""
+        super().__init__((LOCALHOST, 0), handler)
+        self.link = link
+        self.mailbox = mailbox
+        self.store_sent = store_sent
+        self.max_rate = max_rate
+        self.accepted: Deque[float] = collections.deque()
+        self.accepted_lock = threading.Lock()
+
+    def over_rate(self) -> bool:
+        """Counts a message against ``max_rate``, and checks if more messages than that were sent in the last second."""
+        if not self.max_rate:
+            return False
+        now = time.monotonic()
+        with self.accepted_lock:
+            while self.accepted and self.accepted[0] <= now - 1:
+                self.accepted.popleft()
+            if len(self.accepted) >= self.max_rate:
+                return True
+            self.accepted.append(now)
+            return False
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Line based request handler that applies the latency and bandwidth of the link."""
+
+    server: _Server
+
+    def setup(self) -> None:
+        """Creates the throttle for the connection."""
+        super().setup()
+        self.throttle = Throttle(self.server.link)
+
+    def readline(self) -> bytes:
+        """Reads a line from the client."""
+        line = self.rfile.readline()
+        self.throttle(len(line))
+        return line
+
+    def read(self, size: int) -> bytes:
+        """Reads a number of bytes from the client."""
+        data = self.rfile.read(size)
+        self.throttle(len(data))
+        return data
+
+    def reply(self, *data: bytes) -> None:
+        """Waits for the latency of the link and writes the reply."""
+        if self.server.link.latency:
+            time.sleep(self.server.link.latency)
+        self.write(b"".join(data))
+
+    def write(self, payload: bytes) -> None:
+        """Writes to the client, at the bandwidth of the link."""
+        self.throttle(len(payload))
+        self.wfile.write(payload)
+
+    def compress(self) -> None:
+        """Switches the connection to DEFLATE in both directions, with the bandwidth applied to the compressed bytes."""
+        self.rfile = io.BufferedReader(DeflateReader(self.connection.recv))
+        self.write = DeflateWriter(self.throttled_send)
+
+    def throttled_send(self, payload: bytes) -> None:
+        """Sends compressed bytes, at the bandwidth of the link."""
+        self.throttle(len(payload))
+        self.connection.sendall(payload)
+
+
+class SMTPHandler(_Handler):
+    """Accepts every authentication, refuses recipients whose user starts with ``invalid`` and discards the data.
+
+    See Also:
+        - Messages are appended to the sent folder when the server is started with ``store_sent``
+        - Accounts whose user starts with ``throttled`` are refused with ``454`` on every ``MAIL`` command.
+        - Messages over the ``max_rate`` of the server are refused with ``451`` on the ``MAIL`` command.
+    """
+
+    def handle(self) -> None:
+        """Runs the SMTP conversation."""
+        self.reply(b"220 localhost ESMTP ready\r\n")
+        recipients, user = [], b""
+        while line := self.readline():
+            verb, _, argument = line.strip().partition(b" ")
+            verb = verb.upper()
+            if verb == b"EHLO":
+                self.reply(
+                    b"250-localhost\r\n250-SIZE 35882577\r\n250-8BITMIME\r\n"
+                    b"250-AUTH LOGIN PLAIN\r\n250 PIPELINING\r\n"
+                )
+            elif verb == b"HELO":
+                self.reply(b"250 localhost\r\n")
+            elif verb == b"AUTH":
+                mechanism, _, initial = argument.partition(b" ")
+                if mechanism.upper() == b"LOGIN":
+                    self.reply(b"334 VXNlcm5hbWU6\r\n")
+                    user = base64.b64decode(self.readline().strip())
+                    self.reply(b"334 UGFzc3dvcmQ6\r\n")
+                    self.readline()
+                else:
+                    if not initial:
+                        self.reply(b"334 \r\n")
+                        initial = self.readline().strip()
+                    user = base64.b64decode(initial).split(b"\0")[1]
+                self.reply(b"235 2.7.0 Accepted\r\n")
+            elif verb == b"MAIL":
+                recipients = []
+                if user.lower().startswith(b"throttled"):
+                    self.reply(b"454 4.7.0 Too many messages, try again later\r\n")
+                    continue
+                if self.server.over_rate():
+                    self.reply(b"451 4.3.0 Temporary rate limit, try again later\r\n")
+                    continue
+                self.reply(b"250 2.1.0 OK\r\n")
+            elif verb == b"RCPT":
+                address = argument.partition(b"<")[2].partition(b">")[0]
+                if address.lower().startswith(b"invalid"):
+                    self.reply(b"550 5.1.1 The email account does not exist\r\n")
+                else:
+                    recipients.append(address)
+                    self.reply(b"250 2.1.5 OK\r\n")
+            elif verb == b"DATA":
+                if not recipients:
+                    self.reply(b"503 5.5.1 RCPT first\r\n")
+                    continue
+                self.reply(b"354 Go ahead\r\n")
+                lines = []
+                while (line := self.readline()) not in (b".\r\n", b""):
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                if self.server.store_sent:
+                    self.server.mailbox.append(SENT, b"".join(lines), flags={"\\Seen"})
+                recipients = []
+                self.reply(b"250 2.0.0 OK queued\r\n")
+            elif verb in (b"RSET", b"NOOP"):
+                recipients = [] if verb == b"RSET" else recipients
+                self.reply(b"250 2.0.0 OK\r\n")
+            elif verb == b"QUIT":
+                self.reply(b"221 2.0.0 Bye\r\n")
+                return
+            else:
+                self.reply(b"502 5.5.1 Unrecognized command\r\n")
+
+
+def unquote(token: bytes) -> str:
+    """Removes the quotes around an IMAP string."""
+    if token.startswith(b'"') and token.endswith(b'"'):
+        token = re.sub(rb"\\(.)", rb"\1", token[1:-1])
+    return token.decode()
+
+
+@functools.lru_cache(maxsize=64)
+def sequence_set(text: bytes, maximum: int) -> FrozenSet[int]:
+    """Expands an IMAP sequence set like ``1,4:6,10:*`` into numbers, once for all the messages a search checks."""
+    numbers = set()
+    for item in text.split(b","):
+        start, _, end = item.partition(b":")
+        start = maximum if start == b"*" else int(start)
+        end = start if not end else maximum if end == b"*" else int(end)
+        numbers.update(range(min(start, end), max(start, end) + 1))
+    return frozenset(numbers)
+
+
+class IMAPHandler(_Handler):
+    """Serves the folders of the mailbox with the subset of IMAP4rev1 that is used by gmailconnector.
+
+    See Also:
+        Supports ``CAPABILITY``, ``COMPRESS``, ``LOGIN``, ``LIST``, ``STATUS``, ``SELECT``, ``EXAMINE``, ``SEARCH``, ``FETCH``,
+        ``STORE``, ``COPY``, ``MOVE``, ``EXPUNGE``, ``CLOSE``, ``NOOP`` and ``LOGOUT`` along with their ``UID`` variants.
+    """
+
+    capabilities = b"IMAP4rev1 UIDPLUS MOVE X-GM-EXT-1 COMPRESS=DEFLATE AUTH=PLAIN"
+
+    def handle(self) -> None:
+        """Runs the IMAP conversation."""
+        self.selected: Optional[MailFolder] = None
+        self.reply(b"* OK [CAPABILITY %s] localhost IMAP ready\r\n" % self.capabilities)
+        while line := self.command():
+            tag, _, command = line.rstrip(b"\r\n").partition(b" ")
+            verb, _, arguments = command.partition(b" ")
+            verb = verb.upper()
+            uid = verb == b"UID"
+            if uid:
+                verb, _, arguments = arguments.partition(b" ")
+                verb = verb.upper()
+            method = getattr(self, "do_" + verb.decode(errors="replace"), None)
+            if method is None:
+                self.reply(b"%s BAD Unknown command\r\n" % tag)
+                continue
+            with self.server.mailbox.lock:
+                try:
+                    untagged, status = method(arguments, uid)
+                except (ValueError, IndexError, KeyError) as error:
+                    untagged, status = [], b"BAD %s" % str(error).encode()
+            self.reply(*untagged, b"%s %s\r\n" % (tag, status))
+            if verb == b"LOGOUT":
+                return
+            if verb == b"COMPRESS" and status.startswith(b"OK"):
+                self.compress()
+
+    def command(self) -> bytes:
+        """Reads a command, with its literals turned into quoted strings so that it can be tokenized like the rest."""
+        line = self.readline()
+        while match := LITERAL.search(line):
+            self.reply(b"+ Ready for literal data\r\n")
+            literal = self.read(int(match.group(1)))
+            quoted = b'"%s"' % re.sub(rb'(["\\])', rb"\\\1", literal)
+            line = line[: match.start()] + quoted + self.readline()
+        return line
+
+    def do_CAPABILITY(self, arguments: bytes, uid: bool):
+        """Lists the capabilities of the server."""
+        return [b"* CAPABILITY %s\r\n" % self.capabilities], b"OK CAPABILITY completed"
+
+    def do_LOGIN(self, arguments: bytes, uid: bool):
+        """Accepts every login."""
+        return [], b"OK LOGIN completed"
+
+    def do_COMPRESS(self, arguments: bytes, uid: bool):
+        """Accepts ``DEFLATE``, which takes effect after the reply."""
+        if arguments.strip().upper() != b"DEFLATE":
+            return [], b"BAD Unsupported compression mechanism"
+        return [], b"OK DEFLATE active"
+
+    def do_NOOP(self, arguments: bytes, uid: bool):
+        """Does nothing."""
+        return [], b"OK NOOP completed"
+
+    def do_LOGOUT(self, arguments: bytes, uid: bool):
+        """Ends the session."""
+        return [b"* BYE Logging out\r\n"], b"OK LOGOUT completed"
+
+    def do_LIST(self, arguments: bytes, uid: bool):
+        """Lists all the folders."""
+        return [
+            b'* LIST (\\HasNoChildren) "/" "%s"\r\n' % name.encode()
+            for name in self.server.mailbox.folders
+        ], b"OK LIST completed"
+
+    def do_STATUS(self, arguments: bytes, uid: bool):
+        """Reports the number of messages and the UID counters of a folder."""
+        tokens = TOKEN.findall(arguments)
+        folder = self.server.mailbox.folder(unquote(tokens[0]))
+        if folder is None:
+            return [], b"NO Folder not found"
+        values = dict(
+            MESSAGES=len(folder.messages),
+            UIDNEXT=folder.uidnext,
+            UIDVALIDITY=folder.uidvalidity,
+            UNSEEN=sum("\\Seen" not in m.flags for m in folder.messages),
+        )
+        items = b" ".join(
+            b"%s %d" % (token.upper(), values[token.upper().decode()])
+            for token in tokens[2:-1]
+        )
+        return [
+            b'* STATUS "%s" (%s)\r\n' % (folder.name.encode(), items)
+        ], b"OK STATUS completed"
+
+    def do_SELECT(self, arguments: bytes, uid: bool):
+        """Selects a folder."""
+        self.selected = self.server.mailbox.folder(unquote(arguments.strip()))
+        if self.selected is None:
+            return [], b"NO Folder not found"
+        return [
+            b"* FLAGS (\\Answered \\Flagged \\Draft \\Deleted \\Seen)\r\n",
+            b"* %d EXISTS\r\n" % len(self.selected.messages),
+            b"* 0 RECENT\r\n",
+            b"* OK [UIDVALIDITY %d] UIDs valid\r\n" % self.selected.uidvalidity,
+            b"* OK [UIDNEXT %d] Predicted next UID\r\n" % self.selected.uidnext,
+        ], b"OK [READ-WRITE] SELECT completed"
+
+    do_EXAMINE = do_SELECT
+
+    def do_CLOSE(self, arguments: bytes, uid: bool):
+        """Removes the deleted messages silently and deselects the folder."""
+        if self.selected:
+            self.expunge()
+        self.selected = None
+        return [], b"OK CLOSE completed"
+
+    def do_EXPUNGE(self, arguments: bytes, uid: bool):
+        """Removes the messages flagged as deleted, or only the given UIDs for ``UID EXPUNGE``"""
+        uids = (
+            sequence_set(arguments.strip(), self.selected.uidnext)
+            if uid and arguments
+            else None
+        )
+        return [
+            b"* %d EXPUNGE\r\n" % number for number in self.expunge(uids)
+        ], b"OK EXPUNGE completed"
+
+    def expunge(self, uids: Set[int] = None) -> List[int]:
+        """Removes the deleted messages and returns their sequence numbers as reported one after another."""
+        removed, kept = [], []
+        for number, message in enumerate(self.selected.messages, start=1):
+            if "\\Deleted" in message.flags and (uids is None or message.uid in uids):
+                removed.append(number - len(removed))
+            else:
+                kept.append(message)
+        self.selected.messages[:] = kept
+        return removed
+
+    def messages(self, text: bytes, uid: bool) -> Iterator[Tuple[int, StoredMessage]]:
+        """Yields the messages in a sequence set, along with their sequence numbers."""
+        messages = self.selected.messages
+        if uid:
+            wanted = sequence_set(text, messages[-1].uid if messages else 0)
+            for number, message in enumerate(messages, start=1):
+                if message.uid in wanted:
+                    yield number, message
+        else:
+            for number in sorted(sequence_set(text, len(messages))):
+                if 0 < number <= len(messages):
+                    yield number, messages[number - 1]
+
+    def do_SEARCH(self, arguments: bytes, uid: bool):
+        """Searches the selected folder, with the criteria that gmailconnector uses."""
+        tokens = TOKEN.findall(arguments)
+        if tokens[:1] == [b"CHARSET"]:
+            tokens = tokens[2:]
+        found = []
+        for number, message in enumerate(self.selected.messages, start=1):
+            if self.matches(message, number, list(tokens)):
+                found.append(message.uid if uid else number)
+        return [
+            b"* SEARCH%s\r\n" % b"".join(b" %d" % value for value in found)
+        ], b"OK SEARCH completed"
+
+    def matches(self, message: StoredMessage, number: int, tokens: List[bytes]) -> bool:
+        """Checks if a message satisfies all the search keys."""
+        while tokens:
+            if not self.criterion(message, number, tokens):
+                return False
+        return True
+
+    def criterion(
+        self, message: StoredMessage, number: int, tokens: List[bytes]
+    ) -> bool:
+        """Consumes and evaluates one search key."""
+        key = tokens.pop(0).upper()
+        if key == b"(":
+            result = True
+            while tokens[0] != b")":
+                result = self.criterion(message, number, tokens) and result
+            tokens.pop(0)
+            return result
+        if key == b"NOT":
+            return not self.criterion(message, number, tokens)
+        if key == b"OR":
+            first = self.criterion(message, number, tokens)
+            return self.criterion(message, number, tokens) or first
+        if key == b"ALL":
+            return True
+        flags = {
+            b"SEEN": "\\Seen",
+            b"DELETED": "\\Deleted",
+            b"FLAGGED": "\\Flagged",
+            b"ANSWERED": "\\Answered",
+        }
+        if key in flags:
+            return flags[key] in message.flags
+        if key.startswith(b"UN") and key[2:] in flags:
+            return flags[key[2:]] not in message.flags
+        if key in (b"SUBJECT", b"FROM", b"TO", b"CC", b"BCC"):
+            value = unquote(tokens.pop(0)).lower()
+            header = message.headers.get(key.decode(), "")
+            return value in str(make_header(decode_header(header))).lower()
+        if key in (b"TEXT", b"BODY"):
+            value = unquote(tokens.pop(0)).lower().encode()
+            content = message.data if key == b"TEXT" else message.text_bytes
+            return value in content.lower()
+        if key in (b"SINCE", b"BEFORE", b"ON"):
+            day = datetime.datetime.strptime(unquote(tokens.pop(0)), "%d-%b-%Y").date()
+            date = message.date.date()
+            return {b"SINCE": date >= day, b"BEFORE": date < day, b"ON": date == day}[
+                key
+            ]
+        if key in (b"SMALLER", b"LARGER"):
+            size = int(unquote(tokens.pop(0)))
+            return (
+                len(message.data) < size
+                if key == b"SMALLER"
+                else len(message.data) > size
+            )
+        if key == b"UID":
+            return message.uid in sequence_set(tokens.pop(0), self.selected.uidnext)
+        if key[:1].isdigit() or key[:1] == b"*":
+            return number in sequence_set(key, len(self.selected.messages))
+        raise ValueError(f"Unsupported search key {key.decode()}")
+
+    def do_FETCH(self, arguments: bytes, uid: bool):
+        """Fetches the requested items, with literals for the content of the messages."""
+        text, _, items = arguments.partition(b" ")
+        requested = FETCH_ITEM.finditer(items.strip().strip(b"()"))
+        requested = [match for match in requested]
+        untagged = []
+        for number, message in self.messages(text, uid):
+            untagged.append(
+                b"* %d FETCH (%s)\r\n" % (number, self.fetch(message, requested, uid))
+            )
+        return untagged, b"OK FETCH completed"
+
+    def fetch(self, message: StoredMessage, requested: list, uid: bool) -> bytes:
+        """Builds the items of a ``FETCH`` response, with the literals at the end."""
+        atoms = [b"UID %d" % message.uid] if uid else []
+        literals = []
+        for match in requested:
+            item = match.group(0).upper()
+            if match.group(1):
+                section = match.group(2).upper()
+                if section == b"HEADER.FIELDS":
+                    fields = match.group(3).upper()
+                    content = message.header_fields(fields.split())
+                    section += b" (%s)" % fields
+                elif section[:1].isdigit():
+                    # sliced from the message by offsets, so that a range never copies the whole part
+                    first, last = message.section(section)
+                    if match.group(4):
+                        first = min(last, first + int(match.group(4)))
+                        last = min(last, first + int(match.group(5)))
+                    content = message.data[first:last]
+                else:
+                    content = {
+                        b"": message.data,
+                        b"HEADER": message.header_bytes,
+                        b"TEXT": message.text_bytes,
+                    }[section]
+                name = b"BODY[%s]" % section
+                if match.group(4):
+                    start = int(match.group(4))
+                    if not section[:1].isdigit():
+                        content = content[start : start + int(match.group(5))]
+                    name += b"<%d>" % start
+                if b"PEEK" not in match.group(1).upper():
+                    message.flags.add("\\Seen")
+                literals.append((name, content))
+            elif item == b"UID" and not uid:
+                atoms.append(b"UID %d" % message.uid)
+            elif item == b"FLAGS":
+                atoms.append(b"FLAGS (%s)" % " ".join(sorted(message.flags)).encode())
+            elif item == b"BODYSTRUCTURE":
+                atoms.append(b"BODYSTRUCTURE %s" % message.bodystructure)
+            elif item == b"X-GM-THRID":
+                atoms.append(b"X-GM-THRID %d" % message.gmail_thread_id)
+            elif item == b"X-GM-MSGID":
+                atoms.append(b"X-GM-MSGID %d" % message.gmail_id)
+            elif item == b"RFC822.SIZE":
+                atoms.append(b"RFC822.SIZE %d" % len(message.data))
+            elif item == b"INTERNALDATE":
+                atoms.append(
+                    b'INTERNALDATE "%s"'
+                    % message.date.strftime("%d-%b-%Y %H:%M:%S +0000").encode()
+                )
+            elif item == b"RFC822":
+                message.flags.add("\\Seen")
+                literals.append((b"RFC822", message.data))
+            elif item == b"RFC822.HEADER":
+                literals.append((b"RFC822.HEADER", message.header_bytes))
+            elif item == b"RFC822.TEXT":
+                literals.append((b"RFC822.TEXT", message.text_bytes))
+        parts = b" ".join(atoms)
+        for name, content in literals:
+            parts += b"%s%s {%d}\r\n%s" % (
+                b" " if parts else b"",
+                name,
+                len(content),
+                content,
+            )
+        return parts
+
+    def do_STORE(self, arguments: bytes, uid: bool):
+        """Adds, removes or replaces the flags of the messages."""
+        text, _, rest = arguments.partition(b" ")
+        action, _, flags = rest.partition(b" ")
+        action = action.upper()
+        flags = {
+            unquote(flag) for flag in TOKEN.findall(flags) if flag not in (b"(", b")")
+        }
+        untagged = []
+        for number, message in self.messages(text, uid):
+            if action.startswith(b"+"):
+                message.flags |= flags
+            elif action.startswith(b"-"):
+                message.flags -= flags
+            else:
+                message.flags = set(flags)
+            if not action.endswith(b".SILENT"):
+                untagged.append(
+                    b"* %d FETCH (%sFLAGS (%s))\r\n"
+                    % (
+                        number,
+                        b"UID %d " % message.uid if uid else b"",
+                        " ".join(sorted(message.flags)).encode(),
+                    )
+                )
+        return untagged, b"OK STORE completed"
+
+    def do_COPY(self, arguments: bytes, uid: bool):
+        """Appends copies of the messages to another folder, and reports their new UIDs."""
+        text, _, name = arguments.partition(b" ")
+        target = self.server.mailbox.folder(unquote(name.strip()))
+        if target is None:
+            return [], b"NO [TRYCREATE] Folder not found"
+        source, copied = [], []
+        for _, message in self.messages(text, uid):
+            source.append(message.uid)
+            copied.append(
+                self.server.mailbox.append(
+                    target.name,
+                    message.data,
+                    flags=message.flags - {"\\Deleted"},
+                    date=message.date,
+                )
+            )
+        if not source:
+            return [], b"OK COPY completed"
+        return [], b"OK [COPYUID %d %s %s] COPY completed" % (
+            target.uidvalidity,
+            compress(source).encode(),
+            compress(copied).encode(),
+        )
+
+    def do_MOVE(self, arguments: bytes, uid: bool):
+        """Copies the messages to another folder, and expunges them from the selected folder."""
+        text = arguments.partition(b" ")[0]
+        untagged, status = self.do_COPY(arguments, uid)
+        if not status.startswith(b"OK"):
+            return untagged, status
+        moved = {message.uid for _, message in self.messages(text, uid)}
+        removed, kept = [], []
+        for number, message in enumerate(self.selected.messages, start=1):
+            if message.uid in moved:
+                removed.append(number - len(removed))
+            else:
+                kept.append(message)
+        self.selected.messages[:] = kept
+        return [
+            b"* OK [COPYUID %s]\r\n" % status.split(b"[COPYUID ")[1].split(b"]")[0],
+            *(b"* %d EXPUNGE\r\n" % number for number in removed),
+        ], b"OK MOVE completed"
+
+
+class DNSHandler(socketserver.BaseRequestHandler):
+    """Answers every ``MX`` query with ``localhost`` and every ``A`` query with the loopback address.
+
+    See Also:
+        Domains ending with ``.invalid`` do not exist, as reserved by RFC 2606.
+    """
+
+    def handle(self) -> None:
+        """Answers a query."""
+        data, sock = self.request
+        query = dns.message.from_wire(data)
+        response = dns.message.make_response(query)
+        question = query.question[0]
+        if question.name.to_text(omit_final_dot=True).endswith(".invalid"):
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        elif question.rdtype == dns.rdatatype.MX:
+            response.answer.append(
+                dns.rrset.from_text(question.name, 300, "IN", "MX", "10 localhost.")
+            )
+        elif question.rdtype == dns.rdatatype.A:
+            response.answer.append(
+                dns.rrset.from_text(question.name, 300, "IN", "A", LOCALHOST)
+            )
+        if self.server.link.latency:
+            time.sleep(self.server.link.latency)
+        sock.sendto(response.to_wire(), self.client_address)
+
+
+class _DNSServer(socketserver.ThreadingUDPServer):
+    """UDP server for the DNS handler."""
+
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, link: Link):
+        """Binds to a free port on the loopback interface."""
+        super().__init__((LOCALHOST, 0), DNSHandler)
+        self.link = link
+
+
+def local_smtp(address: Tuple[str, int]) -> type:
+    """Creates an SMTP client class that connects to the local server, whatever the host and port."""
+
+    class LocalSMTP(smtplib.SMTP):
+        """Plain SMTP client, that stands in for both ``SMTP`` and ``SMTP_SSL``"""
+
+        def __init__(
+            self, host: str = "", port: int = 0, *args, context=None, **kwargs
+        ):
+            """Ignores the SSL context."""
+            super().__init__(host, port, *args, **kwargs)
+
+        def connect(self, host: str = "localhost", port: int = 0, source_address=None):
+            """Connects to the local server."""
+            return super().connect(*address, source_address=source_address)
+
+        def starttls(self, *args, **kwargs):
+            """Skips TLS, since the local server is plain text."""
+            self.ehlo_or_helo_if_needed()
+            return 220, b"2.0.0 Ready to start TLS"
+
+    return LocalSMTP
+
+
+def local_imap(address: Tuple[str, int]) -> type:
+    """Creates an IMAP client class that connects to the local server, whatever the host and port."""
+
+    class LocalIMAP(imaplib.IMAP4):
+        """Plain IMAP client, that stands in for ``IMAP4_SSL``"""
+
+        def __init__(
+            self,
+            host: str = "",
+            port: int = 993,
+            *args,
+            timeout: float = None,
+            **kwargs,
+        ):
+            """Connects to the local server, ignoring the SSL arguments."""
+            super().__init__(*address, timeout=timeout)
+
+    return LocalIMAP
+
+
+@contextlib.contextmanager
+def local(
+    latency: float = 0.0,
+    bandwidth: int = 0,
+    mailbox: Mailbox = None,
+    store_sent: bool = False,
+    max_rate: int = 0,
+) -> Iterator[Servers]:
+    """Starts the local servers, and points ``smtplib``, ``imaplib`` and ``dnspython`` at them until exit.
+
+    Args:
+        latency: Seconds to wait before each reply from the servers.
+        bandwidth: Bytes per second in either direction, ``0`` for unlimited.
+        mailbox: Folders to be served. Defaults to empty folders.
+        store_sent: Appends the messages received over SMTP to the sent folder.
+        max_rate: Messages per second accepted over SMTP, the rest are refused with ``451``, ``0`` for unlimited.
+
+    Yields:
+        Servers:
+        Addresses of the servers and the mailbox they share.
+    """
+    link = Link(latency=latency, bandwidth=bandwidth)
+    mailbox = mailbox or Mailbox()
+    smtp = _Server(SMTPHandler, link, mailbox, store_sent, max_rate)
+    imap = _Server(IMAPHandler, link, mailbox, store_sent)
+    resolver = _DNSServer(link)
+    for server in (smtp, imap, resolver):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    originals = (
+        smtplib.SMTP,
+        smtplib.SMTP_SSL,
+        imaplib.IMAP4_SSL,
+        dns.resolver.default_resolver,
+    )
+    smtplib.SMTP = smtplib.SMTP_SSL = local_smtp(smtp.server_address)
+    imaplib.IMAP4_SSL = local_imap(imap.server_address)
+    dns.resolver.default_resolver = dns.resolver.Resolver(configure=False)
+    dns.resolver.default_resolver.nameservers = [LOCALHOST]
+    dns.resolver.default_resolver.port = resolver.server_address[1]
+    try:
+        yield Servers(
+            smtp=smtp.server_address,
+            imap=imap.server_address,
+            dns=resolver.server_address,
+            mailbox=mailbox,
+        )
+    finally:
+        (
+            smtplib.SMTP,
+            smtplib.SMTP_SSL,
+            imaplib.IMAP4_SSL,
+            dns.resolver.default_resolver,
+        ) = originals
+        for server in (smtp, imap, resolver):
+            server.shutdown()
+            server.server_close()
+
+
+def sample_message(index: int, size: int = 2_000, attachment: int = 0) -> bytes:
+    """Creates a plain text message of roughly the given size, for filling up folders.
+
+    Args:
+        index: Number of the message, used in the headers.
+        size: Size of the text in bytes.
+        attachment: Size of a random binary attachment in bytes, ``0`` for a message without one.
+    """
+    headers = (
+        b"From: Sender %d <sender%d@example.com>\r\n"
+        b"To: bench@gmail.com\r\n"
+        b"Subject: Sample message %d\r\n"
+        b"Date: %s\r\n"
+        b"Message-ID: <%d@example.com>\r\n"
+        % (index, index, index, email.utils.formatdate().encode(), index)
+    )
+    text = b"Lorem ipsum dolor sit amet, consectetur adipiscing elit.\r\n" * (
+        size // 58
+    )
+    if not attachment:
+        return headers + b'Content-Type: text/plain; charset="us-ascii"\r\n\r\n' + text
+    boundary = b"sample-%d" % index
+    return (
+        headers
+        + b'MIME-Version: 1.0\r\nContent-Type: multipart/mixed; boundary="%s"\r\n\r\n'
+        % boundary
+        + b'--%s\r\nContent-Type: text/plain; charset="us-ascii"\r\n\r\n%s\r\n'
+        % (boundary, text)
+        + b"--%s\r\nContent-Type: application/octet-stream\r\n"
+        b'Content-Disposition: attachment; filename="sample-%d.bin"\r\n'
+        b"Content-Transfer-Encoding: base64\r\n\r\n" % (boundary, index)
+        + base64.encodebytes(os.urandom(attachment)).replace(b"\n", b"\r\n")
+        + b"--%s--\r\n" % boundary
+    )
+
+
+def forwarded_message(index: int) -> bytes:
+    """Creates a message that forwards a sample message with an attachment, as an attached email.
+
+    Args:
+        index: Number of the message, used in the headers.
+    """
+    boundary = b"forward-%d" % index
+    return (
+        b"From: Forwarder <forwarder@example.com>\r\n"
+        b"To: bench@gmail.com\r\n"
+        b"Subject: Fwd: Sample message %d\r\n"
+        b'MIME-Version: 1.0\r\nContent-Type: multipart/mixed; boundary="%s"\r\n\r\n'
+        % (index, boundary)
+        + b'--%s\r\nContent-Type: text/plain; charset="us-ascii"\r\n\r\nSee below.\r\n'
+        % boundary
+        + b"--%s\r\nContent-Type: message/rfc822\r\n\r\n" % boundary
+        + sample_message(index, size=200, attachment=1024)
+        + b"\r\n--%s--\r\n" % boundary
+    )
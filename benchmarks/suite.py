@@ -0,0 +1,564 @@
+"""Benchmark suite that runs the public API against the local stand-in servers, and reports the results as JSON.
+
+>>> python -m benchmarks.suite --latency 0.002 --output report.json
+>>> python -m benchmarks.suite single_send read_messages --scale 0.1 --compare report.json
+
+"""
+
+import argparse
+import datetime
+import email
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from gmailconnector import (
+    ConversationIndex,
+    Folder,
+    FolderScanner,
+    ReadEmail,
+    SendEmail,
+    SendSMS,
+    ShardedSender,
+    validate_email,
+)
+from gmailconnector.attachments import find, from_structure, parse_response
+from gmailconnector.models.responder import Email
+
+from .servers import (
+    SENT,
+    Mailbox,
+    Servers,
+    forwarded_message,
+    local,
+    sample_message,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CREDENTIALS = dict(gmail_user="bench@gmail.com", gmail_pass="bench")
+
+
+def check(response) -> None:
+    """Stops the benchmark if an operation failed, since failures are faster than successes."""
+    if not response.ok:
+        raise RuntimeError(f"{response.status}: {response.body}")
+
+
+def timed(operation: Callable[[], None], samples: List[float]) -> None:
+    """Runs an operation and records its latency."""
+    start = time.perf_counter()
+    operation()
+    samples.append(time.perf_counter() - start)
+
+
+def single_send(servers: Servers, count: int) -> List[float]:
+    """Sends plain emails one after another over the same session."""
+    sender = SendEmail(**CREDENTIALS)
+    check(sender.authenticate)
+    samples = []
+    for index in range(count):
+        timed(
+            lambda: check(
+                sender.send_email(
+                    recipient="someone@example.com",
+                    subject=f"Benchmark {index}",
+                    body="Hello,\n\nThis is a benchmark.\n",
+                )
+            ),
+            samples,
+        )
+    return samples
+
+
+def bulk_send(servers: Servers, count: int) -> List[float]:
+    """Sends the same SMS to phone numbers in calls of 100 numbers, with latency measured per call."""
+    sender = SendSMS(**CREDENTIALS)
+    check(sender.authenticate)
+    phones = [str(5550000000 + index) for index in range(count)]
+    samples = []
+    for start in range(0, count, 100):
+        timed(
+            lambda: check(
+                sender.send_bulk(
+                    message="Benchmark", phones=phones[start : start + 100]
+                )
+            ),
+            samples,
+        )
+    return samples
+
+
+def attachment_send(servers: Servers, count: int) -> List[float]:
+    """Sends emails with a 1 MB attachment."""
+    sender = SendEmail(**CREDENTIALS)
+    check(sender.authenticate)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as file:
+        file.write(os.urandom(1024 * 1024))
+    samples = []
+    try:
+        for index in range(count):
+            timed(
+                lambda: check(
+                    sender.send_email(
+                        recipient="someone@example.com",
+                        subject=f"Benchmark {index}",
+                        attachment=file.name,
+                    )
+                ),
+                samples,
+            )
+    finally:
+        os.remove(file.name)
+    return samples
+
+
+def read_messages(servers: Servers, count: int, compress: bool = False) -> List[float]:
+    """Searches and reads all the messages in the inbox, with latency measured per message."""
+    for index in range(count):
+        servers.mailbox.append("INBOX", sample_message(index))
+    reader = ReadEmail(folder=Folder.inbox, compress=compress, **CREDENTIALS)
+    response = reader.instantiate(filters="ALL")
+    check(response)
+    samples = []
+    messages = reader.read_mail(messages=response.body)
+    start = time.perf_counter()
+    for _ in messages:
+        end = time.perf_counter()
+        samples.append(end - start)
+        start = end
+    if len(samples) != count:
+        raise RuntimeError(f"Read {len(samples)} of {count} messages")
+    return samples
+
+
+def same_attachments(servers: Servers) -> None:
+    """Stops the benchmark if the attachments listed from a parsed email and from its ``BODYSTRUCTURE`` differ."""
+    servers.mailbox.append("INBOX", forwarded_message(0))
+    stored = servers.mailbox.folder("INBOX").messages.pop()
+    response = parse_response([b"1 (BODYSTRUCTURE " + stored.bodystructure + b")"])
+    parsed, listed = (
+        [
+            (attachment.section, attachment.filename, attachment.content_type)
+            for attachment in attachments
+        ]
+        for attachments in (
+            find(email.message_from_bytes(stored.data)),
+            from_structure(response[1][1]),
+        )
+    )
+    if parsed != listed:
+        raise RuntimeError(f"Parsed {parsed}, but the BODYSTRUCTURE lists {listed}")
+
+
+def save_attachments(servers: Servers, count: int) -> List[float]:
+    """Saves a 1 MB attachment from each message, with latency measured per message."""
+    same_attachments(servers)
+    for index in range(count):
+        servers.mailbox.append("INBOX", sample_message(index, attachment=1024 * 1024))
+    reader = ReadEmail(folder=Folder.inbox, **CREDENTIALS)
+    response = reader.instantiate(filters="ALL")
+    check(response)
+    samples = []
+    with tempfile.TemporaryDirectory() as directory:
+        for uid in response.body[0].split():
+            timed(
+                lambda: check(reader.save_attachments([uid], directory=directory)),
+                samples,
+            )
+    reader.close()
+    return samples
+
+
+def read_compressed(servers: Servers, count: int) -> List[float]:
+    """Same as ``read_messages`` over a connection compressed with ``COMPRESS=DEFLATE``, run with ``--bandwidth``"""
+    return read_messages(servers, count, compress=True)
+
+
+def read_headers(servers: Servers, count: int) -> List[float]:
+    """Reads the messages in the inbox without parsing them, and routes on a few header fields."""
+    for index in range(count):
+        servers.mailbox.append("INBOX", sample_message(index))
+    reader = ReadEmail(folder=Folder.inbox, **CREDENTIALS)
+    response = reader.instantiate(filters="ALL")
+    check(response)
+    samples, routed = [], 0
+    start = time.perf_counter()
+    for message in reader.read_raw(messages=response.body):
+        routed += message.get("From", "").startswith("Sender") and "Subject" in message
+        end = time.perf_counter()
+        samples.append(end - start)
+        start = end
+    reader.close()
+    if routed != count:
+        raise RuntimeError(f"Routed {routed} of {count} messages")
+    return samples
+
+
+def resume_cursor(servers: Servers, count: int) -> List[float]:
+    """Reads the inbox with a cursor that is dropped at 30% without logging out, then resumed on a new connection."""
+    for index in range(count):
+        servers.mailbox.append("INBOX", sample_message(index))
+    samples, subjects = [], set()
+    reader = ReadEmail(folder=Folder.inbox, **CREDENTIALS)
+    cursor = reader.cursor(filters="ALL")
+    start = time.perf_counter()
+    for message in cursor:
+        subjects.add(str(message.subject))
+        end = time.perf_counter()
+        samples.append(end - start)
+        start = end
+        if len(samples) == int(count * 0.3):
+            break
+    position = cursor.position.dumps()
+    reader.mail.shutdown()  # the process dies here, with only the position saved
+    reader = ReadEmail(folder=Folder.inbox, **CREDENTIALS)
+    cursor = reader.cursor(filters="ALL", position=position)
+    start = time.perf_counter()
+    for message in cursor:
+        subjects.add(str(message.subject))
+        end = time.perf_counter()
+        samples.append(end - start)
+        start = end
+    check(cursor.status)
+    reader.close()
+    if len(samples) != count or len(subjects) != count:
+        raise RuntimeError(
+            f"Read {len(samples)} messages with {len(subjects)} unique of {count}"
+        )
+    return samples
+
+
+def scan_folders(servers: Servers, count: int) -> List[float]:
+    """Scans the inbox and all mail, where every message is in both folders, with latency measured per message."""
+    for index in range(count):
+        message = sample_message(index)
+        servers.mailbox.append("INBOX", message)
+        servers.mailbox.append("[Gmail]/All Mail", message)
+    scanner = FolderScanner(folders=[Folder.inbox, Folder.all], **CREDENTIALS)
+    response = scanner.search(filters="ALL")
+    check(response)
+    samples = []
+    start = time.perf_counter()
+    for _ in scanner.read_mail(messages=response.body):
+        end = time.perf_counter()
+        samples.append(end - start)
+        start = end
+    scanner.close()
+    if len(samples) != count:
+        raise RuntimeError(f"Read {len(samples)} of {count} messages")
+    return samples
+
+
+def delete_sent(servers: Servers, count: int, folder_size: int = 10_000) -> List[float]:
+    """Sends SMS with ``delete_sent`` to a sent folder of 10,000 messages, and waits for all of them to be deleted."""
+    for index in range(folder_size):
+        servers.mailbox.append(SENT, sample_message(index), flags={"\\Seen"})
+    sender = SendSMS(**CREDENTIALS)
+    check(sender.authenticate)
+    samples = []
+    for index in range(count):
+        timed(
+            lambda: check(
+                sender.send_sms(
+                    message=f"Benchmark {index}",
+                    phone=str(5550000000 + index),
+                    delete_sent=True,
+                )
+            ),
+            samples,
+        )
+    timed(lambda: sender.reconciler.flush(timeout=600), samples)
+    sender.reconciler.close()
+    remaining = len(servers.mailbox.folder(SENT).messages)
+    if remaining != folder_size:
+        raise RuntimeError(f"{remaining - folder_size} sent messages were not deleted")
+    return samples
+
+
+def sharded_send(servers: Servers, count: int) -> List[float]:
+    """Sends plain emails across four accounts, one of which is throttled and has to be failed over."""
+    sender = ShardedSender(
+        [
+            dict(
+                gmail_user=f"{user}@gmail.com",
+                gmail_pass="bench",
+                daily_quota=count,
+                per_minute=count,
+            )
+            for user in ("bench1", "bench2", "bench3", "throttled")
+        ]
+    )
+    samples = []
+    for index in range(count):
+        timed(
+            lambda: check(
+                sender.send_email(
+                    recipient="someone@example.com",
+                    subject=f"Benchmark {index}",
+                    body="Hello,\n\nThis is a benchmark.\n",
+                )
+            ),
+            samples,
+        )
+    sender.close()
+    return samples
+
+
+def duplicate_send(servers: Servers, count: int) -> List[float]:
+    """Sends emails with idempotency keys where every key is sent twice, so half the requests are repeats."""
+    samples = []
+    with tempfile.TemporaryDirectory() as directory:
+        sender = SendEmail(
+            idempotency_db=os.path.join(directory, "idempotency.db"), **CREDENTIALS
+        )
+        check(sender.authenticate)
+        for index in range(count):
+            timed(
+                lambda: check(
+                    sender.send_email(
+                        recipient="someone@example.com",
+                        subject=f"Benchmark {index // 2}",
+                        body="Hello,\n\nThis is a benchmark.\n",
+                        idempotency_key=f"benchmark-{index // 2}",
+                    )
+                ),
+                samples,
+            )
+        sender.close()
+    sent = servers.mailbox.folder(SENT).messages
+    if len(sent) != (count + 1) // 2:
+        raise RuntimeError(f"{len(sent)} emails were sent for {(count + 1) // 2} keys")
+    if len({message.headers["Message-ID"] for message in sent}) != len(sent):
+        raise RuntimeError("Message-IDs are not unique per key")
+    return samples
+
+
+def thread_messages(servers: Servers, count: int) -> List[float]:
+    """Groups messages into conversations, where replies arrive out of order and some carry only In-Reply-To."""
+    generator = random.Random(count)
+    messages, threads = [], 0
+    for index in range(count):
+        parent = messages[generator.randrange(index)] if index else None
+        if parent is None or generator.random() < 0.3:
+            threads += 1
+            parent = None
+        references = parent.references + [parent.message_id] if parent else []
+        messages.append(
+            Email(
+                dictionary=dict(
+                    sender=None,
+                    sender_email=f"sender{index % 500}@example.com",
+                    subject=f"Re: Ticket {threads}" if parent else f"Ticket {threads}",
+                    date_time=None,
+                    body="",
+                    message_id=f"<{index}@example.com>",
+                    in_reply_to=parent.message_id if parent else None,
+                    # some clients drop References, which leaves only In-Reply-To to link the reply
+                    references=references if generator.random() < 0.8 else [],
+                )
+            )
+        )
+    generator.shuffle(messages)
+    index = ConversationIndex()
+    samples = []
+    for message in messages:
+        timed(lambda: index.add(message), samples)
+    if len(index) != threads:
+        raise RuntimeError(f"Found {len(index)} of {threads} conversations")
+    return samples
+
+
+def validate_addresses(servers: Servers, count: int) -> List[float]:
+    """Validates addresses over DNS and SMTP, where every tenth address is refused by the server."""
+    samples = []
+    for index in range(count):
+        user = "invalid" if index % 10 == 0 else "user"
+        expected = index % 10 != 0
+        address = f"{user}{index}@example{index % 100}.com"
+
+        def validate():
+            if validate_email(email_address=address).ok is not expected:
+                raise RuntimeError(f"Unexpected result for {address}")
+
+        timed(validate, samples)
+    return samples
+
+
+SCENARIOS: Dict[str, tuple] = {
+    "single_send": (single_send, 1_000),
+    "bulk_send": (bulk_send, 10_000),
+    "attachment_send": (attachment_send, 50),
+    "sharded_send": (sharded_send, 1_000),
+    "duplicate_send": (duplicate_send, 1_000),
+    "read_messages": (read_messages, 10_000),
+    "read_compressed": (read_compressed, 10_000),
+    "read_headers": (read_headers, 10_000),
+    "resume_cursor": (resume_cursor, 10_000),
+    "scan_folders": (scan_folders, 10_000),
+    "save_attachments": (save_attachments, 100),
+    "delete_sent": (delete_sent, 100),
+    "thread_messages": (thread_messages, 100_000),
+    "validate_addresses": (validate_addresses, 10_000),
+}
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summarizes the latencies in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def percentile(value: float) -> float:
+        return ordered[min(len(ordered) - 1, int(value / 100 * len(ordered)))] * 1e3
+
+    return dict(
+        mean=sum(ordered) / len(ordered) * 1e3,
+        p50=percentile(50),
+        p90=percentile(90),
+        p99=percentile(99),
+        max=ordered[-1] * 1e3,
+    )
+
+
+def peak_rss() -> Optional[float]:
+    """Returns the peak resident set size of the process in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (
+        peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+    )  # bytes on macOS, KB elsewhere
+
+
+def run(name: str, scale: float, latency: float, bandwidth: int) -> dict:
+    """Runs a scenario against fresh servers and summarizes it."""
+    scenario, default = SCENARIOS[name]
+    count = max(1, int(default * scale))
+    with local(
+        latency=latency,
+        bandwidth=bandwidth,
+        mailbox=Mailbox(),
+        store_sent=name in ("delete_sent", "duplicate_send"),
+    ) as servers:
+        start = time.perf_counter()
+        samples = scenario(servers, count)
+        elapsed = time.perf_counter() - start
+    return dict(
+        scenario=name,
+        count=count,
+        seconds=elapsed,
+        throughput=count / elapsed,
+        latency_ms=percentiles(samples),
+        peak_rss_mb=peak_rss(),
+    )
+
+
+def isolated(name: str, arguments: argparse.Namespace) -> dict:
+    """Runs a scenario in a separate process, so that the peak RSS belongs to that scenario alone."""
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.suite",
+            name,
+            "--scale",
+            str(arguments.scale),
+            "--latency",
+            str(arguments.latency),
+            "--bandwidth",
+            str(arguments.bandwidth),
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+    return json.loads(output)["scenarios"][0]
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """Prints the change in throughput and median latency against a previous report."""
+    previous = {result["scenario"]: result for result in baseline["scenarios"]}
+    print(
+        f"{'scenario':<20}{'throughput':>14}{'change':>9}{'p50 ms':>10}{'change':>9}",
+        file=sys.stderr,
+    )
+    for result in report["scenarios"]:
+        before = previous.get(result["scenario"])
+        throughput, p50 = result["throughput"], result["latency_ms"].get("p50", 0)
+        if before:
+            throughput_change = f"{throughput / before['throughput'] - 1:+.1%}"
+            p50_before = before["latency_ms"].get("p50")
+            p50_change = f"{p50 / p50_before - 1:+.1%}" if p50_before else ""
+        else:
+            throughput_change = p50_change = "new"
+        print(
+            f"{result['scenario']:<20}{throughput:>14,.1f}{throughput_change:>9}{p50:>10.3f}{p50_change:>9}",
+            file=sys.stderr,
+        )
+
+
+def main() -> None:
+    """Runs the scenarios and writes the report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)}")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="multiplier for the number of operations",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds before each reply from the servers",
+    )
+    parser.add_argument(
+        "--bandwidth", type=int, default=0, help="bytes per second, 0 for unlimited"
+    )
+    parser.add_argument(
+        "--output", help="file to write the report to, defaults to stdout"
+    )
+    parser.add_argument("--compare", help="previous report to compare against")
+    arguments = parser.parse_args()
+    names = arguments.scenarios or list(SCENARIOS)
+    if unknown := set(names) - set(SCENARIOS):
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    if len(names) == 1:
+        results = [
+            run(names[0], arguments.scale, arguments.latency, arguments.bandwidth)
+        ]
+    else:
+        results = [isolated(name, arguments) for name in names]
+    report = dict(
+        created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        latency=arguments.latency,
+        bandwidth=arguments.bandwidth,
+        scale=arguments.scale,
+        scenarios=results,
+    )
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
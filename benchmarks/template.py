@@ -0,0 +1,83 @@
+"""Benchmark for building messages with ``EmailTemplate`` against ``SendEmail.multipart_message``.
+
+>>> python -m benchmarks.template 20000
+
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+
+from gmailconnector.models.config import EgressConfig
+from gmailconnector.send_email import SendEmail
+from gmailconnector.template import EmailTemplate
+
+SUBJECT = "Your weekly report, $name"
+BODY = "Hello $name,\n\nPlease find the weekly report attached.\n\nThanks,\nReports\n"
+HTML = (
+    "<html><body>"
+    + "<p>Weekly report with a table of numbers.</p>" * 50
+    + "</body></html>"
+)
+
+
+def offline_sender() -> SendEmail:
+    """Creates a ``SendEmail`` object without connecting to the server."""
+    sender = SendEmail.__new__(SendEmail)
+    sender.server = None
+    sender.env = EgressConfig(gmail_user="bench@gmail.com", gmail_pass="bench")
+    sender._failed_attachments = {"FILE NOT FOUND": [], "FILE SIZE OVER 25 MB": []}
+    sender._buffer = io.BytesIO()
+    return sender
+
+
+def main(count: int = 20_000) -> None:
+    """Prints the number of messages built per second, with and without attachments."""
+    sender = offline_sender()
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as file:
+        file.write(os.urandom(256 * 1024))
+    try:
+        for attachments in ([], [file.name]):
+            print(f"Building {count:,} messages with {len(attachments)} attachment(s)")
+            start = time.perf_counter()
+            for index in range(count):
+                name = f"user{index}"
+                sender.multipart_message(
+                    subject=SUBJECT.replace("$name", name),
+                    recipient=f"{name}@example.com",
+                    sender="Reports",
+                    body=BODY.replace("$name", name),
+                    html_body=HTML,
+                    attachments=attachments,
+                    filenames=[],
+                    cc=None,
+                ).as_string().encode("ascii")
+            baseline = count / (time.perf_counter() - start)
+            print(f"{'multipart_message':<24}{baseline:>14,.0f} messages/s")
+
+            template = EmailTemplate(
+                subject=SUBJECT,
+                body=BODY,
+                html_body=HTML,
+                attachment=attachments,
+                sender="Reports",
+            )
+            start = time.perf_counter()
+            for index in range(count):
+                name = f"user{index}"
+                template.render(
+                    from_addr=sender.env.gmail_user,
+                    recipient=[f"{name}@example.com"],
+                    variables={"name": name},
+                )
+            rendered = count / (time.perf_counter() - start)
+            print(f"{'EmailTemplate.render':<24}{rendered:>14,.0f} messages/s")
+            print(f"Speedup: {rendered / baseline:.1f}x")
+    finally:
+        os.remove(file.name)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
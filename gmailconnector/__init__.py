@@ -1,14 +1,104 @@
-"""Place holder for package."""
-
-from .models.config import Encryption  # noqa: F401
-from .models.config import EgressConfig, IngressConfig, SMSGateway
-from .models.options import Category, Condition, Folder  # noqa: F401
-from .models.responder import Response  # noqa: F401
-from .read_email import ReadEmail  # noqa: F401
-from .send_email import SendEmail  # noqa: F401
-from .send_sms import SendSMS  # noqa: F401
-from .sms_deleter import DeleteSent  # noqa: F401
-from .validator.address import EmailAddress  # noqa: F401
-from .validator.validate_email import validate_email  # noqa: F401
+"""Place holder for package.
+
+See Also:
+    Public names are imported from their modules on first access, so that ``import gmailconnector`` stays cheap,
+    and using ``SendSMS`` does not load the modules required only to read or validate emails.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
 
 version = "1.0.3"
+
+_LAZY = {
+    "Attachment": ".attachments",
+    "AttachmentExtractor": ".attachments",
+    "Conversation": ".conversation",
+    "ConversationIndex": ".conversation",
+    "ReadCursor": ".cursor",
+    "IdempotencyStore": ".idempotency",
+    "Instrumentation": ".instrumentation",
+    "OpenTelemetryExporter": ".instrumentation",
+    "PrometheusExporter": ".instrumentation",
+    "metrics": ".instrumentation",
+    "Encryption": ".models.config",
+    "EgressConfig": ".models.config",
+    "IngressConfig": ".models.config",
+    "SMSGateway": ".models.config",
+    "egress_config": ".models.config",
+    "ingress_config": ".models.config",
+    "load_config": ".models.config",
+    "Category": ".models.options",
+    "Condition": ".models.options",
+    "Folder": ".models.options",
+    "Response": ".models.responder",
+    "Outbox": ".outbox",
+    "OutboxWorker": ".outbox",
+    "RateLimiter": ".ratelimit",
+    "RawMessage": ".raw",
+    "ReadEmail": ".read_email",
+    "FolderScanner": ".scanner",
+    "SendEmail": ".send_email",
+    "SendSMS": ".send_sms",
+    "Account": ".sharding",
+    "ShardedSender": ".sharding",
+    "Strategy": ".sharding",
+    "DeleteSent": ".sms_deleter",
+    "SentReconciler": ".sms_deleter",
+    "EmailTemplate": ".template",
+    "SharedContext": ".tls",
+    "EmailAddress": ".validator.address",
+    "validate_email": ".validator.validate_email",
+}
+
+__all__ = list(_LAZY) + ["version"]
+
+if TYPE_CHECKING:
+    from .attachments import Attachment, AttachmentExtractor
+    from .conversation import Conversation, ConversationIndex
+    from .cursor import ReadCursor
+    from .idempotency import IdempotencyStore
+    from .instrumentation import (
+        Instrumentation,
+        OpenTelemetryExporter,
+        PrometheusExporter,
+        metrics,
+    )
+    from .models.config import (
+        EgressConfig,
+        Encryption,
+        IngressConfig,
+        SMSGateway,
+        egress_config,
+        ingress_config,
+        load_config,
+    )
+    from .models.options import Category, Condition, Folder
+    from .models.responder import Response
+    from .outbox import Outbox, OutboxWorker
+    from .ratelimit import RateLimiter
+    from .raw import RawMessage
+    from .read_email import ReadEmail
+    from .scanner import FolderScanner
+    from .send_email import SendEmail
+    from .send_sms import SendSMS
+    from .sharding import Account, ShardedSender, Strategy
+    from .sms_deleter import DeleteSent, SentReconciler
+    from .template import EmailTemplate
+    from .tls import SharedContext
+    from .validator.address import EmailAddress
+    from .validator.validate_email import validate_email
+
+
+def __getattr__(name: str) -> object:
+    """Imports a public name from its module on first access, and caches it in the package."""
+    if module := _LAZY.get(name):
+        value = getattr(importlib.import_module(module, __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list:
+    """Lists the public names along with the ones already loaded."""
+    return sorted(set(globals()) | set(_LAZY))
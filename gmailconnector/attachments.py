@@ -0,0 +1,498 @@
+import binascii
+import hashlib
+import os
+import re
+from collections.abc import Generator
+from email.header import decode_header, make_header
+from email.message import Message
+from email.utils import collapse_rfc2231_value, decode_rfc2231
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    List,
+    Tuple,
+    Union,
+)
+
+from .instrumentation import metrics
+
+if TYPE_CHECKING:
+    from .read_email import ReadEmail
+
+TOKEN = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}$|([^\s()"]+))')
+UNSAFE = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+
+
+class Attachment:
+    """Attachment of an email, with the details of where it was saved.
+
+    >>> Attachment
+
+    """
+
+    __slots__ = (
+        "section",
+        "filename",
+        "content_type",
+        "encoding",
+        "size",
+        "path",
+        "sha256",
+        "duplicate",
+    )
+
+    def __init__(
+        self,
+        section: str,
+        filename: str,
+        content_type: str,
+        encoding: str = "7bit",
+        size: int = None,
+    ):
+        """Stores the details of the attachment, from the MIME headers or the ``BODYSTRUCTURE``
+
+        Args:
+            section: Section number of the attachment in the MIME tree, like ``2`` or ``1.2``
+            filename: Name of the file as sent, or a name made up from the section for unnamed parts.
+            content_type: Content type like ``application/pdf``
+            encoding: Transfer encoding like ``base64``
+            size: Size of the encoded attachment in bytes.
+        """
+        self.section = section
+        self.filename = filename
+        self.content_type = content_type
+        self.encoding = encoding
+        self.size = size
+        self.path = None
+        self.sha256 = None
+        self.duplicate = False
+
+    def json(self) -> Dict[str, Any]:
+        """Returns the details as a dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        """Shows the section, name and size of the attachment."""
+        return f"Attachment(section={self.section!r}, filename={self.filename!r}, size={self.size})"
+
+
+class Decoder:
+    """Decodes a transfer encoded attachment incrementally, so that it never has to be held in memory as a whole."""
+
+    def __init__(self, encoding: str):
+        """Starts with nothing pending.
+
+        Args:
+            encoding: Transfer encoding of the attachment, anything other than base64 or quoted-printable is left as is.
+        """
+        self.encoding = (encoding or "7bit").lower()
+        self.pending = b""
+
+    def feed(self, data: bytes) -> bytes:
+        """Decodes the data that can be decoded so far, and keeps the rest for the next chunk."""
+        if self.encoding == "base64":
+            data = self.pending + data.translate(None, b" \t\r\n")
+            usable = len(data) - len(data) % 4
+            self.pending = data[usable:]
+            return binascii.a2b_base64(data[:usable]) if usable else b""
+        if self.encoding == "quoted-printable":
+            data = self.pending + data
+            end = data.rfind(b"\n") + 1
+            self.pending = data[end:]
+            return binascii.a2b_qp(data[:end])
+        return data
+
+    def flush(self) -> bytes:
+        """Decodes whatever is left at the end of the attachment."""
+        data, self.pending = self.pending, b""
+        if not data:
+            return b""
+        if self.encoding == "base64":
+            try:
+                return binascii.a2b_base64(data + b"=" * (-len(data) % 4))
+            except binascii.Error:
+                return b""
+        if self.encoding == "quoted-printable":
+            return binascii.a2b_qp(data)
+        return data
+
+
+def decode_name(value: Union[str, bytes, tuple, None]) -> Union[str, None]:
+    """Decodes a filename that was encoded as per RFC 2231 or RFC 2047."""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+    if isinstance(value, tuple):
+        return collapse_rfc2231_value(value)
+    return str(make_header(decode_header(value)))
+
+
+def safe_name(filename: str) -> str:
+    """Strips the directories and the characters that are not allowed in a filename."""
+    name = UNSAFE.sub("_", os.path.basename(filename.replace("\\", "/"))).strip(". ")
+    return name or "attachment"
+
+
+def is_attachment(part: Message) -> bool:
+    """Checks if a MIME part is an attachment, rather than the body or a container for other parts."""
+    if part.get_content_type() == "message/rfc822":
+        return True
+    if part.is_multipart():
+        return False
+    return part.get_content_disposition() == "attachment" or bool(part.get_filename())
+
+
+def walk(message: Message, section: str = "") -> Generator[Tuple[str, Message]]:
+    """Yields the leaf parts of an email along with their IMAP section numbers, without going into attached emails."""
+    # attached emails are multipart to the parser, but a single part to IMAP, like in the BODYSTRUCTURE
+    if not message.is_multipart() or message.get_content_type() == "message/rfc822":
+        yield section or "1", message
+        return
+    for index, part in enumerate(message.get_payload(), start=1):
+        yield from walk(part, f"{section}.{index}" if section else str(index))
+
+
+def default_name(section: str, content_type: str) -> str:
+    """Name for an attachment without a filename, with the extension of an email for the attached ones."""
+    return (
+        f"part-{section}.eml" if content_type == "message/rfc822" else f"part-{section}"
+    )
+
+
+def find(message: Message) -> List[Attachment]:
+    """Lists the attachments of an email that was parsed already.
+
+    Args:
+        message: Parsed email.
+
+    Returns:
+        List[Attachment]:
+        Details of every attachment, with the size of the encoded content.
+    """
+    found = []
+    for section, part in walk(message):
+        if not is_attachment(part):
+            continue
+        payload = part.get_payload()
+        content_type = part.get_content_type()
+        found.append(
+            Attachment(
+                section=section,
+                filename=decode_name(part.get_filename())
+                or default_name(section, content_type),
+                content_type=content_type,
+                encoding=str(part.get("Content-Transfer-Encoding", "7bit"))
+                .strip()
+                .lower(),
+                # the size of an attached email on the wire is not known once it is parsed
+                size=len(payload) if isinstance(payload, (str, bytes)) else None,
+            )
+        )
+    return found
+
+
+def parse_response(data: List[Union[bytes, tuple]]) -> list:
+    """Parses the parenthesized lists of an IMAP response into nested lists.
+
+    Args:
+        data: Response data from ``imaplib``, where the literals are delivered separately within tuples.
+
+    Returns:
+        list:
+        Nested lists of bytes, where ``NIL`` is ``None``
+    """
+    stack = [[]]
+    for item in data:
+        line, literal = item if isinstance(item, tuple) else (item, None)
+        position = 0
+        while position < len(line):
+            match = TOKEN.match(line, position)
+            if not match or match.end() == position:
+                break
+            position = match.end()
+            opening, closing, quoted, length, atom = match.groups()
+            if opening:
+                stack.append([])
+            elif closing:
+                if len(stack) > 1:
+                    finished = stack.pop()
+                    stack[-1].append(finished)
+            elif quoted is not None:
+                stack[-1].append(re.sub(rb"\\(.)", rb"\1", quoted))
+            elif length is not None:
+                stack[-1].append(literal)
+            else:
+                stack[-1].append(None if atom.upper() == b"NIL" else atom)
+    return stack[0]
+
+
+def text(value: Union[bytes, None]) -> str:
+    """Decodes a string from the ``BODYSTRUCTURE``, which is in lower case for the types and encodings."""
+    return value.decode(errors="replace") if value is not None else ""
+
+
+def params(values: Union[list, None]) -> Dict[str, Union[str, tuple]]:
+    """Turns the list of parameter names and values into a dictionary, while joining RFC 2231 continuations."""
+    if not values:
+        return {}
+    pairs = [
+        (text(values[index]).lower(), text(values[index + 1]))
+        for index in range(0, len(values) - 1, 2)
+    ]
+    # decode_rfc2231 and collapse_rfc2231_value join parameters split as name*0, name*1 and decode name*
+    joined = {}
+    for name, value in pairs:
+        base = name.split("*")[0]
+        if "*" in name:
+            joined.setdefault(base, []).append((name, value))
+        else:
+            joined[base] = value
+    for base, parts in list(joined.items()):
+        if isinstance(parts, list):
+            encoded = any(name.endswith("*") for name, _ in parts)
+            value = "".join(value for _, value in sorted(parts))
+            joined[base] = decode_rfc2231(value) if encoded else value
+    return joined
+
+
+def structure(body: list, section: str = "") -> Generator[Tuple[str, list]]:
+    """Yields the leaf parts of a ``BODYSTRUCTURE`` along with their section numbers."""
+    if body and isinstance(body[0], list):
+        index = 0
+        for child in body:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from structure(child, f"{section}.{index}" if section else str(index))
+        return
+    yield section or "1", body
+
+
+def from_structure(body: list) -> List[Attachment]:
+    """Lists the attachments described by a ``BODYSTRUCTURE``, without downloading the email.
+
+    Args:
+        body: Parsed ``BODYSTRUCTURE``
+
+    Returns:
+        List[Attachment]:
+        Details of every attachment, with the size of the encoded content.
+    """
+    found = []
+    for section, part in structure(body):
+        if len(part) < 7:
+            continue
+        maintype, subtype = text(part[0]).lower(), text(part[1]).lower()
+        # extension data starts after the line count for text, and after the envelope, body and lines for emails
+        extension = 8 if maintype == "text" else 10 if subtype == "rfc822" else 7
+        disposition = part[extension + 1] if len(part) > extension + 1 else None
+        kind, options = None, {}
+        if isinstance(disposition, list) and disposition:
+            kind = text(disposition[0]).lower()
+            options = params(disposition[1] if len(disposition) > 1 else None)
+        filename = options.get("filename") or params(part[2]).get("name")
+        content_type = f"{maintype}/{subtype}"
+        # attached emails are attachments even when inline and unnamed, as in is_attachment
+        if kind != "attachment" and not filename and content_type != "message/rfc822":
+            continue
+        found.append(
+            Attachment(
+                section=section,
+                filename=decode_name(filename) or default_name(section, content_type),
+                content_type=content_type,
+                encoding=text(part[5]).lower() or "7bit",
+                size=int(part[6]) if part[6] is not None else None,
+            )
+        )
+    return found
+
+
+class AttachmentExtractor:
+    """Decodes attachments in chunks straight to files or to a sink, and skips the ones saved already.
+
+    >>> AttachmentExtractor
+
+    See Also:
+        - Over IMAP, only the attachments are downloaded, in ranges of ``chunk_size`` bytes.
+        - Memory used stays around ``chunk_size``, regardless of the size of the attachments.
+        - Identical attachments are found using their SHA-256 hash, and are saved only once.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, os.PathLike] = "attachments",
+        sink: Callable[[Attachment], BinaryIO] = None,
+        chunk_size: int = 1 << 20,
+        dedupe: bool = True,
+    ):
+        """Creates the directory if needed.
+
+        Args:
+            directory: Directory to save the attachments in.
+            sink: Function that takes an ``Attachment`` and returns a binary file-like object to write it to.
+                The object is closed once the attachment is written, and nothing is saved in the directory.
+            chunk_size: Number of bytes downloaded and decoded at a time.
+            dedupe: Boolean flag to save attachments with the same content only once.
+        """
+        self.directory = directory
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.dedupe = dedupe
+        self.saved: Dict[str, str] = (
+            {}
+        )  # hash to the path of the first file with that content
+        if sink is None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _target(self, attachment: Attachment) -> Tuple[BinaryIO, Union[str, None]]:
+        """Opens the sink or a temporary file in the directory for the attachment."""
+        if self.sink is not None:
+            return self.sink(attachment), None
+        temporary = os.path.join(
+            self.directory, f".{os.getpid()}-{id(attachment)}.part"
+        )
+        return open(temporary, "wb"), temporary
+
+    def _finish(self, attachment: Attachment, temporary: Union[str, None]) -> None:
+        """Keeps the file under its own name, or drops it if the same content was saved already."""
+        existing = self.saved.get(attachment.sha256) if self.dedupe else None
+        if existing:
+            attachment.duplicate = True
+            attachment.path = existing
+            if temporary:
+                os.remove(temporary)
+            return
+        if temporary:
+            name = safe_name(attachment.filename)
+            stem, extension = os.path.splitext(name)
+            path, counter = os.path.join(self.directory, name), 1
+            while os.path.exists(path):
+                path = os.path.join(self.directory, f"{stem} ({counter}){extension}")
+                counter += 1
+            os.replace(temporary, path)
+            attachment.path = path
+        self.saved[attachment.sha256] = attachment.path
+
+    def write(self, attachment: Attachment, chunks: Generator[bytes]) -> Attachment:
+        """Decodes the encoded chunks of an attachment, and writes them while hashing the content.
+
+        Args:
+            attachment: Details of the attachment.
+            chunks: Encoded content of the attachment in chunks.
+
+        Returns:
+            Attachment:
+            Same attachment, with the hash and the path where it was saved.
+        """
+        decoder = Decoder(attachment.encoding)
+        digest = hashlib.sha256()
+        file, temporary = self._target(attachment)
+        try:
+            with file:
+                for chunk in chunks:
+                    if decoded := decoder.feed(chunk):
+                        digest.update(decoded)
+                        file.write(decoded)
+                if decoded := decoder.flush():
+                    digest.update(decoded)
+                    file.write(decoded)
+        except BaseException:
+            if temporary and os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        attachment.sha256 = digest.hexdigest()
+        self._finish(attachment, temporary)
+        return attachment
+
+    def save(self, message: Union[bytes, Message]) -> List[Attachment]:
+        """Saves the attachments of an email that was downloaded already.
+
+        Args:
+            message: Raw or parsed email.
+
+        Returns:
+            List[Attachment]:
+            Attachments that were saved.
+        """
+        if isinstance(message, bytes):
+            import email
+
+            message = email.message_from_bytes(message)
+        parts = dict(walk(message))
+        saved = []
+        for attachment in find(message):
+            payload = parts[attachment.section].get_payload()
+            if isinstance(payload, list):
+                # an attached email is saved as is, headers and all
+                payload = payload[0].as_bytes()
+            if isinstance(payload, str):
+                payload = payload.encode("ascii", "surrogateescape")
+            saved.append(
+                self.write(
+                    attachment,
+                    (
+                        payload[index : index + self.chunk_size]
+                        for index in range(0, len(payload), self.chunk_size)
+                    ),
+                )
+            )
+        return saved
+
+    def _ranges(self, reader: "ReadEmail", uid: str, section: str) -> Generator[bytes]:
+        """Downloads a section of an email in ranges of ``chunk_size`` bytes."""
+        offset = 0
+        while True:
+            item = f"BODY.PEEK[{section}]<{offset}.{self.chunk_size}>"
+            with metrics.phase("imap.fetch", folder=reader.env.folder, section=section):
+                return_code, data = reader.command("uid", "fetch", uid, f"({item})")
+            chunk = next((part[1] for part in data if isinstance(part, tuple)), None)
+            if return_code != "OK" or not chunk:
+                return
+            metrics.count("bytes_in", len(chunk))
+            yield chunk
+            if len(chunk) < self.chunk_size:
+                return
+            offset += len(chunk)
+
+    def fetch(
+        self, reader: "ReadEmail", uid: Union[str, bytes, int]
+    ) -> List[Attachment]:
+        """Saves the attachments of an email on the server, without downloading the rest of it.
+
+        Args:
+            reader: Authenticated ``ReadEmail`` object, with the folder of the email selected.
+            uid: UID of the email.
+
+        Returns:
+            List[Attachment]:
+            Attachments that were saved.
+        """
+        uid = uid.decode() if isinstance(uid, bytes) else str(uid)
+        with metrics.phase(
+            "imap.fetch", folder=reader.env.folder, items="BODYSTRUCTURE"
+        ):
+            return_code, data = reader.command("uid", "fetch", uid, "(BODYSTRUCTURE)")
+        if return_code != "OK":
+            return []
+        response = parse_response([part for part in data if part])
+        body = None
+        for message in response:
+            if not isinstance(message, list):
+                continue
+            for index in range(len(message) - 1):
+                # items come in any order, so the parsed lists between them are skipped
+                if (
+                    isinstance(message[index], bytes)
+                    and message[index].upper() == b"BODYSTRUCTURE"
+                ):
+                    body = message[index + 1]
+        if not body:
+            return []
+        return [
+            self.write(attachment, self._ranges(reader, uid, attachment.section))
+            for attachment in from_structure(body)
+        ]
@@ -0,0 +1,343 @@
+"""Extracts the body of an email as plain text, from the best of its text parts in their declared charsets."""
+
+import codecs
+import re
+from email.message import Message
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import List, Tuple, Union
+
+from .attachments import is_attachment
+
+# labels that mail clients send, which Python does not know or which are decoded better by a superset, as per WHATWG
+ALIASES = {
+    "us-ascii": "cp1252",
+    "ascii": "cp1252",
+    "iso-8859-1": "cp1252",
+    "iso8859-1": "cp1252",
+    "latin1": "cp1252",
+    "latin-1": "cp1252",
+    "iso-8859-9": "cp1254",
+    "iso-8859-11": "cp874",
+    "tis-620": "cp874",
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+    "x-gbk": "gb18030",
+    "ks_c_5601-1987": "cp949",
+    "euc-kr": "cp949",
+    "iso-8859-8-i": "iso8859_8",
+    "shift_jis": "cp932",
+    "x-sjis": "cp932",
+    "windows-31j": "cp932",
+    "x-mac-roman": "mac_roman",
+    "utf8": "utf-8",
+    "unicode-1-1-utf-8": "utf-8",
+}
+ASCII_ENCODED = ("iso2022", "utf-7", "hz", "utf-16", "utf-32")
+UNKNOWN = {"unknown-8bit", "x-unknown", "unknown", "default", "x-user-defined", ""}
+META_CHARSET = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?([A-Za-z0-9_:.\-]+)""", re.I
+)
+SPACES = re.compile(r"\s+")
+BLANK_LINES = re.compile(r"\n{3,}")
+
+TEXT_TYPES = {"text/plain": "plain", "text/html": "html"}
+SKIPPED = {"script", "style", "head", "title", "noscript", "template", "svg"}
+PARAGRAPHS = {
+    "p",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "table",
+    "blockquote",
+    "pre",
+    "ul",
+    "ol",
+    "dl",
+    "hr",
+}
+LINES = {
+    "div",
+    "tr",
+    "li",
+    "dd",
+    "dt",
+    "section",
+    "article",
+    "header",
+    "footer",
+    "nav",
+    "aside",
+    "address",
+    "form",
+    "fieldset",
+    "figure",
+    "figcaption",
+    "main",
+    "caption",
+    "center",
+}
+
+
+@lru_cache(maxsize=128)
+def codec(charset: Union[str, None]) -> Union[str, None]:
+    """Resolves a declared charset to the name of a Python codec, once per label.
+
+    Args:
+        charset: Charset from the ``Content-Type`` header, or from a ``<meta>`` tag.
+
+    Returns:
+        str:
+        Name of the codec, or ``None`` when the label is missing or unknown.
+    """
+    label = (charset or "").strip().strip("\"'").lower()
+    if label in UNKNOWN:
+        return None
+    label = ALIASES.get(label, label)
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+@lru_cache(maxsize=128)
+def single_byte(name: str) -> bool:
+    """Checks if a codec maps every byte to a character on its own, like Latin-1 or KOI8-R"""
+    if name.startswith(ASCII_ENCODED):
+        return False
+    return len(bytes(range(256)).decode(name, "replace")) == 256
+
+
+def decode(payload: bytes, charset: str = None, html: bool = False) -> str:
+    """Decodes the content of a text part with its charset, guessing when it is missing, unknown or wrong.
+
+    Args:
+        payload: Content after the transfer encoding has been removed.
+        charset: Charset declared in the ``Content-Type`` header.
+        html: Looks for the charset in a ``<meta>`` tag when none is declared.
+
+    See Also:
+        - Content labeled with a single byte charset is tried as UTF-8 first, since that is the usual mislabeling,
+          and text in those charsets is almost never valid UTF-8.
+        - Undeclared content that is not UTF-8 is decoded as Windows-1252, which accepts any byte.
+
+    Returns:
+        str:
+        Decoded text, with line breaks as ``\\n``
+    """
+    name = codec(charset)
+    # ISO-2022 and UTF-7 text is all ASCII bytes, and UTF-16 text can be too
+    if payload.isascii() and not (name and name.startswith(ASCII_ENCODED)):
+        return payload.decode("ascii").replace("\r\n", "\n")
+    if name is None and html and (meta := META_CHARSET.search(payload, 0, 1024)):
+        name = codec(meta.group(1).decode("ascii"))
+    if name is None or single_byte(name):
+        candidates = ("utf-8", name or "cp1252")
+    else:
+        candidates = (name, "utf-8")
+    for candidate in candidates:
+        try:
+            text = payload.decode(candidate)
+            break
+        except UnicodeDecodeError:
+            pass
+    else:
+        text = payload.decode(name or "utf-8", "replace")
+    return text.replace("\r\n", "\n")
+
+
+class HTMLText(HTMLParser):
+    """Converts HTML to readable text as it is fed, without building a document tree.
+
+    >>> HTMLText
+
+    See Also:
+        - Blocks like paragraphs, rows and list items start new lines, and whitespace is collapsed outside ``<pre>``
+        - Scripts, styles and the ``<head>`` are left out, and links keep their target in brackets after the text.
+    """
+
+    def __init__(self):
+        """Starts with an empty output, and converts the entities while parsing."""
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.skip = 0
+        self.pre = 0
+        self.breaks = 0  # line breaks owed before the next text
+        self.space = False  # a space is owed before the next text
+        self.started = False
+        self.links: List[Union[str, None]] = []
+        self.link_start = 0
+
+    def newline(self, count: int = 1) -> None:
+        """Ends the current line, with a blank line after it for paragraphs."""
+        if self.started:
+            self.breaks = max(self.breaks, count)
+        self.space = False
+
+    def write(self, text: str) -> None:
+        """Adds text to the output, after any line breaks or space owed."""
+        if self.breaks:
+            self.parts.append("\n" * self.breaks)
+            self.breaks = 0
+        elif self.space:
+            self.parts.append(" ")
+        self.space = False
+        self.parts.append(text)
+        self.started = True
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        """Opens a block, a skipped element or a link."""
+        if tag in SKIPPED:
+            self.skip += 1
+        elif tag == "br":
+            if self.started:
+                self.breaks += 1
+                self.space = False
+        elif tag in PARAGRAPHS:
+            self.newline(2)
+            if tag == "pre":
+                self.pre += 1
+        elif tag in LINES:
+            self.newline()
+            if tag == "li" and not self.skip:
+                self.write("-")
+                self.space = True
+        elif tag in ("td", "th"):
+            self.space = self.started
+        elif tag == "a":
+            self.links.append(dict(attrs).get("href"))
+            self.link_start = len(self.parts)
+        elif tag == "img" and not self.skip:
+            if alt := (dict(attrs).get("alt") or "").strip():
+                self.handle_data(alt)
+
+    def handle_startendtag(self, tag: str, attrs: list) -> None:
+        """Handles ``<br/>`` and the like, without opening an element."""
+        if tag not in SKIPPED:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag: str) -> None:
+        """Closes a block, a skipped element or a link."""
+        if tag in SKIPPED:
+            self.skip = max(0, self.skip - 1)
+        elif tag in PARAGRAPHS:
+            if tag == "pre":
+                self.pre = max(0, self.pre - 1)
+            self.newline(2)
+        elif tag in LINES:
+            self.newline()
+        elif tag == "a" and self.links:
+            href = self.links.pop()
+            text = "".join(self.parts[self.link_start :])
+            if (
+                href
+                and href.startswith(("http://", "https://"))
+                and href not in text
+                and text.strip()
+            ):
+                self.space = not self.breaks
+                self.write(f"({href})")
+
+    def handle_data(self, data: str) -> None:
+        """Adds the text, with its whitespace collapsed unless it is preformatted."""
+        if self.skip:
+            return
+        if self.pre:
+            self.write(data)
+            return
+        if data[:1].isspace() and self.started:
+            self.space = True
+        text = SPACES.sub(" ", data).strip()
+        if text:
+            self.write(text)
+            self.space = data[-1:].isspace()
+
+    def text(self) -> str:
+        """Returns the text converted so far."""
+        self.close()
+        text = "".join(self.parts)
+        return BLANK_LINES.sub("\n\n", text).strip()
+
+
+def html_to_text(html: str) -> str:
+    """Converts HTML to readable text.
+
+    Args:
+        html: Document or fragment.
+
+    Returns:
+        str:
+        Text with one line per block, and paragraphs separated by a blank line.
+    """
+    parser = HTMLText()
+    parser.feed(html)
+    return parser.text()
+
+
+def text_parts(message: Message, prefer: str = "plain") -> List[Tuple[str, Message]]:
+    """Picks the parts that make up the body, with one alternative from each ``multipart/alternative``
+
+    Args:
+        message: Parsed email.
+        prefer: Subtype to pick among alternatives, ``plain`` or ``html``, the other one is used when it is missing.
+
+    See Also:
+        Each header is parsed once per part, which is most of the cost for small messages.
+
+    Returns:
+        List[Tuple[str, Message]]:
+        Subtype and text part, in the order they appear, without attachments and attached emails.
+    """
+    content_type = message.get_content_type()
+    if not message.is_multipart():
+        if content_type not in TEXT_TYPES:
+            return []
+        # is_attachment parses the headers, so it only runs when there is a disposition or a name to look at
+        if (
+            "Content-Disposition" in message
+            or "name" in message.get("Content-Type", "")
+        ) and is_attachment(message):
+            return []
+        return [(TEXT_TYPES[content_type], message)]
+    if content_type == "message/rfc822":
+        return []
+    if content_type == "multipart/alternative":
+        options = [text_parts(part, prefer) for part in message.get_payload()]
+        options = [parts for parts in options if parts]
+        # the last alternative is the richest one, so it wins a tie
+        for parts in reversed(options):
+            if any(subtype == prefer for subtype, _ in parts):
+                return parts
+        return options[-1] if options else []
+    found = []
+    for part in message.get_payload():
+        if isinstance(part, Message):
+            found.extend(text_parts(part, prefer))
+    return found
+
+
+def extract(message: Message, prefer: str = "plain") -> str:
+    """Extracts the body of an email as plain text.
+
+    Args:
+        message: Parsed email.
+        prefer: Subtype to pick among alternatives, ``plain`` or ``html``
+
+    See Also:
+        - The transfer encoding is removed, and the text is decoded with the declared charset.
+        - HTML is converted to text, so the result never has tags or base64 in it.
+
+    Returns:
+        str:
+        Text of all the parts that make up the body, separated by blank lines.
+    """
+    texts = []
+    for subtype, part in text_parts(message, prefer):
+        payload = part.get_payload(decode=True) or b""
+        html = subtype == "html"
+        text = decode(payload, part.get_content_charset(), html=html)
+        texts.append(html_to_text(text) if html else text)
+    return "\n\n".join(text for text in texts if text)
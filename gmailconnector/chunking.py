@@ -0,0 +1,128 @@
+"""Sizes the chunks of messages fetched per command, from their sizes and the measured speed of the connection."""
+
+import re
+import threading
+from collections.abc import Generator
+from typing import Dict, Iterable, List, Tuple
+
+SIZE = re.compile(
+    rb"\bUID (\d+)\b.*?\bRFC822\.SIZE (\d+)|\bRFC822\.SIZE (\d+)\b.*?\bUID (\d+)"
+)
+UNKNOWN_SIZE = 64 * 1024
+
+
+class ChunkSizer:
+    """Splits messages into chunks that take about the same time to download, for the round trip to be a small part.
+
+    >>> ChunkSizer
+
+    See Also:
+        - A command costs one round trip and then the time to transfer the reply, so chunks of ``throughput * rtt``
+          bytes spend half the time waiting. The budget is a multiple of that, to keep the connection busy.
+        - The round trip is measured with the small replies for ``RFC822.SIZE``, and the throughput with the chunks.
+        - Every chunk holds at least one message, so a message larger than the budget is fetched on its own.
+    """
+
+    def __init__(
+        self,
+        initial: int = 256 * 1024,
+        minimum: int = 64 * 1024,
+        maximum: int = 16 * 1024 * 1024,
+        rtt_multiple: float = 8,
+        max_messages: int = 500,
+        smoothing: float = 0.3,
+    ):
+        """Starts with the initial budget, until the connection has been measured.
+
+        Args:
+            initial: Bytes per chunk before the throughput is known.
+            minimum: Smallest budget in bytes.
+            maximum: Largest budget in bytes, which bounds the memory held by a single reply.
+            rtt_multiple: Time to transfer a chunk, as a multiple of the round trip.
+            max_messages: Largest number of messages in a chunk, which keeps the command short.
+            smoothing: Weight of the latest measurement in the moving averages.
+        """
+        self.budget = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.rtt_multiple = rtt_multiple
+        self.max_messages = max_messages
+        self.smoothing = smoothing
+        self.rtt = None
+        self.throughput = None
+        self.lock = threading.Lock()
+
+    def _average(self, current: float, value: float) -> float:
+        """Moves an average towards the latest measurement."""
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
+
+    def _resize(self) -> None:
+        """Sets the budget from the round trip and the throughput, once both are known."""
+        if self.rtt is None or self.throughput is None:
+            return
+        budget = int(self.throughput * self.rtt * self.rtt_multiple)
+        self.budget = max(self.minimum, min(self.maximum, budget))
+
+    def observe_rtt(self, seconds: float) -> None:
+        """Records the duration of a command with a small reply, which is mostly the round trip."""
+        with self.lock:
+            self.rtt = self._average(self.rtt, seconds)
+            self._resize()
+
+    def observe(self, size: int, seconds: float) -> None:
+        """Records the time taken to fetch a chunk.
+
+        Args:
+            size: Bytes received.
+            seconds: Time from sending the command to receiving the whole reply.
+        """
+        if size <= 0 or seconds <= 0:
+            return
+        with self.lock:
+            # the round trip is taken out, but never more than most of the time, in case it was overestimated
+            transfer = max(seconds - (self.rtt or 0.0), seconds * 0.1)
+            self.throughput = self._average(self.throughput, size / transfer)
+            self._resize()
+
+    def chunks(self, sizes: Iterable[Tuple[int, int]]) -> Generator[List[int]]:
+        """Groups the messages into chunks that fit the budget, which is read again before every chunk.
+
+        Args:
+            sizes: UID and size of each message, in the order they are to be fetched.
+
+        Yields:
+            List[int]:
+            UIDs of the messages in the chunk.
+        """
+        chunk, total = [], 0
+        for uid, size in sizes:
+            if chunk and (
+                total + size > self.budget or len(chunk) >= self.max_messages
+            ):
+                yield chunk
+                chunk, total = [], 0
+            chunk.append(uid)
+            total += size
+        if chunk:
+            yield chunk
+
+    def json(self) -> Dict[str, float]:
+        """Returns the measurements and the current budget."""
+        return dict(budget=self.budget, rtt=self.rtt, throughput=self.throughput)
+
+
+def parse_sizes(data: List[bytes]) -> Dict[int, int]:
+    """Reads the UID and ``RFC822.SIZE`` of every message from a ``FETCH`` reply, in either order."""
+    sizes = {}
+    for line in data:
+        if isinstance(line, tuple):
+            line = line[0]
+        if not line or not (match := SIZE.search(line)):
+            continue
+        if match.group(1):
+            sizes[int(match.group(1))] = int(match.group(2))
+        else:
+            sizes[int(match.group(4))] = int(match.group(3))
+    return sizes
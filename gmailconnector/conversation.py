@@ -0,0 +1,184 @@
+import re
+from collections.abc import Generator
+from typing import Dict, Hashable, Iterable, List, Union
+
+from .models.responder import Email
+
+PREFIX = re.compile(r"^\s*((re|fwd?|aw|sv|antw)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+
+
+def normalize_subject(subject: Union[str, None]) -> str:
+    """Strips the reply and forward prefixes like ``Re:`` and ``Fwd:`` from a subject, for grouping by subject."""
+    return PREFIX.sub("", str(subject or "")).strip().lower()
+
+
+class Conversation:
+    """Messages that belong to the same thread.
+
+    >>> Conversation
+
+    """
+
+    __slots__ = ("key", "messages")
+
+    def __init__(self, key: Hashable, messages: List[Email]):
+        """Stores the messages in the order they were added.
+
+        Args:
+            key: ID of the conversation, which is the ``X-GM-THRID`` or a Message-ID within the thread.
+            messages: Messages of the conversation.
+        """
+        self.key = key
+        self.messages = messages
+
+    @property
+    def subject(self) -> str:
+        """Subject of the first message, without the reply and forward prefixes."""
+        return PREFIX.sub("", str(self.messages[0].subject or "")).strip()
+
+    @property
+    def participants(self) -> List[str]:
+        """Email addresses of the senders, in the order they joined the conversation."""
+        return list(dict.fromkeys(message.sender_email for message in self.messages))
+
+    def __len__(self) -> int:
+        """Number of messages in the conversation."""
+        return len(self.messages)
+
+    def __iter__(self) -> Generator[Email]:
+        """Iterates over the messages."""
+        return iter(self.messages)
+
+    def __repr__(self) -> str:
+        """Shows the subject and the number of messages."""
+        return f"Conversation(subject={self.subject!r}, messages={len(self.messages)})"
+
+
+class ConversationIndex:
+    """Groups messages into conversations as they are read, using a union-find over the IDs that link them.
+
+    >>> ConversationIndex
+
+    See Also:
+        - Messages are linked by ``X-GM-THRID`` when read from Gmail, and by Message-ID, In-Reply-To and References.
+        - A reply that arrives before its parent, or a missing message in the middle of a thread, is merged later on.
+        - Each message takes near constant time to add, so grouping is linear in the number of messages.
+    """
+
+    def __init__(self, by_subject: bool = False):
+        """Starts with no conversations.
+
+        Args:
+            by_subject: Boolean flag to also group messages that have the same subject, without the ``Re:`` prefixes,
+                for clients that drop the ``References`` header.
+        """
+        self.by_subject = by_subject
+        self._parent: Dict[Hashable, Hashable] = {}
+        self._messages: Dict[Hashable, List[Email]] = {}
+        self._anonymous = 0
+
+    def _find(self, key: Hashable) -> Hashable:
+        """Finds the root of a key, and points every key on the way directly to the root."""
+        parent = self._parent
+        if key not in parent:
+            parent[key] = key
+            return key
+        root = key
+        while parent[root] != root:
+            root = parent[root]
+        while parent[key] != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    def _union(self, first: Hashable, second: Hashable) -> Hashable:
+        """Merges the conversations of two roots, moving the messages of the smaller one into the larger one."""
+        if first == second:
+            return first
+        messages = self._messages
+        if len(messages.get(first, ())) < len(messages.get(second, ())):
+            first, second = second, first
+        self._parent[second] = first
+        if moved := messages.pop(second, None):
+            messages.setdefault(first, []).extend(moved)
+        return first
+
+    def keys(self, message: Email) -> List[Hashable]:
+        """Lists the keys that tie a message to its conversation."""
+        keys = []
+        if message.thread_id:
+            keys.append(("thread", message.thread_id))
+        if message.message_id:
+            keys.append(message.message_id)
+        if message.in_reply_to:
+            keys.append(message.in_reply_to)
+        keys.extend(message.references)
+        if self.by_subject and (subject := normalize_subject(message.subject)):
+            keys.append(("subject", subject))
+        return keys
+
+    def add(self, message: Email) -> Hashable:
+        """Adds a message to its conversation, and merges the conversations it links together.
+
+        Args:
+            message: Email object from ``read_mail``
+
+        Returns:
+            Hashable:
+            Key of the conversation the message belongs to now, which may change as more messages are added.
+        """
+        keys = self.keys(message)
+        if not keys:  # messages without any IDs are conversations of their own
+            self._anonymous += 1
+            keys = [("message", self._anonymous)]
+        root = self._find(keys[0])
+        for key in keys[1:]:
+            root = self._union(root, self._find(key))
+        self._messages.setdefault(root, []).append(message)
+        return root
+
+    def update(self, messages: Iterable[Email]) -> None:
+        """Adds all the messages."""
+        for message in messages:
+            self.add(message)
+
+    def stream(self, messages: Iterable[Email]) -> Generator[Email]:
+        """Adds the messages as they are yielded, so that grouping happens while ``read_mail`` streams.
+
+        Args:
+            messages: Emails from ``read_mail``
+
+        Yields:
+            Email:
+            Same Email object, after it was added to the index.
+        """
+        for message in messages:
+            self.add(message)
+            yield message
+
+    def conversation(self, message: Email) -> Union[Conversation, None]:
+        """Returns the conversation a message belongs to, if it was added already."""
+        keys = self.keys(message)
+        if not keys or keys[0] not in self._parent:
+            return None
+        root = self._find(keys[0])
+        return Conversation(key=root, messages=self._messages.get(root, []))
+
+    def conversations(self) -> List[Conversation]:
+        """Lists the conversations, with the largest first.
+
+        Returns:
+            List[Conversation]:
+            Conversations along with their messages.
+        """
+        return sorted(
+            (
+                Conversation(key=key, messages=messages)
+                for key, messages in self._messages.items()
+            ),
+            key=len,
+            reverse=True,
+        )
+
+    def __len__(self) -> int:
+        """Number of conversations."""
+        return len(self._messages)
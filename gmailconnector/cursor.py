@@ -0,0 +1,251 @@
+"""Resumable reads over a folder, in pages of messages ordered by UID."""
+
+import imaplib
+import json
+import re
+from collections.abc import Generator
+from typing import List, NamedTuple, Union
+
+from .instrumentation import metrics
+from .models.options import Category, Condition
+from .models.responder import Email, Response
+from .read_email import ReadEmail
+from .uids import compress
+
+UID = re.compile(rb"\bUID (\d+)")
+UIDVALIDITY = re.compile(rb"\bUIDVALIDITY (\d+)")
+
+
+class Position(NamedTuple):
+    """Point up to which a folder has been read, that stays valid across connections.
+
+    >>> Position
+
+    See Also:
+        UIDs only keep their meaning while the ``UIDVALIDITY`` of the folder stays the same.
+    """
+
+    folder: str
+    uidvalidity: int
+    uid: int
+
+    def dumps(self) -> str:
+        """Serializes the position as JSON, to be stored along with the results."""
+        return json.dumps(self._asdict(), separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, text: Union[str, bytes]) -> "Position":
+        """Loads a position serialized with ``dumps``"""
+        values = json.loads(text)
+        return cls(
+            folder=values["folder"],
+            uidvalidity=int(values["uidvalidity"]),
+            uid=int(values["uid"]),
+        )
+
+
+class ReadCursor:
+    """Reads the messages matching the filters in pages, and remembers the last UID read to resume from there.
+
+    >>> ReadCursor
+
+    See Also:
+        - Messages are read in ascending order of UID, so the position is a single number along with ``UIDVALIDITY``
+        - A page is read with a single ``UID FETCH``, and the position moves past it once it is returned.
+        - If the ``UIDVALIDITY`` of the folder changes, the UIDs are void and reading starts over from the beginning.
+        - Messages that arrive while reading are picked up once the earlier ones are done.
+    """
+
+    def __init__(
+        self,
+        reader: ReadEmail,
+        filters: Union[Category.__str__, Condition.__str__] = "ALL",
+        position: Union[Position, str] = None,
+        page_size: int = 50,
+        humanize_datetime: bool = False,
+    ):
+        """Sets up the cursor, the folder is searched when the first page is read.
+
+        Args:
+            reader: ``ReadEmail`` object for the folder, which may not be connected yet.
+            filters: Category or Condition
+            position: Position from an earlier cursor, or its serialized form, to skip what was already read.
+            page_size: Default number of messages in a page, which are fetched with a single command.
+            humanize_datetime: Converts received time to human-readable format.
+
+        Raises:
+            ValueError:
+            If the position is for another folder.
+        """
+        if type(filters) in (list, tuple):
+            filters = " ".join(filters)
+        if isinstance(position, (str, bytes)):
+            position = Position.loads(position)
+        self.reader = reader
+        if position and position.folder != self.folder:
+            raise ValueError(
+                f"position is for {position.folder}, not for {self.folder}"
+            )
+        self.filters = filters
+        self.page_size = max(1, page_size)
+        self.humanize_datetime = humanize_datetime
+        self.uidvalidity = position.uidvalidity if position else None
+        self.last_uid = position.uid if position else 0
+        self.pending: List[int] = []
+        self.page: List[int] = []
+        self.status: Union[Response, None] = None
+
+    @property
+    def folder(self) -> str:
+        """Folder of the reader, as sent to the server."""
+        folder = self.reader.env.folder
+        return getattr(folder, "value", folder)
+
+    @property
+    def position(self) -> Position:
+        """Position after the last message that was returned."""
+        return Position(
+            folder=self.folder, uidvalidity=self.uidvalidity or 0, uid=self.last_uid
+        )
+
+    def _uidvalidity(self) -> int:
+        """Reads ``UIDVALIDITY`` from the response to ``SELECT``, or asks for it with ``STATUS`` if it is not there."""
+        responses = self.reader.mail.untagged_responses.get("UIDVALIDITY")
+        if responses and responses[-1]:
+            return int(responses[-1])
+        _, data = self.reader.command("status", self.folder, "(UIDVALIDITY)")
+        match = UIDVALIDITY.search(data[0] or b"")
+        return int(match.group(1)) if match else 0
+
+    def _search(self) -> Union[Response, None]:
+        """Searches for the messages after the last UID read."""
+        if self.reader._authenticated is False:
+            status = self.reader.authenticate
+            if not status.ok:
+                return status
+        with metrics.phase("imap.search", folder=self.folder):
+            uidvalidity = self._uidvalidity()
+            if self.uidvalidity is not None and uidvalidity != self.uidvalidity:
+                metrics.count("cursor_resets", folder=self.folder)
+                self.last_uid = 0
+            self.uidvalidity = uidvalidity
+            return_code, data = self.reader.command(
+                "uid", "search", None, f"UID {self.last_uid + 1}:* {self.filters}"
+            )
+        if return_code != "OK":
+            metrics.count("errors", status=return_code)
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": 404,
+                    "body": "Unable to read emails.",
+                }
+            )
+        # "n:*" matches the largest UID even when it is below n, so it is dropped here
+        self.pending = sorted(
+            uid for uid in map(int, data[0].split()) if uid > self.last_uid
+        )
+
+    def _read(self, size: int) -> Response:
+        """Fetches the next page without moving the position.
+
+        See Also:
+            The messages of the previous page after the position, which were not read or failed to parse, come first.
+
+        Returns:
+            Response:
+            A custom response object with pairs of UID and email as body, and the last UID of the page as extra.
+        """
+        if self.page and self.page[-1] > self.last_uid:
+            # the previous page was not read to the end, so the rest of it is read again
+            self.pending = [
+                uid for uid in self.page if uid > self.last_uid
+            ] + self.pending
+        self.page = []
+        try:
+            if not self.pending:
+                if status := self._search():
+                    return status
+            page, self.pending = self.pending[:size], self.pending[size:]
+            self.page = page
+            if not page:
+                return Response(
+                    dictionary={"ok": True, "status": 204, "body": [], "count": 0}
+                )
+            items = (
+                "(X-GM-THRID RFC822)"
+                if "X-GM-EXT-1" in self.reader.mail.capabilities
+                else "(RFC822)"
+            )
+            with metrics.phase("imap.fetch", folder=self.folder, messages=len(page)):
+                _, data = self.reader.command("uid", "fetch", compress(page), items)
+        except (imaplib.IMAP4.error, OSError) as error:
+            # the page is searched again on the next call, from the last position
+            self.pending, self.page = [], []
+            return Response(
+                dictionary={"ok": False, "status": 503, "body": error.__str__()}
+            )
+        emails = {}
+        for each_response in data:
+            if isinstance(each_response, tuple) and (
+                uid := UID.search(each_response[0])
+            ):
+                metrics.count("messages_in")
+                metrics.count("bytes_in", len(each_response[1]))
+                emails[int(uid.group(1))] = self.reader.get_info(
+                    response_part=each_response, dt_flag=self.humanize_datetime
+                )
+        # messages deleted since the search are skipped, and the order of UIDs is kept regardless of the response
+        body = [(uid, emails[uid]) for uid in page if uid in emails]
+        return Response(
+            dictionary={
+                "ok": True,
+                "status": 200,
+                "body": body,
+                "extra": page[-1],
+                "count": len(body),
+            }
+        )
+
+    def next_page(self, size: int = None) -> Response:
+        """Reads the next page of messages, and moves the position past them.
+
+        Args:
+            size: Number of messages in the page, defaults to ``page_size``
+
+        Returns:
+            Response:
+            A custom response object with the emails as body and the serialized position after them as extra.
+            An empty page with status 204 means all the messages up to now have been read.
+        """
+        status = self._read(max(1, size or self.page_size))
+        if status.ok:
+            if status.extra:
+                self.last_uid = status.extra
+            status = Response(
+                dictionary={
+                    "ok": True,
+                    "status": status.status,
+                    "body": [message for _, message in status.body],
+                    "extra": self.position.dumps(),
+                    "count": status.count,
+                }
+            )
+        self.status = status
+        return status
+
+    def __iter__(self) -> Generator[Email]:
+        """Yields the emails page by page, until there are none left or a page fails, which is left in ``status``
+
+        See Also:
+            - The position moves with every email yielded, so it can be saved at any point of the iteration.
+            - If the iteration stops partway through a page, the rest of the page is read first on the next call.
+        """
+        while True:
+            self.status = status = self._read(self.page_size)
+            if not status.ok or status.status == 204:
+                return
+            for uid, message in status.body:
+                self.last_uid = uid
+                yield message
+            self.last_uid = status.extra
@@ -0,0 +1,233 @@
+"""Idempotency keys for sending, so that a request that is repeated does not deliver the same email twice."""
+
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Generator
+from typing import Dict, NamedTuple, Union
+
+from .instrumentation import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    message_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idempotency_updated ON idempotency (updated);
+"""
+
+
+def message_id(key: str, account: str) -> str:
+    """Derives the ``Message-ID`` of an email from its idempotency key, so that every attempt sends the same one.
+
+    Args:
+        key: Idempotency key given by the caller.
+        account: Email address of the sender, whose domain is used for the ID.
+
+    Returns:
+        str:
+        Message-ID in angle brackets, like ``<3f2a...@gmail.com>``
+    """
+    digest = hashlib.sha256(key.encode()).hexdigest()[:40]
+    return f"<{digest}@{account.rpartition('@')[2] or 'localhost'}>"
+
+
+class Record(NamedTuple):
+    """State of an idempotency key."""
+
+    state: str
+    message_id: str
+    updated: float
+
+
+class IdempotencyStore:
+    """Remembers the keys of the emails sent recently, in memory and optionally in a SQLite database.
+
+    >>> IdempotencyStore
+
+    See Also:
+        - A key is claimed before anything is sent, so a repeated request is answered without any network I/O.
+        - A claim that was never completed, like when the process died mid-send, expires after ``pending_timeout``
+        - The keys sent are kept in an LRU cache of ``capacity`` entries, and in the database for ``ttl`` seconds.
+        - With a ``path``, the keys are shared across processes and survive restarts.
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+
+    _shared: Dict[Union[str, None], "IdempotencyStore"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike] = None,
+        capacity: int = 10_000,
+        ttl: Union[int, float] = 86_400,
+        pending_timeout: Union[int, float] = 300,
+    ):
+        """Creates the cache, and the database table if a path is given.
+
+        Args:
+            path: Path to a SQLite database file, to share the keys across processes.
+            capacity: Number of keys kept in memory.
+            ttl: Seconds for which a key that was sent is remembered.
+            pending_timeout: Seconds after which a claim that was not completed is given up.
+        """
+        self.path = path
+        self.capacity = max(1, capacity)
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        self._cache: "OrderedDict[str, Record]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        if path:
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+            self.purge()
+
+    @classmethod
+    def shared(
+        cls, path: Union[str, os.PathLike] = None, **kwargs
+    ) -> "IdempotencyStore":
+        """Returns the store for a database, which is shared by all the objects within the process.
+
+        Args:
+            path: Path to a SQLite database file, or ``None`` for a store in memory.
+            **kwargs: Arguments for ``IdempotencyStore``, used only when the store is created.
+
+        Returns:
+            IdempotencyStore:
+            Store for the path.
+        """
+        path = os.fspath(path) if path else None
+        with cls._shared_lock:
+            store = cls._shared.get(path)
+            if store is None:
+                store = cls._shared[path] = cls(path=path, **kwargs)
+            return store
+
+    @contextlib.contextmanager
+    def _connect(self) -> Generator[sqlite3.Connection]:
+        """Creates a new connection for every operation, so that the database can be shared across threads."""
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _live(self, record: Union[Record, None], now: float) -> bool:
+        """Checks if a record still holds its key."""
+        if record is None:
+            return False
+        if record.state == self.SENT:
+            return now - record.updated < self.ttl
+        return now - record.updated < self.pending_timeout
+
+    def _remember(self, key: str, record: Record) -> None:
+        """Puts a record in the cache, dropping the least recently used ones beyond the capacity."""
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    def claim(self, key: str, message_id: str) -> Union[Record, None]:
+        """Reserves a key for an email that is about to be sent.
+
+        Args:
+            key: Idempotency key given by the caller.
+            message_id: Message-ID of the email.
+
+        Returns:
+            Record:
+            ``None`` if the key was reserved, or the record that holds it if it was sent or is being sent.
+        """
+        now = time.time()
+        with self._lock:
+            record = self._cache.get(key)
+            # keys that were sent are answered from memory, which needs no lock on the database
+            if record and record.state == self.SENT and self._live(record, now):
+                self._cache.move_to_end(key)
+                metrics.count("idempotent_hits", state=record.state)
+                return record
+            if not self.path:
+                if self._live(record, now):
+                    metrics.count("idempotent_hits", state=record.state)
+                    return record
+                self._remember(key, Record(self.PENDING, message_id, now))
+                return None
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT state, message_id, updated FROM idempotency WHERE key = ?",
+                (key,),
+            ).fetchone()
+            record = Record(*row) if row else None
+            if self._live(record, now):
+                connection.execute("COMMIT")
+                if record.state == self.SENT:
+                    with self._lock:
+                        self._remember(key, record)
+                metrics.count("idempotent_hits", state=record.state)
+                return record
+            connection.execute(
+                "INSERT OR REPLACE INTO idempotency (key, message_id, state, updated) VALUES (?, ?, ?, ?)",
+                (key, message_id, self.PENDING, now),
+            )
+            connection.execute("COMMIT")
+        return None
+
+    def sent(self, key: str, message_id: str) -> None:
+        """Marks a claimed key as sent, so that it is remembered for ``ttl`` seconds."""
+        record = Record(self.SENT, message_id, time.time())
+        with self._lock:
+            self._remember(key, record)
+            self._writes += 1
+            purge = self.path and self._writes % self.capacity == 0
+        if self.path:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO idempotency (key, message_id, state, updated) VALUES (?, ?, ?, ?)",
+                    (key, record.message_id, record.state, record.updated),
+                )
+            if purge:
+                self.purge()
+
+    def release(self, key: str) -> None:
+        """Gives up a claimed key after the email could not be sent, so that it can be sent again."""
+        with self._lock:
+            record = self._cache.get(key)
+            if record and record.state == self.PENDING:
+                del self._cache[key]
+        if self.path:
+            with self._connect() as connection:
+                connection.execute(
+                    "DELETE FROM idempotency WHERE key = ? AND state = ?",
+                    (key, self.PENDING),
+                )
+
+    def purge(self) -> int:
+        """Deletes the keys that have expired from the database.
+
+        Returns:
+            int:
+            Number of keys deleted.
+        """
+        if not self.path:
+            return 0
+        now = time.time()
+        with self._connect() as connection:
+            return connection.execute(
+                "DELETE FROM idempotency WHERE (state = ? AND updated < ?) OR (state = ? AND updated < ?)",
+                (self.SENT, now - self.ttl, self.PENDING, now - self.pending_timeout),
+            ).rowcount
+
+    def __len__(self) -> int:
+        """Number of keys held in memory."""
+        return len(self._cache)
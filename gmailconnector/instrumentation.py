@@ -0,0 +1,306 @@
+import contextlib
+import smtplib
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+NULL_CONTEXT = contextlib.nullcontext()
+
+
+class Timing(NamedTuple):
+    """Duration of a network phase, passed to the subscribers."""
+
+    phase: str
+    duration: float
+    error: Optional[str]
+    attributes: Dict[str, Any]
+
+
+class Summary:
+    """Aggregated durations of a phase."""
+
+    __slots__ = ("count", "errors", "total", "maximum")
+
+    def __init__(self):
+        """Starts with no observations."""
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def json(self) -> Dict[str, float]:
+        """Returns the summary as a dictionary."""
+        return dict(
+            count=self.count,
+            errors=self.errors,
+            total=self.total,
+            average=self.total / self.count if self.count else 0.0,
+            maximum=self.maximum,
+        )
+
+
+class _Phase:
+    """Context manager that times a phase and reports it on exit."""
+
+    __slots__ = ("instrumentation", "name", "attributes", "start")
+
+    def __init__(self, instrumentation: "Instrumentation", name: str, attributes: dict):
+        """Stores the phase name and its attributes."""
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> "_Phase":
+        """Starts the timer."""
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Stops the timer and reports the duration, along with the error if any."""
+        self.instrumentation.observe(
+            Timing(
+                phase=self.name,
+                duration=time.perf_counter() - self.start,
+                error=exc_type.__name__ if exc_type else None,
+                attributes=self.attributes,
+            )
+        )
+
+
+class Instrumentation:
+    """Collects the time taken by each network phase and counters, and passes them on to the subscribers.
+
+    >>> Instrumentation
+
+    """
+
+    def __init__(self):
+        """Instantiates the object with instrumentation disabled."""
+        self.enabled = False
+        self.phases: Dict[str, Summary] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], float] = {}
+        self._on_phase: List[Callable[[Timing], None]] = []
+        self._on_count: List[Callable[[str, float, Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """Starts collecting timings and counters."""
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stops collecting timings and counters."""
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Clears the aggregated timings and counters."""
+        with self._lock:
+            self.phases.clear()
+            self.counters.clear()
+
+    def subscribe(
+        self,
+        on_phase: Callable[[Timing], None] = None,
+        on_count: Callable[[str, float, Dict[str, Any]], None] = None,
+    ) -> None:
+        """Registers callbacks that are invoked for every phase and every counter increment.
+
+        Args:
+            on_phase: Callback that receives a ``Timing`` object.
+            on_count: Callback that receives the name of the counter, the increment and the labels.
+        """
+        if on_phase:
+            self._on_phase.append(on_phase)
+        if on_count:
+            self._on_count.append(on_count)
+
+    def phase(self, name: str, **attributes) -> contextlib.AbstractContextManager:
+        """Times a network phase, like ``smtp.connect`` or ``imap.fetch``
+
+        Args:
+            name: Name of the phase.
+            **attributes: Additional information passed on to the subscribers.
+
+        Returns:
+            contextlib.AbstractContextManager:
+            Context manager that times the phase, or a no-op context manager when disabled.
+        """
+        if not self.enabled:
+            return NULL_CONTEXT
+        return _Phase(self, name, attributes)
+
+    def lookup(self, host: str, port: int) -> None:
+        """Times the DNS lookup for a host separately, so that the connect phase that follows is mostly TCP.
+
+        See Also:
+            Only runs when enabled, and the connection that follows resolves the host again.
+            The second lookup is served from the resolver cache, where one is available.
+        """
+        if not self.enabled:
+            return
+        try:
+            with self.phase("dns", host=host):
+                socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except socket.error:
+            pass  # the error is reported by the connection that follows
+
+    def observe(self, timing: Timing) -> None:
+        """Aggregates a timing and passes it on to the subscribers."""
+        with self._lock:
+            summary = self.phases.get(timing.phase)
+            if summary is None:
+                summary = self.phases[timing.phase] = Summary()
+            summary.count += 1
+            summary.total += timing.duration
+            summary.maximum = max(summary.maximum, timing.duration)
+            if timing.error:
+                summary.errors += 1
+        for callback in self._on_phase:
+            callback(timing)
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """Increments a counter, like ``bytes_out`` or ``errors``
+
+        Args:
+            name: Name of the counter.
+            value: Value to increment the counter by.
+            **labels: Labels for the counter, like ``status``
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        for callback in self._on_count:
+            callback(name, value, labels)
+
+    def error(self, error: Exception) -> None:
+        """Counts an error by its status, SMTP reply code when available or the name of the exception otherwise.
+
+        Args:
+            error: Exception that was raised.
+        """
+        if not self.enabled:
+            return
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            for code, _ in error.recipients.values():
+                self.count("errors", status=code)
+        elif isinstance(error, smtplib.SMTPResponseException):
+            self.count("errors", status=error.smtp_code)
+        else:
+            self.count("errors", status=type(error).__name__)
+
+    def json(self) -> Dict[str, Any]:
+        """Returns the aggregated timings and counters as a dictionary."""
+        with self._lock:
+            return dict(
+                phases={name: summary.json() for name, summary in self.phases.items()},
+                counters={
+                    name
+                    + (
+                        "{%s}" % ",".join(f"{k}={v}" for k, v in labels)
+                        if labels
+                        else ""
+                    ): value
+                    for (name, labels), value in self.counters.items()
+                },
+            )
+
+
+class PrometheusExporter:
+    """Exports the timings and counters to ``prometheus_client``
+
+    >>> PrometheusExporter
+
+    """
+
+    def __init__(self, instrumentation: Instrumentation, registry: Any = None):
+        """Creates a histogram for the phases and subscribes to the instrumentation.
+
+        Args:
+            instrumentation: Instrumentation object to subscribe to.
+            registry: Collector registry for the metrics. Defaults to the global registry.
+        """
+        try:
+            import prometheus_client
+        except ImportError as error:
+            raise ImportError(
+                "prometheus_client is required for PrometheusExporter: pip install prometheus-client"
+            ) from error
+        self._prometheus = prometheus_client
+        self._registry = registry or prometheus_client.REGISTRY
+        self._counters = {}
+        self.phases = prometheus_client.Histogram(
+            "gmailconnector_phase_seconds",
+            "Time taken by each network phase.",
+            ["phase", "error"],
+            registry=self._registry,
+        )
+        instrumentation.subscribe(on_phase=self.on_phase, on_count=self.on_count)
+
+    def on_phase(self, timing: Timing) -> None:
+        """Records the duration of a phase."""
+        self.phases.labels(phase=timing.phase, error=timing.error or "").observe(
+            timing.duration
+        )
+
+    def on_count(self, name: str, value: float, labels: Dict[str, Any]) -> None:
+        """Increments the counter, creating it the first time."""
+        key = (name, tuple(sorted(labels)))
+        if key not in self._counters:
+            self._counters[key] = self._prometheus.Counter(
+                f"gmailconnector_{name}",
+                f"Counter for {name}.",
+                sorted(labels),
+                registry=self._registry,
+            )
+        counter = self._counters[key]
+        (counter.labels(**labels) if labels else counter).inc(value)
+
+
+class OpenTelemetryExporter:
+    """Exports the timings and counters to ``opentelemetry``
+
+    >>> OpenTelemetryExporter
+
+    """
+
+    def __init__(self, instrumentation: Instrumentation, meter: Any = None):
+        """Creates a histogram for the phases and subscribes to the instrumentation.
+
+        Args:
+            instrumentation: Instrumentation object to subscribe to.
+            meter: Meter for the metrics. Defaults to a meter from the global meter provider.
+        """
+        try:
+            from opentelemetry import metrics as otel_metrics
+        except ImportError as error:
+            raise ImportError(
+                "opentelemetry-api is required for OpenTelemetryExporter: pip install opentelemetry-api"
+            ) from error
+        self._meter = meter or otel_metrics.get_meter("gmailconnector")
+        self._counters = {}
+        self.phases = self._meter.create_histogram(
+            "gmailconnector.phase.duration",
+            unit="s",
+            description="Time taken by each network phase.",
+        )
+        instrumentation.subscribe(on_phase=self.on_phase, on_count=self.on_count)
+
+    def on_phase(self, timing: Timing) -> None:
+        """Records the duration of a phase."""
+        self.phases.record(
+            timing.duration,
+            attributes={"phase": timing.phase, "error": timing.error or ""},
+        )
+
+    def on_count(self, name: str, value: float, labels: Dict[str, Any]) -> None:
+        """Increments the counter, creating it the first time."""
+        if name not in self._counters:
+            self._counters[name] = self._meter.create_counter(f"gmailconnector.{name}")
+        self._counters[name].add(
+            value, attributes={k: str(v) for k, v in labels.items()}
+        )
+
+
+metrics = Instrumentation()
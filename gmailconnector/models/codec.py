@@ -0,0 +1,233 @@
+"""Versioned binary and JSON encoding for ``Response``, ``Email`` and lists of them, to pass results across processes.
+
+>>> data = encode(emails)
+>>> emails = decode(data)
+
+"""
+
+import base64
+import json
+import marshal
+from datetime import datetime
+from email.header import Header
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Union
+
+from .responder import EMAIL_FIELDS, Email, Response
+
+VERSION = 1
+MAGIC = b"GC"
+MARSHAL = 0
+MSGPACK = 1
+TAG = "__gc__"
+
+
+@lru_cache(maxsize=None)
+def _msgpack():
+    """Imports ``msgpack`` if installed, which is faster and more compact than ``marshal``"""
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+def _email_row(message: Email, text: bool) -> list:
+    """Packs an email into a list of its fields, in the order of ``EMAIL_FIELDS``"""
+    subject, date_time = message.subject, message.date_time
+    return [
+        message.sender,
+        message.sender_email,
+        subject if subject is None or type(subject) is str else str(subject),
+        (
+            {TAG: "datetime", "v": date_time.isoformat()}
+            if isinstance(date_time, datetime)
+            else date_time
+        ),
+        message.body,
+        [pack(attachment, text) for attachment in message.attachments],
+        message.message_id,
+        message.in_reply_to,
+        list(message.references),
+        message.thread_id,
+    ]
+
+
+def pack(value: Any, text: bool = False) -> Any:
+    """Turns a value into plain lists, dicts, strings and numbers, with the objects tagged to be rebuilt by ``unpack``
+
+    Args:
+        value: Value to be packed.
+        text: Packs for JSON, where bytes and dicts with keys other than strings are tagged as well.
+
+    Returns:
+        Any:
+        Plain value that can be serialized.
+    """
+    if (
+        value is None
+        or isinstance(value, (bool, int, float))
+        and not isinstance(value, Enum)
+    ):
+        return value
+    if isinstance(value, str):
+        return value.value if isinstance(value, Enum) else value
+    if isinstance(value, Enum):
+        return pack(value.value, text)
+    if isinstance(value, bytes):
+        return {TAG: "bytes", "v": base64.b64encode(value).decode()} if text else value
+    if isinstance(value, (list, tuple, set)):
+        if value and all(type(item) is Email for item in value):
+            return {TAG: "emails", "v": [_email_row(item, text) for item in value]}
+        return [pack(item, text) for item in value]
+    if isinstance(value, dict):
+        if text and not all(isinstance(key, str) for key in value):
+            return {
+                TAG: "map",
+                "v": [[pack(k, text), pack(v, text)] for k, v in value.items()],
+            }
+        return {pack(k, text): pack(v, text) for k, v in value.items()}
+    if isinstance(value, Email):
+        return {TAG: "email", "v": _email_row(value, text)}
+    if isinstance(value, Response):
+        return {TAG: "response", "v": pack(value.raw, text)}
+    if isinstance(value, datetime):
+        return {TAG: "datetime", "v": value.isoformat()}
+    if isinstance(value, Header):
+        return str(value)
+    if hasattr(value, "__slots__") and hasattr(value, "json"):  # Attachment
+        return {TAG: "attachment", "v": pack(value.json(), text)}
+    return str(value)
+
+
+def _email(row: list) -> Email:
+    """Rebuilds an email from a packed row."""
+    values = dict(zip(EMAIL_FIELDS, row))
+    if isinstance(values["date_time"], dict):
+        values["date_time"] = unpack(values["date_time"])
+    if values["attachments"]:
+        values["attachments"] = unpack(values["attachments"])
+    return Email(dictionary=values)
+
+
+def _attachment(values: dict) -> Any:
+    """Rebuilds an attachment along with where it was saved."""
+    from ..attachments import Attachment
+
+    attachment = Attachment.__new__(Attachment)
+    for name in Attachment.__slots__:
+        setattr(attachment, name, values.get(name))
+    return attachment
+
+
+def unpack(value: Any) -> Any:
+    """Rebuilds the objects in a value packed by ``pack``"""
+    if isinstance(value, list):
+        return [unpack(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    tag = value.get(TAG)
+    if tag is None:
+        return {unpack(k): unpack(v) for k, v in value.items()}
+    packed = value["v"]
+    if tag == "emails":
+        return [_email(row) for row in packed]
+    if tag == "email":
+        return _email(packed)
+    if tag == "response":
+        return Response(dictionary=unpack(packed))
+    if tag == "datetime":
+        return datetime.fromisoformat(packed)
+    if tag == "bytes":
+        return base64.b64decode(packed)
+    if tag == "map":
+        return {unpack(k): unpack(v) for k, v in packed}
+    if tag == "attachment":
+        return _attachment(unpack(packed))
+    raise ValueError(f"Unknown tag {tag!r}")
+
+
+def encode(value: Any, binary: bool = True) -> Union[bytes, str]:
+    """Encodes a ``Response``, an ``Email``, or any list or dict of them.
+
+    Args:
+        value: Value to be encoded.
+        binary: Encodes to compact bytes when ``True``, or to a JSON string when ``False``
+
+    See Also:
+        - Bytes start with ``GC``, the version and the format, and use ``msgpack`` if installed or ``marshal`` if not.
+        - A list of emails is packed as rows of fields, without repeating the names of the fields.
+
+    Returns:
+        bytes | str:
+        Encoded value, that can be decoded with ``decode``
+    """
+    if not binary:
+        return json.dumps(
+            {"version": VERSION, "data": pack(value, text=True)}, separators=(",", ":")
+        )
+    packed = pack(value)
+    if msgpack := _msgpack():
+        return (
+            MAGIC + bytes((VERSION, MSGPACK)) + msgpack.packb(packed, use_bin_type=True)
+        )
+    return MAGIC + bytes((VERSION, MARSHAL)) + marshal.dumps(packed, 4)
+
+
+def decode(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Decodes a value encoded by ``encode``, in either format.
+
+    Args:
+        data: Bytes or JSON string.
+
+    Raises:
+        ValueError:
+        If the data was not encoded by ``encode``, by a newer version, or is truncated or corrupt.
+
+    Notes:
+        Without ``msgpack``, bytes are loaded with ``marshal``, which is not safe against data crafted to exploit it.
+        Only decode bytes from a trusted source, like another process of the same application.
+
+    Returns:
+        Any:
+        Decoded value, with the ``Response`` and ``Email`` objects rebuilt.
+    """
+    if isinstance(data, str):
+        document = json.loads(data)
+        if (
+            not isinstance(document, dict)
+            or not isinstance(document.get("version"), int)
+            or "data" not in document
+        ):
+            raise ValueError("Not encoded by gmailconnector")
+        if document["version"] > VERSION:
+            raise ValueError(f"Unsupported version {document['version']}")
+        packed = document["data"]
+    else:
+        data = memoryview(data)
+        if data[:2] != MAGIC or len(data) < 4:
+            raise ValueError("Not encoded by gmailconnector")
+        version, fmt = data[2], data[3]
+        if version > VERSION:
+            raise ValueError(f"Unsupported version {version}")
+        if fmt not in (MARSHAL, MSGPACK):
+            raise ValueError(f"Unsupported format {fmt}")
+        if fmt == MSGPACK and not (msgpack := _msgpack()):
+            raise ImportError(
+                "msgpack is required to decode this data: pip install msgpack"
+            )
+        try:
+            if fmt == MSGPACK:
+                packed = msgpack.unpackb(data[4:], raw=False, strict_map_key=False)
+            else:
+                packed = marshal.loads(data[4:])
+        # EOFError and TypeError from marshal, various from msgpack
+        except Exception as error:
+            raise ValueError(f"Corrupt data: {error}") from error
+    try:
+        return unpack(packed)
+    except ValueError:
+        raise
+    except (TypeError, KeyError, IndexError, AttributeError) as error:
+        raise ValueError(f"Corrupt data: {error!r}") from error
@@ -1,13 +1,34 @@
 import os
 from enum import Enum
-from typing import Union
+from functools import lru_cache
+from typing import Any, Optional, Tuple, Type, TypeVar, Union
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import AfterValidator, BaseModel, Field
 from pydantic_settings import BaseSettings
+from typing_extensions import Annotated, Unpack
 
 from .options import Folder
 
 
+def email_str(value: str) -> str:
+    """Validates an email address the same way as ``EmailStr``, but imports ``email_validator`` on first use.
+
+    Args:
+        value: Email address to be validated.
+
+    Returns:
+        str:
+        Normalized email address.
+    """
+    from pydantic.networks import import_email_validator, validate_email
+
+    import_email_validator()
+    return validate_email(value)[1]
+
+
+EmailStr = Annotated[str, AfterValidator(email_str)]
+
+
 class Encryption(str, Enum):
     """Enum wrapper for TLS and SSL encryption.
 
@@ -49,6 +70,9 @@ class EgressConfig(BaseSettings):
     gmail_host: str = "smtp.gmail.com"
     encryption: Encryption = Encryption.TLS
     timeout: int = 10
+    rate_limit: Optional[float] = Field(default=None, gt=0)
+    rate_limit_db: Optional[str] = None
+    idempotency_db: Optional[str] = None
 
     class Config:
         """Environment variables configuration."""
@@ -70,6 +94,7 @@ class IngressConfig(BaseSettings):
     folder: Folder = Folder.inbox
     gmail_host: str = "imap.gmail.com"
     timeout: Union[int, float] = 10
+    compress: bool = False
 
     class Config:
         """Environment variables configuration."""
@@ -77,3 +102,91 @@ class IngressConfig(BaseSettings):
         env_prefix = ""
         env_file = os.environ.get("env_file", os.environ.get("ENV_FILE", ".env"))
         extra = "allow"
+
+
+Settings = TypeVar("Settings", EgressConfig, IngressConfig)
+
+
+@lru_cache(maxsize=128)
+def _settings(
+    model: Type[Settings],
+    kwargs: Tuple[Tuple[str, Any], ...],
+    env_file: Tuple[str, Optional[int], Optional[int]],
+    environ: Tuple[Optional[str], ...],
+) -> Settings:
+    """Builds the settings, memoized on the arguments and the state of the env file and env vars they are read from."""
+    return model(**dict(kwargs))
+
+
+def _env_file(model: Type[Settings]) -> Tuple[str, Optional[int], Optional[int]]:
+    """Gets the path of the env file with its modified time and size, so that the cache misses when it changes."""
+    path = os.path.abspath(model.model_config.get("env_file") or ".env")
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def load_config(model: Type[Settings], **kwargs) -> Settings:
+    """Loads the settings for a model, reusing the object built earlier for the same arguments, env file and env vars.
+
+    Args:
+        model: ``EgressConfig`` or ``IngressConfig``
+        **kwargs: Arguments for the model.
+
+    Returns:
+        EgressConfig | IngressConfig:
+        Settings object that is shared by every caller with the same arguments.
+
+    See Also:
+        - The ``.env`` file and env vars are still checked on each call, but only parsed and validated when changed.
+        - Env vars are checked in lower and upper case, e.g. ``gmail_user`` and ``GMAIL_USER``
+        - The shared object should be treated as read-only, use ``model_copy(update=...)`` to make changes.
+        - Use ``load_config.cache_clear()`` to drop the settings that were built so far.
+    """
+    try:
+        key = tuple(sorted(kwargs.items()))
+        hash(key)
+    except TypeError:  # unhashable arguments cannot be memoized
+        return model(**kwargs)
+    # looking up the names is much faster than scanning os.environ, which decodes every key
+    environ = tuple(
+        os.environ.get(name)
+        for field in model.model_fields
+        for name in (field, field.upper())
+    )
+    return _settings(model, key, _env_file(model), environ)
+
+
+load_config.cache_clear = _settings.cache_clear
+
+
+def egress_config(
+    config: EgressConfig = None, **kwargs: "Unpack[EgressConfig]"
+) -> EgressConfig:
+    """Loads the settings for ``SendEmail``/``SendSMS``, see ``load_config``
+
+    Args:
+        config: Prebuilt settings, that are returned as is when there are no keyword arguments to override.
+    """
+    if config is not None:
+        if not kwargs:
+            return config
+        kwargs = {**config.model_dump(), **kwargs}
+    return load_config(EgressConfig, **kwargs)
+
+
+def ingress_config(
+    config: IngressConfig = None, **kwargs: "Unpack[IngressConfig]"
+) -> IngressConfig:
+    """Loads the settings for ``ReadEmail``, see ``load_config``
+
+    Args:
+        config: Prebuilt settings, that are returned as is when there are no keyword arguments to override.
+    """
+    if config is not None:
+        if not kwargs:
+            return config
+        kwargs = {**config.model_dump(), **kwargs}
+    return load_config(IngressConfig, **kwargs)
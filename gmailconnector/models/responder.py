@@ -1,5 +1,18 @@
 from datetime import datetime
-from typing import Any, Union
+from typing import Any, List, Union
+
+EMAIL_FIELDS = (
+    "sender",
+    "sender_email",
+    "subject",
+    "date_time",
+    "body",
+    "attachments",
+    "message_id",
+    "in_reply_to",
+    "references",
+    "thread_id",
+)
 
 
 class Response:
@@ -9,6 +22,8 @@ class Response:
 
     """
 
+    __slots__ = ("raw",)
+
     def __init__(self, dictionary: dict):
         """Extracts the properties ``ok``, ``status`` and ``body`` from a dictionary.
 
@@ -76,10 +91,43 @@ class Response:
         """
         return self.raw.get("extra")
 
+    @property
+    def account(self) -> Union[str, None]:
+        """Returns the account that sent an email, when it was sent through ``ShardedSender``
+
+        Returns:
+            str:
+            Returns the email address of the account.
+        """
+        return self.raw.get("account")
+
+    def encode(self, binary: bool = True) -> Union[bytes, str]:
+        """Encodes the response to compact bytes, or to a JSON string.
+
+        Args:
+            binary: Encodes to bytes when ``True``, or to JSON when ``False``
+
+        Returns:
+            bytes | str:
+            Encoded response, that can be decoded with ``Response.decode``
+        """
+        from .codec import encode
+
+        return encode(self, binary)
+
+    @staticmethod
+    def decode(data: Union[bytes, str]) -> "Response":
+        """Decodes a response encoded with ``encode``"""
+        from .codec import decode
+
+        return decode(data)
+
 
 class Email:
     """Turns a dictionary into an Email object."""
 
+    __slots__ = EMAIL_FIELDS
+
     def __init__(self, dictionary: dict):
         """Creates an object and inserts the key value pairs as members of the class.
 
@@ -91,3 +139,50 @@ class Email:
         self.subject: str = dictionary["subject"]
         self.date_time: Union[str, "datetime"] = dictionary["date_time"]
         self.body: str = dictionary["body"]
+        self.attachments: list = dictionary.get("attachments", [])
+        self.message_id: Union[str, None] = dictionary.get("message_id")
+        self.in_reply_to: Union[str, None] = dictionary.get("in_reply_to")
+        self.references: List[str] = dictionary.get("references", [])
+        self.thread_id: Union[int, None] = dictionary.get("thread_id")
+
+    def json(self) -> dict:
+        """Returns the fields as a dictionary, with the subject as a string.
+
+        Returns:
+            dict:
+            Returns the fields of the email.
+        """
+        values = {field: getattr(self, field) for field in EMAIL_FIELDS}
+        if values["subject"] is not None:
+            values["subject"] = str(values["subject"])
+        return values
+
+    def encode(self, binary: bool = True) -> Union[bytes, str]:
+        """Encodes the email to compact bytes, or to a JSON string.
+
+        Args:
+            binary: Encodes to bytes when ``True``, or to JSON when ``False``
+
+        Returns:
+            bytes | str:
+            Encoded email, that can be decoded with ``Email.decode``
+        """
+        from .codec import encode
+
+        return encode(self, binary)
+
+    @staticmethod
+    def decode(data: Union[bytes, str]) -> "Email":
+        """Decodes an email encoded with ``encode``"""
+        from .codec import decode
+
+        return decode(data)
+
+    def __reduce__(self) -> tuple:
+        """Pickles the fields by position, with the subject as a string instead of a ``Header``"""
+        return _email, (tuple(self.json().values()),)
+
+
+def _email(values: tuple) -> Email:
+    """Rebuilds an email from the values of its fields, in the order of ``EMAIL_FIELDS``"""
+    return Email(dictionary=dict(zip(EMAIL_FIELDS, values)))
@@ -0,0 +1,394 @@
+import contextlib
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import smtplib
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple, Union
+
+from typing_extensions import Unpack
+
+from .models.config import EgressConfig, egress_config
+from .models.responder import Response
+from .send_email import SendEmail, validate_email
+
+default_logger = logging.getLogger("outbox")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    idempotency_key TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+
+class Status:
+    """Wrapper for the status of an email in the outbox."""
+
+    queued: str = "queued"
+    sending: str = "sending"
+    sent: str = "sent"
+    dead: str = "dead"
+
+
+class Outbox:
+    """Durable queue of outbound emails, stored in a SQLite database.
+
+    >>> Outbox
+
+    """
+
+    def __init__(self, filepath: Union[str, os.PathLike] = "outbox.db"):
+        """Creates the database and the table if they don't exist already.
+
+        Args:
+            filepath: Path to the SQLite database file.
+        """
+        self.filepath = filepath
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self) -> Generator[sqlite3.Connection]:
+        """Creates a new connection for every operation, so that the outbox can be shared across threads and processes."""
+        connection = sqlite3.connect(self.filepath, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(
+        self, idempotency_key: str = None, delay: Union[int, float] = 0, **kwargs
+    ) -> str:
+        """Adds an email to the outbox and returns right away.
+
+        Args:
+            idempotency_key: Unique key for the email, an email with a key that is already in the outbox is ignored.
+            delay: Seconds to wait before the email is sent.
+            **kwargs: Arguments for ``SendEmail.send_email``
+
+        Raises:
+            TypeError:
+            If the arguments are not accepted by ``SendEmail.send_email``
+            AddressFormatError:
+            If any of the email addresses is invalid.
+
+        Returns:
+            str:
+            ID of the email in the outbox. ID of the existing email, if the idempotency key was used already.
+        """
+        inspect.signature(SendEmail.send_email).bind(None, **kwargs)
+        for key in ("recipient", "cc", "bcc"):
+            if kwargs.get(key):
+                validate_email(address=kwargs[key])
+        now = time.time()
+        identifier = uuid.uuid4().hex
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO outbox (id, idempotency_key, payload, status, next_attempt, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    identifier,
+                    idempotency_key,
+                    json.dumps(kwargs),
+                    Status.queued,
+                    now + delay,
+                    now,
+                    now,
+                ),
+            )
+            if idempotency_key is None:
+                return identifier
+            return connection.execute(
+                "SELECT id FROM outbox WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()[0]
+
+    def claim(
+        self, limit: int, lease: Union[int, float] = 300
+    ) -> List[Tuple[str, Dict[str, Any], int]]:
+        """Claims the emails that are due, so that no other worker picks them up until the lease expires.
+
+        Args:
+            limit: Maximum number of emails to claim.
+            lease: Seconds after which an email that is still being sent, is considered abandoned.
+
+        Returns:
+            List[Tuple[str, Dict[str, Any], int]]:
+            List of ID, arguments for ``send_email`` and the number of previous attempts for each email.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(
+                    "SELECT id, payload, attempts FROM outbox WHERE status IN (?, ?) AND next_attempt <= ? "
+                    "ORDER BY next_attempt LIMIT ?",
+                    (Status.queued, Status.sending, now, limit),
+                ).fetchall()
+                connection.executemany(
+                    "UPDATE outbox SET status = ?, next_attempt = ?, updated = ? WHERE id = ?",
+                    [(Status.sending, now + lease, now, row[0]) for row in rows],
+                )
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        return [(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def _update(self, identifier: str, **columns) -> None:
+        """Updates the columns of an email."""
+        columns["updated"] = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                f"UPDATE outbox SET {', '.join(f'{key} = ?' for key in columns)} WHERE id = ?",
+                (*columns.values(), identifier),
+            )
+
+    def complete(self, identifier: str) -> None:
+        """Marks an email as sent."""
+        self._update(identifier, status=Status.sent, error=None)
+
+    def retry(
+        self, identifier: str, attempts: int, delay: Union[int, float], error: str
+    ) -> None:
+        """Schedules an email to be sent again after a delay."""
+        self._update(
+            identifier,
+            status=Status.queued,
+            attempts=attempts,
+            next_attempt=time.time() + delay,
+            error=error,
+        )
+
+    def dead_letter(self, identifier: str, attempts: int, error: str) -> None:
+        """Marks an email as failed, so that it is not attempted again."""
+        self._update(identifier, status=Status.dead, attempts=attempts, error=error)
+
+    def requeue(self, identifier: str) -> None:
+        """Moves an email from dead letters back to the queue, to be sent right away."""
+        self._update(
+            identifier,
+            status=Status.queued,
+            attempts=0,
+            next_attempt=time.time(),
+        )
+
+    def status(self, identifier: str) -> Union[Dict[str, Any], None]:
+        """Gets the status, number of attempts and the last error for an email."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT status, attempts, error FROM outbox WHERE id = ?", (identifier,)
+            ).fetchone()
+        if row:
+            return dict(status=row[0], attempts=row[1], error=row[2])
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """Lists the emails that failed to be sent."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, payload, attempts, error FROM outbox WHERE status = ? ORDER BY updated",
+                (Status.dead,),
+            ).fetchall()
+        return [
+            dict(id=row[0], payload=json.loads(row[1]), attempts=row[2], error=row[3])
+            for row in rows
+        ]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of emails in each status."""
+        with self._connect() as connection:
+            return dict(
+                connection.execute(
+                    "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+                ).fetchall()
+            )
+
+    def purge(self, older_than: Union[int, float] = 7 * 86_400) -> int:
+        """Deletes the sent emails that are older than the given number of seconds.
+
+        See Also:
+            Idempotency keys of the purged emails can be used again.
+
+        Returns:
+            int:
+            Number of emails deleted.
+        """
+        with self._connect() as connection:
+            return connection.execute(
+                "DELETE FROM outbox WHERE status = ? AND updated < ?",
+                (Status.sent, time.time() - older_than),
+            ).rowcount
+
+
+class OutboxWorker:
+    """Drains the outbox using a pool of SMTP connections, with retries and dead-lettering.
+
+    >>> OutboxWorker
+
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        connections: int = 2,
+        max_attempts: int = 8,
+        backoff: Union[int, float] = 2,
+        max_backoff: Union[int, float] = 600,
+        poll_interval: Union[int, float] = 1,
+        logger: logging.Logger = default_logger,
+        **kwargs: "Unpack[EgressConfig]",
+    ):
+        """Initiates the worker with the outbox and the arguments for ``SendEmail``.
+
+        Args:
+            outbox: Outbox to drain.
+            connections: Number of SMTP connections to send emails in parallel.
+            max_attempts: Number of attempts before an email is moved to dead letters.
+            backoff: Delay in seconds before the first retry, that is doubled for every attempt after.
+            max_backoff: Maximum delay in seconds between retries.
+            poll_interval: Seconds to wait before checking the outbox again, when it is empty.
+            logger: Bring your own logger.
+
+        Keyword Args:
+            gmail_user: Gmail username to authenticate SMTP lib.
+            gmail_pass: Gmail password to authenticate SMTP lib.
+            timeout: Connection timeout for SMTP lib.
+            encryption: Type of encryption to be used.
+            gmail_host: Hostname for gmail's smtp server.
+        """
+        self.outbox = outbox
+        self.connections = connections
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.env = egress_config(**kwargs)
+        self._pool = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sender(self) -> SendEmail:
+        """Gets a connection from the pool, or creates a new one."""
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return SendEmail(config=self.env)
+
+    def _delay(self, attempts: int) -> float:
+        """Exponential backoff with jitter, for the given number of attempts."""
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    def process(self, identifier: str, payload: Dict[str, Any], attempts: int) -> None:
+        """Sends an email from the outbox, and updates its status based on the outcome.
+
+        See Also:
+            - Permanent failures (``5xx`` replies and emails that cannot be formed) are moved to dead letters.
+            - Everything else is retried with exponential backoff, until ``max_attempts``
+        """
+        attempts += 1
+        sender = self._sender()
+        retryable, error = True, None
+        try:
+            # the ID of the email is its idempotency key, so a retry after an unacknowledged send is not delivered twice
+            response: Response = sender.send_email(
+                **{"idempotency_key": identifier, **payload}
+            )
+            if response.ok:
+                self.outbox.complete(identifier)
+                self._pool.put(sender)
+                return
+            # 422 means the email could not be formed, everything else is a failure to connect or authenticate
+            retryable = response.status != 422
+            error = f"{response.status}: {response.body}"
+            if not retryable:
+                self._pool.put(sender)
+        except smtplib.SMTPRecipientsRefused as refused:
+            codes = [code for code, _ in refused.recipients.values()]
+            retryable = all(400 <= code < 500 for code in codes)
+            error = f"{codes[0] if codes else 550}: {refused.recipients!r}"
+            self._pool.put(sender)
+        except smtplib.SMTPResponseException as failure:
+            retryable = failure.smtp_code < 500
+            error = f"{failure.smtp_code}: {failure.smtp_error!r}"
+            if failure.smtp_code != 421:  # server closes the connection on 421
+                self._pool.put(sender)
+        except (smtplib.SMTPException, socket.error) as failure:
+            error = failure.__str__() or type(failure).__name__
+        # unexpected errors are retried with backoff like the others, instead of holding the email until its lease expires
+        except Exception as failure:
+            self.logger.exception(failure)
+            error = repr(failure)
+        if retryable and attempts < self.max_attempts:
+            delay = self._delay(attempts)
+            self.logger.warning(
+                "Attempt %d for %s failed, retrying in %.1fs: %s",
+                attempts,
+                identifier,
+                delay,
+                error,
+            )
+            self.outbox.retry(identifier, attempts=attempts, delay=delay, error=error)
+        else:
+            self.logger.error("Moving %s to dead letters: %s", identifier, error)
+            self.outbox.dead_letter(identifier, attempts=attempts, error=error)
+
+    def run(self) -> None:
+        """Drains the outbox until stopped, blocking the current thread."""
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            while not self._stop.is_set():
+                claimed = self.outbox.claim(limit=self.connections * 4)
+                if not claimed:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                for future in [
+                    executor.submit(self.process, *email) for email in claimed
+                ]:
+                    try:
+                        future.result()
+                    except (
+                        sqlite3.Error
+                    ) as error:  # keep draining, the email is claimed again after its lease
+                        self.logger.exception(error)
+        while not self._pool.empty():
+            self._pool.get_nowait()
+
+    def start(self) -> threading.Thread:
+        """Drains the outbox in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="OutboxWorker", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: Union[int, float] = None) -> None:
+        """Stops draining the outbox, after the emails in progress are done."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    OutboxWorker(outbox=Outbox(sys.argv[1] if len(sys.argv) > 1 else "outbox.db")).run()
@@ -0,0 +1,238 @@
+import contextlib
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from collections.abc import Generator
+from typing import Callable, Dict, Tuple, TypeVar, Union
+
+from .instrumentation import metrics
+
+Result = TypeVar("Result")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratelimit (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    rate REAL NOT NULL,
+    updated REAL NOT NULL,
+    decreased REAL NOT NULL
+);
+"""
+
+
+class Bucket:
+    """State of the token bucket, with the current rate."""
+
+    __slots__ = ("tokens", "rate", "updated", "decreased")
+
+    def __init__(self, tokens: float, rate: float, updated: float, decreased: float):
+        """Stores the number of tokens and the rate, along with when they were last changed."""
+        self.tokens = tokens
+        self.rate = rate
+        self.updated = updated
+        self.decreased = decreased
+
+
+class RateLimiter:
+    """Token bucket that paces the messages sent, and adapts its rate to the replies from the server.
+
+    >>> RateLimiter
+
+    See Also:
+        - Every successful send raises the rate additively, every temporary failure halves it (AIMD).
+        - The rate settles just below the point where Gmail starts throttling, and probes above it now and then.
+        - With a ``path``, the bucket is stored in a SQLite database, so that it is shared across processes.
+    """
+
+    _shared: Dict[Tuple[str, Union[str, None]], "RateLimiter"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: float = None,
+        min_rate: float = None,
+        max_rate: float = None,
+        increase: float = None,
+        decrease: float = 0.5,
+        key: str = "default",
+        path: Union[str, os.PathLike] = None,
+    ):
+        """Creates the bucket full, with the starting rate.
+
+        Args:
+            rate: Starting rate in messages per second.
+            burst: Number of messages that can be sent at once after being idle, defaults to one second at ``rate``
+            min_rate: Lowest rate to slow down to, defaults to a tenth of ``rate``
+            max_rate: Highest rate to speed up to, defaults to ten times ``rate``
+            increase: Messages per second added to the rate, for every second of sending without failures,
+                defaults to a tenth of ``rate``
+            decrease: Factor to multiply the rate with, on a temporary failure.
+            key: Name of the bucket in the database, to keep separate buckets for separate accounts.
+            path: Path to a SQLite database file, to share the bucket across processes.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self.burst = max(1.0, burst or rate)
+        self.min_rate = min_rate or rate / 10
+        self.max_rate = max_rate or rate * 10
+        self.increase = increase or rate / 10
+        self.decrease = decrease
+        self.key = key
+        self.path = path
+        self._lock = threading.Lock()
+        self._bucket = Bucket(
+            tokens=self.burst, rate=rate, updated=time.time(), decreased=0.0
+        )
+        if path:
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                connection.execute(
+                    "INSERT OR IGNORE INTO ratelimit (key, tokens, rate, updated, decreased) VALUES (?, ?, ?, ?, ?)",
+                    (key, self.burst, rate, time.time(), 0.0),
+                )
+
+    @classmethod
+    def shared(
+        cls, key: str, path: Union[str, os.PathLike] = None, **kwargs
+    ) -> "RateLimiter":
+        """Returns the rate limiter for a key, which is shared by all the objects within the process.
+
+        Args:
+            key: Name of the bucket, usually the Gmail username since the limits apply per account.
+            path: Path to a SQLite database file, to share the bucket across processes.
+            **kwargs: Arguments for ``RateLimiter``, used only when the rate limiter is created.
+
+        Returns:
+            RateLimiter:
+            Rate limiter for the key.
+        """
+        path = os.fspath(path) if path else None
+        with cls._shared_lock:
+            limiter = cls._shared.get((key, path))
+            if limiter is None:
+                limiter = cls._shared[(key, path)] = cls(key=key, path=path, **kwargs)
+            return limiter
+
+    @contextlib.contextmanager
+    def _connect(self) -> Generator[sqlite3.Connection]:
+        """Creates a new connection for every operation, so that the database can be shared across threads."""
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _update(self, change: Callable[[Bucket, float], Result]) -> Result:
+        """Applies a change to the bucket, within a lock or a database transaction."""
+        if not self.path:
+            with self._lock:
+                return change(self._bucket, time.time())
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                bucket = Bucket(
+                    *connection.execute(
+                        "SELECT tokens, rate, updated, decreased FROM ratelimit WHERE key = ?",
+                        (self.key,),
+                    ).fetchone()
+                )
+                result = change(bucket, time.time())
+                connection.execute(
+                    "UPDATE ratelimit SET tokens = ?, rate = ?, updated = ?, decreased = ? WHERE key = ?",
+                    (
+                        bucket.tokens,
+                        bucket.rate,
+                        bucket.updated,
+                        bucket.decreased,
+                        self.key,
+                    ),
+                )
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        return result
+
+    def _take(self, bucket: Bucket, now: float) -> float:
+        """Refills the bucket for the time elapsed and takes a token, or returns the seconds to wait for one."""
+        bucket.tokens = min(
+            self.burst, bucket.tokens + max(0.0, now - bucket.updated) * bucket.rate
+        )
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / bucket.rate
+
+    def acquire(self, timeout: Union[int, float] = None) -> bool:
+        """Waits until a message can be sent.
+
+        Args:
+            timeout: Maximum seconds to wait, waits as long as needed by default.
+
+        Returns:
+            bool:
+            Returns ``False`` if the message cannot be sent within the timeout.
+        """
+        waited = 0.0
+        while wait := self._update(self._take):
+            if timeout is not None and waited + wait > timeout:
+                return False
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            metrics.count("rate_limit_wait", waited)
+        return True
+
+    def _increase(self, bucket: Bucket, now: float) -> None:
+        """Raises the rate by ``increase`` for every second worth of messages sent."""
+        bucket.rate = min(self.max_rate, bucket.rate + self.increase / bucket.rate)
+
+    def _decrease(self, bucket: Bucket, now: float) -> None:
+        """Cuts the rate and pauses sending, once for the failures that happen within a second.
+
+        See Also:
+            The bucket is left owing part of a burst, so that the server gets time to recover before the next attempt.
+        """
+        if now - bucket.decreased < 1:
+            return
+        bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+        bucket.tokens = min(bucket.tokens, 0.0) - self.burst * self.decrease
+        bucket.decreased = now
+
+    def success(self) -> None:
+        """Speeds up after a message was accepted by the server."""
+        self._update(self._increase)
+
+    def throttled(self) -> None:
+        """Slows down after a temporary failure from the server."""
+        metrics.count("throttled")
+        self._update(self._decrease)
+
+    @staticmethod
+    def temporary(error: smtplib.SMTPException) -> bool:
+        """Checks if an SMTP error is a temporary failure, like ``421`` or ``451`` replies when sending too fast.
+
+        Args:
+            error: Error raised while sending the message.
+
+        Returns:
+            bool:
+            Returns ``True`` if the message can be sent again after slowing down.
+        """
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return bool(error.recipients) and all(
+                400 <= code < 500 for code, _ in error.recipients.values()
+            )
+        return isinstance(error, smtplib.SMTPResponseException) and (
+            400 <= error.smtp_code < 500
+        )
+
+    @property
+    def rate(self) -> float:
+        """Current rate in messages per second."""
+        return self._update(lambda bucket, now: bucket.rate)
@@ -0,0 +1,135 @@
+import re
+from email.message import Message
+from typing import Dict, List, Tuple, Union
+
+FIELD = re.compile(rb"^([!-9;-~]+)[ \t]*:[ \t]*", re.MULTILINE)
+HEADER_END = re.compile(rb"\r?\n\r?\n")
+FOLDING = re.compile(r"\r?\n[ \t]+")
+UID = re.compile(rb"\bUID (\d+)")
+
+
+class RawMessage:
+    """Message as fetched, with the headers located by offsets instead of being parsed.
+
+    >>> RawMessage
+
+    See Also:
+        - The content is a ``memoryview`` over the literal returned by ``imaplib``, so slicing it never copies.
+        - Header fields are indexed with a single scan over the header section, and decoded only when asked for.
+        - The full MIME parser runs only when ``message`` is accessed.
+    """
+
+    __slots__ = ("uid", "meta", "data", "_end", "_index", "_message")
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview], meta: bytes = b""):
+        """Wraps the content of a message without copying it.
+
+        Args:
+            data: Raw message, or only its header section.
+            meta: Part of the ``FETCH`` response before the literal, like ``b"1 (UID 42 RFC822 {1024}"``
+        """
+        self.data = data if isinstance(data, memoryview) else memoryview(data)
+        self.meta = meta
+        uid = UID.search(meta)
+        self.uid = int(uid.group(1)) if uid else None
+        self._end = None
+        self._index = None
+        self._message = None
+
+    @property
+    def header_end(self) -> int:
+        """Offset where the body starts, after the blank line that ends the headers."""
+        if self._end is None:
+            match = HEADER_END.search(self.data)
+            self._end = match.end() if match else len(self.data)
+        return self._end
+
+    @property
+    def headers(self) -> memoryview:
+        """Raw header section, including the blank line."""
+        return self.data[: self.header_end]
+
+    @property
+    def body(self) -> memoryview:
+        """Raw body, still in its transfer encoding."""
+        return self.data[self.header_end :]
+
+    def _fields(self) -> Dict[bytes, List[Tuple[int, int]]]:
+        """Indexes the offsets of the value of every header field by its name in lower case."""
+        if self._index is None:
+            index, previous = {}, None
+            for match in FIELD.finditer(self.data, 0, self.header_end):
+                if previous:
+                    index[previous[0]][-1] = (previous[1], match.start())
+                name = match.group(1).lower()
+                index.setdefault(name, []).append(None)
+                previous = (name, match.end())
+            if previous:
+                index[previous[0]][-1] = (previous[1], self.header_end)
+            self._index = index
+        return self._index
+
+    def raw(self, name: str) -> Union[memoryview, None]:
+        """Returns the raw value of the first header field with the name, as a slice of the message.
+
+        Args:
+            name: Name of the header field, case-insensitive.
+
+        Returns:
+            memoryview:
+            Value including any folded lines, without the line break at the end.
+        """
+        offsets = self._fields().get(name.lower().encode())
+        if not offsets:
+            return None
+        start, end = offsets[0]
+        value = self.data[start:end]
+        # the line break before the next field or the blank line is not a part of the value
+        while len(value) and value[-1] in (0x0A, 0x0D):
+            value = value[:-1]
+        return value
+
+    def get(self, name: str, default: str = None) -> Union[str, None]:
+        """Returns the value of the first header field with the name, with the folded lines joined.
+
+        Args:
+            name: Name of the header field, case-insensitive.
+            default: Value to return when the field is missing.
+
+        Returns:
+            str:
+            Value of the field, without decoding RFC 2047 encoded words.
+        """
+        value = self.raw(name)
+        if value is None:
+            return default
+        return FOLDING.sub(" ", str(value, "utf-8", "replace")).strip()
+
+    def get_all(self, name: str) -> List[str]:
+        """Returns the values of all the header fields with the name, like ``Received``"""
+        values = []
+        for start, end in self._fields().get(name.lower().encode(), ()):
+            value = str(self.data[start:end], "utf-8", "replace")
+            values.append(FOLDING.sub(" ", value).strip())
+        return values
+
+    def __contains__(self, name: str) -> bool:
+        """Checks if the message has a header field with the name."""
+        return name.lower().encode() in self._fields()
+
+    def __len__(self) -> int:
+        """Size of the message in bytes."""
+        return len(self.data)
+
+    @property
+    def message(self) -> Message:
+        """Message parsed with the full MIME parser, on first access."""
+        if self._message is None:
+            import email
+
+            self._message = email.message_from_bytes(self.data.tobytes())
+        return self._message
+
+    def __repr__(self) -> str:
+        """Shows the UID and the size of the message."""
+        return f"RawMessage(uid={self.uid}, size={len(self.data)})"
@@ -1,21 +1,31 @@
-import base64
-import binascii
 import email
 import imaplib
+import re
 import socket
-import warnings
+import time
 from collections.abc import Generator
 from datetime import datetime, timedelta, timezone
 from email.header import decode_header, make_header
-from email.message import Message
-from typing import Iterable, Union
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, Iterable, List, Union
 
-import pytz
 from typing_extensions import Unpack
 
-from .models.config import IngressConfig
-from .models.options import Category, Condition
+from . import tls
+from .attachments import Attachment, AttachmentExtractor, find
+from .body import extract
+from .chunking import UNKNOWN_SIZE, ChunkSizer, parse_sizes
+from .instrumentation import metrics
+from .models.config import IngressConfig, ingress_config
+from .models.options import Category, Condition, Folder
 from .models.responder import Email, Response
+from .raw import RawMessage
+from .uids import compress, parse, uid_sets
+
+if TYPE_CHECKING:  # the cursor module imports this one
+    from .cursor import ReadCursor
+
+MESSAGE_IDS = re.compile(r"<[^<>\s]+>")
+THREAD_ID = re.compile(rb"\bX-GM-THRID (\d+)")
 
 
 class ReadEmail:
@@ -27,8 +37,11 @@ class ReadEmail:
 
     LOCAL_TIMEZONE = datetime.now(timezone.utc).astimezone().tzinfo
 
-    def __init__(self, **kwargs: "Unpack[IngressConfig]"):
-        """Loads all the necessary args, creates a connection with Gmail host to read emails from the chosen folder.
+    def __init__(self, config: IngressConfig = None, **kwargs: "Unpack[IngressConfig]"):
+        """Loads all the necessary args, the connection with Gmail host is created on first use.
+
+        Args:
+            config: Prebuilt ``IngressConfig`` to skip loading the settings, keyword arguments override its values.
 
         Keyword Args:
             gmail_user: Gmail username to authenticate SMTP lib.
@@ -36,6 +49,7 @@ class ReadEmail:
             timeout: Connection timeout for SMTP lib.
             gmail_host: Hostname for gmail's smtp server.
             folder: Folder where the emails have to be read from.
+            compress: Boolean flag to compress the connection with ``COMPRESS=DEFLATE``, when the server supports it.
 
         References:
             https://imapclient.readthedocs.io/en/2.1.0/_modules/imapclient/imapclient.html#IMAPClient.xlist_folders
@@ -45,15 +59,20 @@ class ReadEmail:
         """
         self.error, self.mail = None, None
         self._authenticated = False
-        self.env = IngressConfig(**kwargs)
-        self.create_ssl_connection()
+        self.env = ingress_config(config, **kwargs)
+        self.chunker = ChunkSizer()
 
     def create_ssl_connection(self) -> None:
         """Creates an SSL connection to gmail's SSL server."""
+        metrics.lookup(host=self.env.gmail_host, port=993)
         try:
-            self.mail = imaplib.IMAP4_SSL(
-                host=self.env.gmail_host, port=993, timeout=self.env.timeout
-            )
+            with metrics.phase("imap.connect", host=self.env.gmail_host):
+                self.mail = imaplib.IMAP4_SSL(
+                    host=self.env.gmail_host,
+                    port=993,
+                    timeout=self.env.timeout,
+                    ssl_context=tls.context(),
+                )
         except socket.error as error:
             self.error = error.__str__()
 
@@ -65,6 +84,8 @@ class ReadEmail:
             Response:
             A custom response object with properties: ok, status and body to the user.
         """
+        if self.mail is None:
+            self.create_ssl_connection()
         if self.mail is None:
             return Response(
                 dictionary={
@@ -75,9 +96,15 @@ class ReadEmail:
                 }
             )
         try:
-            self.mail.login(user=self.env.gmail_user, password=self.env.gmail_pass)
+            with metrics.phase("imap.auth", user=self.env.gmail_user):
+                self.mail.login(user=self.env.gmail_user, password=self.env.gmail_pass)
+            if self.env.compress:
+                from . import compression
+
+                compression.enable(self.mail)
             self.mail.list()  # list all the folders within your mailbox (like inbox, sent, drafts, etc)
-            self.mail.select(self.env.folder)
+            with metrics.phase("imap.select", folder=self.env.folder):
+                self.mail.select(self.env.folder)
             self._authenticated = True
             return Response(
                 dictionary={"ok": True, "status": 200, "body": "authentication success"}
@@ -88,6 +115,313 @@ class ReadEmail:
                 dictionary={"ok": False, "status": 401, "body": "authentication failed"}
             )
 
+    def reconnect(self) -> Response:
+        """Drops the current connection, then connects, authenticates and selects the folder again.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status and body to the user.
+        """
+        if self.mail:
+            try:
+                self.mail.shutdown()
+            except OSError:
+                pass
+        self.mail, self._authenticated = None, False
+        return self.authenticate
+
+    def close(self) -> None:
+        """Closes the folder and logs out, a new connection is created if the object is used again."""
+        mail, self.mail, self._authenticated = self.mail, None, False
+        if mail is None:
+            return
+        try:
+            if mail.state == "SELECTED":
+                mail.close()
+            mail.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+
+    def command(self, name: str, *args) -> tuple:
+        """Runs an IMAP command, and runs it again over a new session if the current one is found dead.
+
+        Args:
+            name: Name of the ``imaplib`` method.
+            *args: Arguments for the method.
+
+        Raises:
+            imaplib.IMAP4.abort:
+            If the command fails again, or the session cannot be established again.
+
+        Returns:
+            tuple:
+            Return code and the data from the server.
+        """
+        try:
+            return getattr(self.mail, name)(*args)
+        except (imaplib.IMAP4.abort, OSError) as error:
+            metrics.error(error)
+            metrics.count("retries")
+            status = self.reconnect()
+            if not status.ok:
+                raise imaplib.IMAP4.abort(f"{status.status}: {status.body}")
+        return getattr(self.mail, name)(*args)
+
+    def _bulk(
+        self, messages: Union[list, Iterable[int]], name: str, *args
+    ) -> Union[Response, int]:
+        """Runs a ``UID`` command over compressed sets of the messages, in as few round trips as possible.
+
+        Returns:
+            Response | int:
+            Number of messages the command was run on, or the response for a failure.
+        """
+        uids = parse(messages)
+        if not uids:
+            return Response(
+                dictionary={"ok": False, "status": 204, "body": "No messages given."}
+            )
+        if self._authenticated is False:
+            status = self.authenticate
+            if not status.ok:
+                return status
+        try:
+            for uid_set in uid_sets(uids):
+                with metrics.phase(
+                    f"imap.{name}", folder=self.env.folder, messages=len(uids)
+                ):
+                    return_code, data = self.command("uid", name, uid_set, *args)
+                if return_code != "OK":
+                    metrics.count("errors", status=return_code)
+                    return Response(
+                        dictionary={
+                            "ok": False,
+                            "status": 400,
+                            "body": (data[-1] or b"").decode(errors="replace"),
+                        }
+                    )
+        except imaplib.IMAP4.error as error:
+            return Response(
+                dictionary={"ok": False, "status": 503, "body": error.__str__()}
+            )
+        return len(uids)
+
+    def store(
+        self,
+        messages: Union[list, Iterable[int]],
+        flags: Union[str, List[str]],
+        remove: bool = False,
+    ) -> Response:
+        """Adds or removes flags on all the messages, with one ``UID STORE`` per compressed set of UIDs.
+
+        Args:
+            messages: Body of the ``instantiate`` method, or a list of UIDs.
+            flags: Flags like ``\\Seen``, ``\\Flagged`` or ``\\Deleted``
+            remove: Boolean flag to remove the flags instead of adding them.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status, body and the number of messages as count.
+        """
+        if isinstance(flags, str):
+            flags = [flags]
+        # SILENT skips the untagged reply with the new flags, for every message
+        action = "-FLAGS.SILENT" if remove else "+FLAGS.SILENT"
+        result = self._bulk(messages, "store", action, f"({' '.join(flags)})")
+        if isinstance(result, Response):
+            return result
+        return Response(
+            dictionary={
+                "ok": True,
+                "status": 200,
+                "body": f"{'Removed' if remove else 'Added'} {' '.join(flags)} for {result} messages",
+                "count": result,
+            }
+        )
+
+    def mark_seen(self, messages: Union[list, Iterable[int]]) -> Response:
+        """Marks all the messages as read, see ``store``"""
+        return self.store(messages, "\\Seen")
+
+    def mark_unseen(self, messages: Union[list, Iterable[int]]) -> Response:
+        """Marks all the messages as unread, see ``store``"""
+        return self.store(messages, "\\Seen", remove=True)
+
+    def label(
+        self,
+        messages: Union[list, Iterable[int]],
+        labels: Union[str, List[str]],
+        remove: bool = False,
+    ) -> Response:
+        """Adds or removes Gmail labels on all the messages, using ``X-GM-LABELS``
+
+        Args:
+            messages: Body of the ``instantiate`` method, or a list of UIDs.
+            labels: Names of the labels.
+            remove: Boolean flag to remove the labels instead of adding them.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status, body and the number of messages as count.
+        """
+        if isinstance(labels, str):
+            labels = [labels]
+        quoted = " ".join('"%s"' % label.replace('"', '\\"') for label in labels)
+        action = "-X-GM-LABELS" if remove else "+X-GM-LABELS"
+        result = self._bulk(messages, "store", action, f"({quoted})")
+        if isinstance(result, Response):
+            return result
+        return Response(
+            dictionary={
+                "ok": True,
+                "status": 200,
+                "body": f"{'Removed' if remove else 'Added'} labels {labels} for {result} messages",
+                "count": result,
+            }
+        )
+
+    def copy(
+        self, messages: Union[list, Iterable[int]], folder: Union[Folder, str]
+    ) -> Response:
+        """Copies all the messages to another folder, with one ``UID COPY`` per compressed set of UIDs.
+
+        Args:
+            messages: Body of the ``instantiate`` method, or a list of UIDs.
+            folder: Folder to copy the messages to.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status, body and the number of messages as count.
+        """
+        result = self._bulk(messages, "copy", folder)
+        if isinstance(result, Response):
+            return result
+        return Response(
+            dictionary={
+                "ok": True,
+                "status": 200,
+                "body": f"Copied {result} messages to {getattr(folder, 'value', folder)}",
+                "count": result,
+            }
+        )
+
+    def move(
+        self, messages: Union[list, Iterable[int]], folder: Union[Folder, str]
+    ) -> Response:
+        """Moves all the messages to another folder, using ``UID MOVE`` or ``UID COPY`` when not supported.
+
+        Args:
+            messages: Body of the ``instantiate`` method, or a list of UIDs.
+            folder: Folder to move the messages to, use ``Folder.trash`` to delete them on Gmail.
+
+        See Also:
+            Without ``MOVE``, the messages are copied, flagged as deleted and then expunged at once.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status, body and the number of messages as count.
+        """
+        if self._authenticated is False:
+            status = self.authenticate
+            if not status.ok:
+                return status
+        if "MOVE" in self.mail.capabilities:
+            result = self._bulk(messages, "move", folder)
+            if isinstance(result, Response):
+                return result
+            self.mail.response(
+                "EXPUNGE"
+            )  # drops the untagged reply for every message moved
+        else:
+            for response in (
+                self.copy(messages, folder),
+                self.store(messages, "\\Deleted"),
+                self.expunge(messages),
+            ):
+                if not response.ok:
+                    return response
+            result = response.count
+        return Response(
+            dictionary={
+                "ok": True,
+                "status": 200,
+                "body": f"Moved {result} messages to {getattr(folder, 'value', folder)}",
+                "count": result,
+            }
+        )
+
+    def delete(self, messages: Union[list, Iterable[int]]) -> Response:
+        """Flags all the messages as deleted and expunges them, in a handful of round trips.
+
+        Args:
+            messages: Body of the ``instantiate`` method, or a list of UIDs.
+
+        See Also:
+            On Gmail, this only removes the label of the folder, except in Spam and Trash.
+            Use ``move`` with ``Folder.trash`` to delete the messages.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status, body and the number of messages as count.
+        """
+        response = self.store(messages, "\\Deleted")
+        if not response.ok:
+            return response
+        return self.expunge(messages)
+
+    def expunge(self, messages: Union[list, Iterable[int]] = None) -> Response:
+        """Removes the messages flagged as deleted, with a single ``EXPUNGE``
+
+        Args:
+            messages: Limits the expunge to these UIDs with ``UID EXPUNGE``, when the server supports ``UIDPLUS``
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status, body and the number of messages as count.
+        """
+        if self._authenticated is False:
+            status = self.authenticate
+            if not status.ok:
+                return status
+        if messages is not None and "UIDPLUS" in self.mail.capabilities:
+            result = self._bulk(messages, "expunge")
+            if isinstance(result, Response):
+                return result
+            _, expunged = self.mail.response("EXPUNGE")
+            count = len([each for each in expunged if each])
+            return Response(
+                dictionary={
+                    "ok": True,
+                    "status": 200,
+                    "body": f"Expunged {count} messages",
+                    "count": count,
+                }
+            )
+        try:
+            with metrics.phase("imap.expunge", folder=self.env.folder):
+                return_code, data = self.command("expunge")
+        except imaplib.IMAP4.error as error:
+            return Response(
+                dictionary={"ok": False, "status": 503, "body": error.__str__()}
+            )
+        count = len([each for each in data if each])
+        return Response(
+            dictionary={
+                "ok": return_code == "OK",
+                "status": 200 if return_code == "OK" else 400,
+                "body": f"Expunged {count} messages",
+                "count": count,
+            }
+        )
+
+    def __enter__(self):
+        """Returns the object itself, which connects on first use."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Closes the folder and logs out."""
+        self.close()
+
     def instantiate(
         self,
         filters: Union[
@@ -105,6 +439,13 @@ class ReadEmail:
         Returns:
             Response:
             A Response class containing number of email messages, return code and the encoded messages itself.
+
+        See Also:
+            The messages are identified by their UIDs, so they can be passed on to the bulk operations as is.
+
+        Notes:
+            Earlier versions returned sequence numbers. Pass the body to ``read_mail`` or the bulk operations,
+            or to the ``UID`` commands of ``imaplib`` like ``mail.uid("FETCH", ...)``, but not to ``mail.fetch``
         """
         if self._authenticated is False:
             status = self.authenticate
@@ -112,8 +453,15 @@ class ReadEmail:
                 return status
         if type(filters) in (list, tuple):
             filters = " ".join(filters)
-        return_code, messages = self.mail.search(None, filters)
+        try:
+            with metrics.phase("imap.search", folder=self.env.folder):
+                return_code, messages = self.command("uid", "search", None, filters)
+        except imaplib.IMAP4.abort as error:
+            return Response(
+                dictionary={"ok": False, "status": 503, "body": error.__str__()}
+            )
         if return_code != "OK":
+            metrics.count("errors", status=return_code)
             return Response(
                 dictionary={
                     "ok": False,
@@ -150,7 +498,10 @@ class ReadEmail:
             Email:
             Email object with information.
         """
-        original_email = email.message_from_bytes(response_part[1])
+        content = response_part[1]
+        if isinstance(content, memoryview):
+            content = content.tobytes()
+        original_email = email.message_from_bytes(content)
         if received := original_email.get("Received"):
             date = received.split(";")[-1].strip()
         else:
@@ -167,6 +518,8 @@ class ReadEmail:
             if original_email["Subject"]
             else None
         )
+        import pytz  # imported on first use, since loading the timezone database is slow
+
         # Converts pacific time to local timezone as the default is pacific
         local_time = datetime_obj.replace(
             tzinfo=pytz.timezone("US/Pacific")
@@ -183,32 +536,18 @@ class ReadEmail:
                 receive = local_time.strftime("on %A, %B %d, at %I:%M %p")
         else:
             receive = local_time
-        if (
-            original_email.get_content_type() == "text/plain"
-        ):  # ignore attachments and html
-            body = original_email.get_payload(decode=True)
-            body = body.decode("utf-8")
-        else:
-            body = ""
-            for payload in original_email.get_payload():
-                if isinstance(payload, Message):
-                    body += payload.as_string()
-                elif isinstance(payload, str):
-                    body += payload
-                elif isinstance(payload, bytes):
-                    try:
-                        decoded = base64.b64decode(payload)
-                    except binascii.Error:
-                        try:
-                            decoded = (
-                                payload.decode()
-                            )  # encoding is unknown at this point so default to UTF-8
-                        except UnicodeDecodeError:
-                            warnings.warn("Unknown encoding type for payload")
-                            continue
-                    body += decoded
-                else:
-                    warnings.warn(f"Unsupported payload type: {type(payload)}")
+        # text of the best alternative, decoded with its charset and converted from HTML when there is no plain text
+        body = extract(original_email)
+        # IDs that link the message to its conversation, see ConversationIndex
+        message_id = MESSAGE_IDS.findall(original_email.get("Message-ID", ""))
+        in_reply_to = MESSAGE_IDS.findall(original_email.get("In-Reply-To", ""))
+        thread_id = THREAD_ID.search(response_part[0] or b"")
+        links = dict(
+            message_id=message_id[0] if message_id else None,
+            in_reply_to=in_reply_to[0] if in_reply_to else None,
+            references=MESSAGE_IDS.findall(original_email.get("References", "")),
+            thread_id=int(thread_id.group(1)) if thread_id else None,
+        )
         if len(from_) == 1:
             return Email(
                 dictionary=dict(
@@ -217,6 +556,8 @@ class ReadEmail:
                     subject=sub,
                     date_time=receive,
                     body=body,
+                    attachments=find(original_email),
+                    **links,
                 )
             )
         return Email(
@@ -226,7 +567,193 @@ class ReadEmail:
                 subject=sub,
                 date_time=receive,
                 body=body,
+                attachments=find(original_email),
+                **links,
+            )
+        )
+
+    def save_attachments(
+        self,
+        messages: Union[list, Iterable[int]],
+        directory: str = "attachments",
+        sink: Callable[[Attachment], BinaryIO] = None,
+        chunk_size: int = 1 << 20,
+        dedupe: bool = True,
+    ) -> Response:
+        """Saves the attachments of the messages, by downloading only the attachments in chunks.
+
+        Args:
+            messages: Body of the ``instantiate`` method, or a list of UIDs.
+            directory: Directory to save the attachments in.
+            sink: Function that takes an ``Attachment`` and returns a binary file-like object to write it to.
+            chunk_size: Number of bytes downloaded and decoded at a time.
+            dedupe: Boolean flag to save attachments with the same content only once.
+
+        See Also:
+            - The MIME tree is read from ``BODYSTRUCTURE``, and each attachment is fetched with ``BODY.PEEK[n]``
+            - Memory used stays around ``chunk_size``, regardless of the size of the messages.
+
+        Returns:
+            Response:
+            A custom response object with the number of attachments as count, and the attachments of each UID as body.
+        """
+        uids = parse(messages)
+        if not uids:
+            return Response(
+                dictionary={"ok": False, "status": 204, "body": "No messages given."}
+            )
+        if self._authenticated is False:
+            status = self.authenticate
+            if not status.ok:
+                return status
+        extractor = AttachmentExtractor(
+            directory=directory, sink=sink, chunk_size=chunk_size, dedupe=dedupe
+        )
+        saved = {}
+        try:
+            for uid in uids:
+                saved[uid] = extractor.fetch(self, uid)
+        except (imaplib.IMAP4.error, OSError) as error:
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": 503,
+                    "body": error.__str__(),
+                    "extra": saved,
+                }
             )
+        return Response(
+            dictionary={
+                "ok": True,
+                "status": 200,
+                "body": saved,
+                "count": sum(len(attachments) for attachments in saved.values()),
+            }
+        )
+
+    def fetch_sizes(self, messages: Union[list, Iterable[int]]) -> Dict[int, int]:
+        """Fetches ``RFC822.SIZE`` of the messages in large batches, and measures the round trip along the way.
+
+        Args:
+            messages: Body of the ``instantiate`` method, or a list of UIDs.
+
+        Returns:
+            Dict[int, int]:
+            Size of each message in bytes by its UID. Messages that no longer exist are left out.
+        """
+        sizes = {}
+        for uid_set in uid_sets(parse(messages), size=1000):
+            with metrics.phase(
+                "imap.fetch", folder=self.env.folder, items="(RFC822.SIZE)"
+            ):
+                start = time.perf_counter()
+                _, data = self.command("uid", "fetch", uid_set, "(RFC822.SIZE)")
+                self.chunker.observe_rtt(time.perf_counter() - start)
+            sizes.update(parse_sizes(data))
+        return sizes
+
+    def _fetch(
+        self, messages: Union[list, Iterable[int]], items: str
+    ) -> Generator[tuple]:
+        """Fetches the messages in chunks sized by ``chunker``, and yields each message as returned by ``imaplib``
+
+        See Also:
+            The size of each chunk is reported with the ``messages`` and ``bytes`` attributes of ``imap.fetch``
+        """
+        uids = parse(messages)
+        sizes = self.fetch_sizes(uids) if uids else {}
+        for chunk in self.chunker.chunks(
+            (uid, sizes.get(uid, UNKNOWN_SIZE)) for uid in uids
+        ):
+            expected = sum(sizes.get(uid, UNKNOWN_SIZE) for uid in chunk)
+            with metrics.phase(
+                "imap.fetch",
+                folder=self.env.folder,
+                items=items,
+                messages=len(chunk),
+                bytes=expected,
+            ):
+                start = time.perf_counter()
+                _, data = self.command("uid", "fetch", compress(chunk), items)
+                elapsed = time.perf_counter() - start
+            parts = [each for each in data if isinstance(each, tuple)]
+            self.chunker.observe(sum(len(each[1]) for each in parts), elapsed)
+            metrics.count("fetch_chunks")
+            metrics.count("fetch_chunk_messages", len(chunk))
+            for each_response in parts:
+                metrics.count("messages_in")
+                metrics.count("bytes_in", len(each_response[1]))
+                yield each_response
+
+    def read_raw(
+        self,
+        messages: Union[list, Iterable[int]],
+        header_only: bool = False,
+        batch_size: int = None,
+    ) -> Generator[RawMessage]:
+        """Yields the messages as fetched, without parsing them, for routing on a few header fields.
+
+        Args:
+            messages: Body of the ``instantiate`` method, or a list of UIDs.
+            header_only: Boolean flag to fetch only the header section, without marking the messages as seen.
+            batch_size: Number of messages fetched with a single command, 50 for headers only and sized by ``chunker`` if not.
+
+        See Also:
+            The full message is parsed only when ``RawMessage.message`` is accessed, and
+            ``get_info(response_part=(raw.meta, raw.data), dt_flag=False)`` turns it into an ``Email``
+
+        Yields:
+            RawMessage:
+            Message as a ``memoryview`` over the literal from ``imaplib``, along with a header index.
+        """
+        if self._authenticated is False:
+            status = self.authenticate
+            if not status.ok:
+                return
+        items = "(BODY.PEEK[HEADER])" if header_only else "(RFC822)"
+        if batch_size is None and not header_only:
+            for each_response in self._fetch(messages, items):
+                yield RawMessage(data=each_response[1], meta=each_response[0])
+            return
+        for uid_set in uid_sets(parse(messages), size=batch_size or 50):
+            with metrics.phase("imap.fetch", folder=self.env.folder, items=items):
+                _, data = self.command("uid", "fetch", uid_set, items)
+            for each_response in data:
+                if isinstance(each_response, tuple):
+                    metrics.count("messages_in")
+                    metrics.count("bytes_in", len(each_response[1]))
+                    yield RawMessage(data=each_response[1], meta=each_response[0])
+
+    def cursor(
+        self,
+        filters: Union[Category.__str__, Condition.__str__] = "ALL",
+        position: str = None,
+        page_size: int = 50,
+        humanize_datetime: bool = False,
+    ) -> "ReadCursor":
+        """Creates a cursor that reads the messages in pages, and can be resumed from its position on a new connection.
+
+        Args:
+            filters: Category or Condition
+            position: Serialized position of an earlier cursor, to skip what was already read.
+            page_size: Number of messages fetched with a single command.
+            humanize_datetime: Converts received time to human-readable format.
+
+        See Also:
+            Unlike ``read_mail``, the connection is left open when the messages run out.
+
+        Returns:
+            ReadCursor:
+            Cursor over the folder of this object.
+        """
+        from .cursor import ReadCursor
+
+        return ReadCursor(
+            reader=self,
+            filters=filters,
+            position=position,
+            page_size=page_size,
+            humanize_datetime=humanize_datetime,
         )
 
     def read_mail(
@@ -238,18 +765,21 @@ class ReadEmail:
             messages: Takes the encoded message list as an argument. This is the body of the ``instantiate`` method.
             humanize_datetime: Converts received time to human-readable format.
 
+        See Also:
+            The sizes of the messages are fetched first, and the messages are fetched in chunks sized by ``chunker``
+            to a budget of bytes, from the round trip and the throughput measured on the connection.
+
         Yields:
             dict:
             A custom response object with properties: ok, status and body to the user.
         """
-        for nm in messages[0].split():
-            dummy, data = self.mail.fetch(nm, "(RFC822)")
-            for each_response in data:
-                if isinstance(each_response, tuple):
-                    yield self.get_info(
-                        response_part=each_response, dt_flag=humanize_datetime
-                    )
+        # Gmail sends the ID of the conversation, which saves matching the headers to group the messages
+        items = (
+            "(X-GM-THRID RFC822)"
+            if self.mail and "X-GM-EXT-1" in self.mail.capabilities
+            else "(RFC822)"
+        )
+        for each_response in self._fetch(messages, items):
+            yield self.get_info(response_part=each_response, dt_flag=humanize_datetime)
         else:
-            if self.mail:
-                self.mail.close()
-                self.mail.logout()
+            self.close()
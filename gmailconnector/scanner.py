@@ -0,0 +1,271 @@
+import imaplib
+import queue
+import re
+import threading
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Hashable, Iterable, List, Tuple, Union
+
+from typing_extensions import Unpack
+
+from .instrumentation import metrics
+from .models.config import IngressConfig, ingress_config
+from .models.options import Category, Condition, Folder
+from .models.responder import Email, Response
+from .read_email import ReadEmail
+from .uids import parse, uid_sets
+
+UID = re.compile(rb"\bUID (\d+)")
+GMAIL_ID = re.compile(rb"\bX-GM-MSGID (\d+)")
+MESSAGE_ID = re.compile(rb"^Message-ID:\s*(\S+)", re.IGNORECASE | re.MULTILINE)
+DONE = object()
+
+
+class FolderScanner:
+    """Searches multiple folders concurrently, and reads each message only once even if it is in several folders.
+
+    >>> FolderScanner
+
+    See Also:
+        - Each folder has its own session, which is kept open to be reused by the next scan.
+        - Messages are matched across folders by ``X-GM-MSGID`` on Gmail, or by the ``Message-ID`` header elsewhere.
+    """
+
+    def __init__(
+        self,
+        folders: Iterable[Folder] = (Folder.inbox,),
+        connections: int = 4,
+        batch_size: int = 50,
+        config: IngressConfig = None,
+        **kwargs: "Unpack[IngressConfig]",
+    ):
+        """Loads the settings, the connections with Gmail host are created on first use.
+
+        Args:
+            folders: Folders to search, a message in more than one folder is attributed to the first one listed.
+            connections: Maximum number of folders that are searched or read at the same time.
+            batch_size: Number of messages fetched with a single command.
+            config: Prebuilt ``IngressConfig`` to skip loading the settings, keyword arguments override its values.
+
+        Keyword Args:
+            gmail_user: Gmail username to authenticate IMAP lib.
+            gmail_pass: Gmail password to authenticate IMAP lib.
+            timeout: Connection timeout for IMAP lib.
+            gmail_host: Hostname for gmail's imap server.
+        """
+        self.env = ingress_config(config, **kwargs)
+        self.folders = list(dict.fromkeys(Folder(folder) for folder in folders))
+        self.connections = max(1, connections)
+        self.batch_size = batch_size
+        self.readers: Dict[Folder, ReadEmail] = {
+            folder: ReadEmail(config=self.env, folder=folder) for folder in self.folders
+        }
+
+    def _search(
+        self, folder: Folder, filters: str
+    ) -> Union[Response, List[Tuple[bytes, Hashable]]]:
+        """Searches a folder, and fetches the ID used to match each message across folders.
+
+        Returns:
+            Response | List[Tuple[bytes, Hashable]]:
+            UID and the matching key of each message, or the response for a failure.
+        """
+        reader = self.readers[folder]
+        if not reader._authenticated:
+            status = reader.authenticate
+            if not status.ok:
+                return status
+        with metrics.phase("imap.search", folder=folder):
+            return_code, data = reader.command("uid", "search", None, filters)
+        if return_code != "OK":
+            metrics.count("errors", status=return_code)
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": 404,
+                    "body": "Unable to read emails.",
+                }
+            )
+        uids = data[0].split()
+        gmail = "X-GM-EXT-1" in reader.mail.capabilities
+        items = "(X-GM-MSGID)" if gmail else "(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])"
+        keys = []
+        # IDs are tiny, so they are fetched in much larger batches than the messages
+        for uid_set in uid_sets(parse(uids), size=self.batch_size * 20):
+            with metrics.phase("imap.fetch", folder=folder, items=items):
+                _, data = reader.command("uid", "fetch", uid_set, items)
+            for part in data:
+                meta, content = part if isinstance(part, tuple) else (part, b"")
+                if not (uid := UID.search(meta)):
+                    continue
+                match = GMAIL_ID.search(meta) if gmail else MESSAGE_ID.search(content)
+                # messages without an ID are never treated as duplicates
+                key = match.group(1) if match else (folder, uid.group(1))
+                keys.append((uid.group(1), key))
+        return keys
+
+    def search(
+        self,
+        filters: Union[
+            Iterable[Category.__str__], Iterable[Condition.__str__]
+        ] = "UNSEEN",
+    ) -> Response:
+        """Searches all the folders at the same time, and drops the messages that were found in an earlier folder.
+
+        Args:
+            filters: Category or Condition
+
+        Returns:
+            Response:
+            A Response class containing the number of unique messages, and the UIDs to read from each folder.
+            The ``extra`` property holds the response for each folder that could not be searched.
+        """
+        if type(filters) in (list, tuple):
+            filters = " ".join(filters)
+        with ThreadPoolExecutor(
+            max_workers=min(self.connections, len(self.folders))
+        ) as executor:
+            futures = [
+                executor.submit(self._search, folder, filters)
+                for folder in self.folders
+            ]
+        seen, messages, failed = set(), {}, {}
+        for folder, future in zip(self.folders, futures):
+            try:
+                result = future.result()
+            except (imaplib.IMAP4.error, OSError) as error:
+                result = Response(
+                    dictionary={"ok": False, "status": 503, "body": error.__str__()}
+                )
+            if isinstance(result, Response):
+                failed[folder] = result
+                continue
+            messages[folder] = [uid for uid, key in result if key not in seen]
+            seen.update(key for _, key in result)
+        count = sum(len(uids) for uids in messages.values())
+        if not messages:
+            status = next(iter(failed.values()))
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": status.status,
+                    "body": status.body,
+                    "extra": failed,
+                }
+            )
+        if not count:
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": 204,
+                    "body": f"No emails found in {self.env.gmail_user} [{', '.join(messages)}] "
+                    f"for the filter(s) {filters.lower()!r}",
+                    "count": count,
+                    "extra": failed,
+                }
+            )
+        return Response(
+            dictionary={
+                "ok": True,
+                "status": 207 if failed else 200,
+                "body": messages,
+                "count": count,
+                "extra": failed,
+            }
+        )
+
+    def _read(
+        self,
+        folder: Folder,
+        uids: List[bytes],
+        results: queue.Queue,
+        stop: threading.Event,
+    ) -> None:
+        """Fetches the messages of a folder in batches, and queues them to be yielded."""
+        reader = self.readers[folder]
+        try:
+            # a reader that was closed, or failed to connect again, has no session until it authenticates
+            if reader._authenticated is False:
+                status = reader.authenticate
+                if not status.ok:
+                    raise imaplib.IMAP4.abort(f"{status.status}: {status.body}")
+            items = (
+                "(X-GM-THRID RFC822)"
+                if reader.mail and "X-GM-EXT-1" in reader.mail.capabilities
+                else "(RFC822)"
+            )
+            for uid_set in uid_sets(parse(uids), size=self.batch_size):
+                if stop.is_set():
+                    return
+                with metrics.phase("imap.fetch", folder=folder):
+                    _, data = reader.command("uid", "fetch", uid_set, items)
+                for part in data:
+                    if isinstance(part, tuple):
+                        metrics.count("messages_in")
+                        metrics.count("bytes_in", len(part[1]))
+                        results.put((reader, part))
+        except Exception as error:
+            results.put((None, error))
+        finally:
+            results.put((None, DONE))
+
+    def read_mail(
+        self,
+        messages: Dict[Folder, List[bytes]],
+        humanize_datetime: bool = False,
+    ) -> Generator[Email]:
+        """Yields the messages of all the folders as they arrive, while the folders are read at the same time.
+
+        Args:
+            messages: UIDs to read from each folder. This is the body of the ``search`` method.
+            humanize_datetime: Converts received time to human-readable format.
+
+        Raises:
+            imaplib.IMAP4.abort:
+            If a folder could not be read even after connecting again.
+
+        Yields:
+            Email:
+            Email object with information.
+        """
+        if not messages:
+            return
+        # bounded, so that the folders are not read much faster than the messages are consumed
+        results = queue.Queue(maxsize=self.batch_size * self.connections)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=min(self.connections, len(messages)))
+        futures = [
+            executor.submit(self._read, folder, uids, results, stop)
+            for folder, uids in messages.items()
+        ]
+        pending = len(futures)
+        try:
+            while pending:
+                reader, part = results.get()
+                if part is DONE:
+                    pending -= 1
+                elif reader is None:
+                    raise part
+                else:
+                    yield reader.get_info(response_part=part, dt_flag=humanize_datetime)
+        finally:
+            stop.set()
+            while not all(future.done() for future in futures):
+                try:  # unblocks the folders that are waiting to queue a message
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            executor.shutdown()
+
+    def close(self) -> None:
+        """Closes the folders and logs out of every session."""
+        for reader in self.readers.values():
+            reader.close()
+
+    def __enter__(self):
+        """Returns the object itself, which connects on first use."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Closes the folders and logs out of every session."""
+        self.close()
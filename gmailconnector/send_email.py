@@ -1,24 +1,42 @@
+import io
 import os
+import re
 import smtplib
 import socket
-from email.mime.application import MIMEApplication
+from email.generator import BytesGenerator
+from email.message import Message
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Dict, List, Union
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple, Union
 
 from typing_extensions import Unpack
 
-from .models.config import EgressConfig, Encryption
+from . import tls
+from .instrumentation import metrics
+from .models.config import EgressConfig, Encryption, egress_config
 from .models.responder import Response
+from .template import (
+    EmailTemplate,
+    attachment_error,
+    attachment_filename,
+    attachment_list,
+    attachment_part,
+)
 from .validator.address import EmailAddress
 
+if TYPE_CHECKING:  # sqlite3 is loaded only when needed
+    from .idempotency import IdempotencyStore
+    from .ratelimit import RateLimiter
+
+LEADING_PERIOD = re.compile(rb"(?m)^\.")
+
 
 def validate_email(address: Union[str, List[str]]) -> Union[str, List[str]]:
     """Validates email addresses and returns them as is."""
     if isinstance(address, str):
         return EmailAddress(address).email
     else:
-        return [EmailAddress(addr).email for addr in address]
+        return [addr.email for addr in EmailAddress.parse_many(address)]
 
 
 class SendEmail:
@@ -28,8 +46,11 @@ class SendEmail:
 
     """
 
-    def __init__(self, **kwargs: "Unpack[EgressConfig]"):
-        """Loads all the necessary args, creates a connection with Gmail host based on chosen encryption type.
+    def __init__(self, config: EgressConfig = None, **kwargs: "Unpack[EgressConfig]"):
+        """Loads all the necessary args, the connection with Gmail host is created on first use.
+
+        Args:
+            config: Prebuilt ``EgressConfig`` to skip loading the settings, keyword arguments override its values.
 
         Keyword Args:
             gmail_user: Gmail username to authenticate SMTP lib.
@@ -37,12 +58,15 @@ class SendEmail:
             timeout: Connection timeout for SMTP lib.
             encryption: Type of encryption to be used.
             gmail_host: Hostname for gmail's smtp server.
+            rate_limit: Starting rate in messages per second, that adapts to the throttling by Gmail.
+            rate_limit_db: SQLite database file, to share the rate limit across processes.
+            idempotency_db: SQLite database file, to share the idempotency keys sent across processes.
         """
         self.server, self.error = None, None
-        self.env = EgressConfig(**kwargs)
+        self.env = egress_config(config, **kwargs)
         self._failed_attachments = {"FILE NOT FOUND": [], "FILE SIZE OVER 25 MB": []}
+        self._buffer = io.BytesIO()
         self._authenticated = False
-        self.create_connection()
 
     def create_connection(self) -> None:
         """Creates SSL/TLS connection based on the request parameter."""
@@ -54,19 +78,29 @@ class SendEmail:
             self.create_ssl_connection(
                 host=self.env.gmail_host, timeout=self.env.timeout
             )
+        if getattr(self.server, "sock", None):
+            # transmit writes the message and its terminator separately, which must not wait for a delayed ACK
+            self.server.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     def create_ssl_connection(self, host: str, timeout: Union[int, float]) -> None:
         """Create a connection using SSL encryption."""
+        metrics.lookup(host=host, port=465)
         try:
-            self.server = smtplib.SMTP_SSL(host=host, port=465, timeout=timeout)
+            with metrics.phase("smtp.connect", host=host, encryption=Encryption.SSL):
+                self.server = smtplib.SMTP_SSL(
+                    host=host, port=465, timeout=timeout, context=tls.context()
+                )
         except (smtplib.SMTPException, socket.error) as error:
             self.error = error.__str__()
 
     def create_tls_connection(self, host: str, timeout: Union[int, float]) -> None:
         """Create a connection using TLS encryption."""
+        metrics.lookup(host=host, port=587)
         try:
-            self.server = smtplib.SMTP(host=host, port=587, timeout=timeout)
-            self.server.starttls()
+            with metrics.phase("smtp.connect", host=host, encryption=Encryption.TLS):
+                self.server = smtplib.SMTP(host=host, port=587, timeout=timeout)
+            with metrics.phase("smtp.starttls", host=host):
+                self.server.starttls(context=tls.context())
         except (smtplib.SMTPException, socket.error) as error:
             self.error = error.__str__()
 
@@ -78,6 +112,8 @@ class SendEmail:
             Response:
             A custom response object with properties: ok, status and body to the user.
         """
+        if self.server is None:
+            self.create_connection()
         if self.server is None:
             return Response(
                 dictionary={
@@ -88,7 +124,10 @@ class SendEmail:
                 }
             )
         try:
-            self.server.login(user=self.env.gmail_user, password=self.env.gmail_pass)
+            with metrics.phase("smtp.auth", user=self.env.gmail_user):
+                self.server.login(
+                    user=self.env.gmail_user, password=self.env.gmail_pass
+                )
             self._authenticated = True
             return Response(
                 dictionary={"ok": True, "status": 200, "body": "authentication success"}
@@ -102,11 +141,246 @@ class SendEmail:
                 dictionary={"ok": False, "status": 503, "body": error.__str__()}
             )
 
+    @property
+    def limiter(self) -> Union["RateLimiter", None]:
+        """Rate limiter shared by all the objects using the same Gmail account, when ``rate_limit`` is set.
+
+        Returns:
+            RateLimiter:
+            Rate limiter for the account, or ``None`` when sending is not rate limited.
+        """
+        if not self.env.rate_limit:
+            return None
+        from .ratelimit import RateLimiter
+
+        return RateLimiter.shared(
+            key=self.env.gmail_user,
+            path=self.env.rate_limit_db,
+            rate=self.env.rate_limit,
+        )
+
+    @property
+    def sent_keys(self) -> "IdempotencyStore":
+        """Idempotency keys of the emails sent recently, shared by all the objects using the same ``idempotency_db``
+
+        Returns:
+            IdempotencyStore:
+            Store for the keys, in memory unless ``idempotency_db`` is set.
+        """
+        from .idempotency import IdempotencyStore
+
+        return IdempotencyStore.shared(path=self.env.idempotency_db)
+
+    def _once(self, key: Union[str, None], send: Callable[[str], Response]) -> Response:
+        """Sends an email only if its idempotency key has not been sent already, or is not being sent.
+
+        Args:
+            key: Idempotency key given by the caller, ``None`` to send regardless.
+            send: Function that sends the email with the given ``Message-ID``
+
+        See Also:
+            - The key is claimed before connecting, so a repeated request does not need the network at all.
+            - The key is released if the email could not be sent, so that it can be retried with the same key.
+
+        Returns:
+            Response:
+            Response from sending the email, 208 if it was sent already or 409 if it is being sent.
+        """
+        if key is None:
+            return send(None)
+        from .idempotency import message_id
+
+        store = self.sent_keys
+        msg_id = message_id(key=key, account=self.env.gmail_user)
+        if record := store.claim(key=key, message_id=msg_id):
+            if record.state == store.SENT:
+                return Response(
+                    dictionary={
+                        "ok": True,
+                        "status": 208,
+                        "body": f"Email with the key {key!r} has been sent already.",
+                        "extra": record.message_id,
+                    }
+                )
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": 409,
+                    "body": f"Email with the key {key!r} is being sent.",
+                    "extra": record.message_id,
+                }
+            )
+        try:
+            status = send(msg_id)
+        except BaseException:
+            store.release(key=key)
+            raise
+        if status.ok:
+            store.sent(key=key, message_id=msg_id)
+        else:
+            store.release(key=key)
+        return status
+
+    def _backoff(self, error: smtplib.SMTPException) -> bool:
+        """Prepares to send a message again after a temporary failure, when sending is rate limited.
+
+        See Also:
+            The rate limiter has slowed down already, so the next attempt waits for it instead of retrying right away.
+
+        Returns:
+            bool:
+            Returns ``True`` if the message should be sent again.
+        """
+        limiter = self.limiter
+        if limiter is None or not limiter.temporary(error):
+            return False
+        metrics.count("retries")
+        if getattr(error, "smtp_code", None) == 421:  # server closes the connection
+            return self.reconnect().ok
+        return True
+
+    def reconnect(self) -> Response:
+        """Drops the current connection, then connects and authenticates again.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status and body to the user.
+        """
+        if self.server:
+            self.server.close()
+        self.server, self._authenticated = None, False
+        return self.authenticate
+
+    def close(self) -> None:
+        """Ends the session with ``QUIT``, a new connection is created if the object is used again."""
+        server, self.server, self._authenticated = self.server, None, False
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def __enter__(self):
+        """Returns the object itself, which connects on first use."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Ends the session."""
+        self.close()
+
     def __del__(self):
         """Destructor has been called to close the connection and logout."""
-        if self.server:
+        if getattr(self, "server", None):
             self.server.close()
 
+    def serialize(self, msg: Message) -> memoryview:
+        """Serializes the message into bytes with ``CRLF`` line endings, re-using the same buffer for every message.
+
+        Args:
+            msg: Message to be serialized.
+
+        See Also:
+            - Avoids the ``str`` round trip of ``as_string``, which ``smtplib`` has to fix line endings on and re-encode.
+            - Sent using ``transmit``, so the message is not copied again unless it needs dot-stuffing.
+            - The view has to be released (use it as a context manager) before the next message is serialized.
+
+        Returns:
+            memoryview:
+            View over the serialized message in the buffer.
+        """
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        BytesGenerator(
+            self._buffer,
+            mangle_from_=False,
+            maxheaderlen=0,
+            policy=msg.policy.clone(linesep="\r\n"),
+        ).flatten(msg)
+        return self._buffer.getbuffer()
+
+    def transmit(
+        self, from_addr: str, to_addrs: List[str], msg: Union[bytes, memoryview]
+    ) -> Dict[str, Tuple[int, bytes]]:
+        """Sends a serialized message, similar to ``sendmail``, but writes the data straight from the buffer.
+
+        Args:
+            from_addr: Address of the sender.
+            to_addrs: Addresses of the recipients.
+            msg: Message serialized with ``CRLF`` line endings.
+
+        See Also:
+            - ``smtplib`` copies the message to quote leading periods and to append the terminator.
+            - Here, the message is copied only if it has a line that starts with a period.
+
+        Returns:
+            Dict[str, Tuple[int, bytes]]:
+            Recipients that were refused, along with the SMTP code and the error.
+        """
+        limiter = self.limiter
+        if limiter:
+            limiter.acquire()
+        with metrics.phase("smtp.data", recipients=len(to_addrs), size=len(msg)):
+            try:
+                refused = self._transmit(
+                    from_addr=from_addr, to_addrs=to_addrs, msg=msg
+                )
+            except smtplib.SMTPException as error:
+                metrics.error(error)
+                if limiter and limiter.temporary(error):
+                    limiter.throttled()
+                raise
+        if limiter:
+            limiter.success()
+        for code, _ in refused.values():
+            metrics.count("errors", status=code)
+        metrics.count("messages")
+        metrics.count("bytes_out", len(msg))
+        return refused
+
+    def _transmit(
+        self, from_addr: str, to_addrs: List[str], msg: Union[bytes, memoryview]
+    ) -> Dict[str, Tuple[int, bytes]]:
+        """Runs the ``MAIL``, ``RCPT`` and ``DATA`` commands for ``transmit``"""
+        server = self.server
+        server.ehlo_or_helo_if_needed()
+        options = ["size=%d" % len(msg)] if server.has_extn("size") else []
+        code, resp = server.mail(from_addr, options)
+        if code != 250:
+            if code == 421:
+                server.close()
+            else:
+                server.rset()
+            raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+        refused = {}
+        for each in to_addrs:
+            code, resp = server.rcpt(each)
+            if code not in (250, 251):
+                refused[each] = (code, resp)
+            if code == 421:
+                server.close()
+                raise smtplib.SMTPRecipientsRefused(refused)
+        if len(refused) == len(to_addrs):
+            server.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        server.putcmd("data")
+        code, resp = server.getreply()
+        if code != 354:
+            server.rset()
+            raise smtplib.SMTPDataError(code, resp)
+        if LEADING_PERIOD.search(msg):
+            msg = LEADING_PERIOD.sub(b"..", msg)
+        server.send(msg)
+        server.send(b".\r\n" if msg[-2:] == b"\r\n" else b"\r\n.\r\n")
+        code, resp = server.getreply()
+        if code != 250:
+            if code == 421:
+                server.close()
+            else:
+                server.rset()
+            raise smtplib.SMTPDataError(code, resp)
+        return refused
+
     def multipart_message(
         self,
         subject: str,
@@ -153,37 +427,17 @@ class SendEmail:
             msg.attach(payload=MIMEText(html_body, "html"))
 
         for index, attachment_ in enumerate(attachments):
-            file_type = attachment_.split(".")[-1]
             try:
                 filename = filenames[index]
             except IndexError:
                 filename = None
-            if filename and "." in filename:  # filename is passed with an extn
-                pass
-            elif (
-                filename and "." in attachment_
-            ):  # file name's extn is got from attachment name
-                filename = f"{filename}.{file_type}"
-            elif (
-                filename
-            ):  # filename is passed without an extn so proceeding with the same
-                pass
-            else:
-                filename = attachment_.split(os.path.sep)[
-                    -1
-                ].strip()  # rips path from attachment as filename
-
-            if not os.path.isfile(attachment_):
-                self._failed_attachments["FILE NOT FOUND"].append(filename)
-                continue
-            if os.path.getsize(attachment_) / 1e6 > 25:
-                self._failed_attachments["FILE SIZE OVER 25 MB"].append(filename)
+            filename = attachment_filename(attachment=attachment_, filename=filename)
+            if error := attachment_error(attachment=attachment_):
+                self._failed_attachments[error].append(filename)
                 continue
-
-            with open(attachment_, "rb") as file:
-                attribute = MIMEApplication(file.read(), _subtype=file_type)
-            attribute.add_header("Content-Disposition", "attachment", filename=filename)
-            msg.attach(payload=attribute)
+            msg.attach(
+                payload=attachment_part(attachment=attachment_, filename=filename)
+            )
 
         return msg
 
@@ -200,6 +454,7 @@ class SendEmail:
         cc: Union[str, list] = None,
         bcc: Union[str, list] = None,
         fail_if_attach_fails: bool = True,
+        idempotency_key: str = None,
     ) -> Response:
         """Initiates a TLS connection and sends the email.
 
@@ -215,6 +470,10 @@ class SendEmail:
             bcc: Email address of the recipient to whom the email has to be BCC'd.
             sender: Add sender name to the email.
             fail_if_attach_fails: Boolean flag to restrict sending the email if attachment is included but fails.
+            idempotency_key: Unique key for the email, to not send it again when the request is repeated.
+
+        See Also:
+            With an ``idempotency_key``, the ``Message-ID`` is derived from it, so every attempt has the same one.
 
         Returns:
             Response:
@@ -223,28 +482,50 @@ class SendEmail:
         recipient = validate_email(address=recipient)
         cc = validate_email(address=cc) if cc else None
         bcc = validate_email(address=bcc) if bcc else None
+        return self._once(
+            key=idempotency_key,
+            send=lambda message_id: self._send_email(
+                subject=subject,
+                recipient=recipient,
+                sender=sender,
+                body=body,
+                html_body=html_body,
+                attachment=attachment,
+                filename=filename,
+                custom_attachment=custom_attachment,
+                cc=cc,
+                bcc=bcc,
+                fail_if_attach_fails=fail_if_attach_fails,
+                message_id=message_id,
+            ),
+        )
+
+    def _send_email(
+        self,
+        subject: str,
+        recipient: Union[str, List[str]],
+        sender: str,
+        body: Union[str, None],
+        html_body: Union[str, None],
+        attachment: Union[str, list, None],
+        filename: Union[str, list, None],
+        custom_attachment: Union[Dict[Union[str, os.PathLike], str], None],
+        cc: Union[str, List[str], None],
+        bcc: Union[str, List[str], None],
+        fail_if_attach_fails: bool,
+        message_id: Union[str, None],
+    ) -> Response:
+        """Sends the email for ``send_email``, after the addresses have been validated."""
         if not self._authenticated:
             status = self.authenticate
             if not status.ok:
                 return status
-        if custom_attachment:
-            attachments = list(custom_attachment.keys())
-            filenames = list(custom_attachment.values())
-        else:
-            attachments = (
-                [attachment]
-                if isinstance(attachment, str)
-                else attachment
-                if attachment
-                else []
-            )
-            filenames = (
-                [filename]
-                if isinstance(filename, str)
-                else filename
-                if filename
-                else []
-            )
+        self._failed_attachments = {"FILE NOT FOUND": [], "FILE SIZE OVER 25 MB": []}
+        attachments, filenames = attachment_list(
+            attachment=attachment,
+            filename=filename,
+            custom_attachment=custom_attachment,
+        )
 
         msg = self.multipart_message(
             subject=subject,
@@ -256,6 +537,8 @@ class SendEmail:
             cc=cc,
             filenames=filenames,
         )
+        if message_id:
+            msg["Message-ID"] = message_id
 
         unattached = {k: ", ".join(v) for k, v in self._failed_attachments.items() if v}
         if fail_if_attach_fails and unattached:
@@ -272,16 +555,21 @@ class SendEmail:
             recipients.append(cc) if isinstance(cc, str) else recipients.extend(cc)
         if bcc:
             recipients.append(bcc) if isinstance(bcc, str) else recipients.extend(bcc)
-        for i in range(3):
-            try:
-                self.server.sendmail(
-                    from_addr=sender, to_addrs=recipients, msg=msg.as_string()
-                )
-                break
-            except smtplib.SMTPServerDisconnected as err:
-                if i == 2:
-                    raise err
-                continue
+        with self.serialize(msg=msg) as payload:
+            for i in range(3):
+                try:
+                    self.transmit(from_addr=sender, to_addrs=recipients, msg=payload)
+                    break
+                except smtplib.SMTPServerDisconnected as err:
+                    if i == 2:
+                        raise err
+                    metrics.count("retries")
+                    status = self.reconnect()
+                    if not status.ok:
+                        return status
+                except smtplib.SMTPException as error:
+                    if i == 2 or not self._backoff(error):
+                        raise
         if unattached:
             return Response(
                 dictionary={
@@ -298,3 +586,128 @@ class SendEmail:
                     "body": f"Email has been sent to {recipient!r}",
                 }
             )
+
+    def send_template(
+        self,
+        template: EmailTemplate,
+        recipient: Union[str, list],
+        variables: Dict[str, Any] = None,
+        cc: Union[str, list] = None,
+        bcc: Union[str, list] = None,
+        fail_if_attach_fails: bool = True,
+        idempotency_key: str = None,
+    ) -> Response:
+        """Renders a precompiled template for the recipient and sends the email.
+
+        Args:
+            template: Precompiled ``EmailTemplate`` object.
+            recipient: Email address of the recipient to whom the email has to be sent.
+            variables: Values for the placeholders in the subject and body of the template.
+            cc: Email address of the recipient to whom the email has to be CC'd.
+            bcc: Email address of the recipient to whom the email has to be BCC'd.
+            fail_if_attach_fails: Boolean flag to restrict sending the email if attachment is included but fails.
+            idempotency_key: Unique key for the email, to not send it again when the request is repeated.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status and body to the user.
+        """
+        recipient = validate_email(address=recipient)
+        cc = validate_email(address=cc) if cc else None
+        bcc = validate_email(address=bcc) if bcc else None
+        return self._once(
+            key=idempotency_key,
+            send=lambda message_id: self._send_template(
+                template=template,
+                recipient=recipient,
+                variables=variables,
+                cc=cc,
+                bcc=bcc,
+                fail_if_attach_fails=fail_if_attach_fails,
+                message_id=message_id,
+            ),
+        )
+
+    def _send_template(
+        self,
+        template: EmailTemplate,
+        recipient: Union[str, List[str]],
+        variables: Union[Dict[str, Any], None],
+        cc: Union[str, List[str], None],
+        bcc: Union[str, List[str], None],
+        fail_if_attach_fails: bool,
+        message_id: Union[str, None],
+    ) -> Response:
+        """Renders and sends the email for ``send_template``, after the addresses have been validated."""
+        unattached = {k: ", ".join(v) for k, v in template.unattached.items() if v}
+        if fail_if_attach_fails and unattached:
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": 422,
+                    "body": f"Email was not sent. Unattached: {unattached!r}",
+                }
+            )
+        if not self._authenticated:
+            status = self.authenticate
+            if not status.ok:
+                return status
+        recipient = [recipient] if isinstance(recipient, str) else recipient
+        cc = [cc] if isinstance(cc, str) else cc or []
+        bcc = [bcc] if isinstance(bcc, str) else bcc or []
+        try:
+            msg = template.render(
+                from_addr=self.env.gmail_user,
+                recipient=recipient,
+                cc=cc,
+                variables=variables,
+            )
+        except KeyError as error:
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": 422,
+                    "body": f"Email was not sent. Missing variable: {error}",
+                }
+            )
+        except ValueError as error:
+            return Response(
+                dictionary={
+                    "ok": False,
+                    "status": 422,
+                    "body": f"Email was not sent. Invalid placeholder: {error}",
+                }
+            )
+        if message_id:
+            msg = b"Message-ID: " + message_id.encode() + b"\r\n" + msg
+        for i in range(3):
+            try:
+                self.transmit(
+                    from_addr=template.sender, to_addrs=recipient + cc + bcc, msg=msg
+                )
+                break
+            except smtplib.SMTPServerDisconnected as err:
+                if i == 2:
+                    raise err
+                metrics.count("retries")
+                status = self.reconnect()
+                if not status.ok:
+                    return status
+            except smtplib.SMTPException as error:
+                if i == 2 or not self._backoff(error):
+                    raise
+        if unattached:
+            return Response(
+                dictionary={
+                    "ok": True,
+                    "status": 206,
+                    "body": f"Email has been sent to {recipient!r}. Unattached: {unattached!r}.",
+                }
+            )
+        return Response(
+            dictionary={
+                "ok": True,
+                "status": 200,
+                "body": f"Email has been sent to {recipient!r}",
+            }
+        )
@@ -1,15 +1,22 @@
 import re
 import smtplib
 import socket
-from typing import Union
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple, Union
 
 from typing_extensions import Unpack
 
-from .models.config import EgressConfig, Encryption, SMSGateway
+from . import tls
+from .instrumentation import metrics
+from .models.config import EgressConfig, Encryption, SMSGateway, egress_config
 from .models.responder import Response
-from .sms_deleter import DeleteSent
+
+# imaplib and the email parser are loaded only to delete the sent messages
+if TYPE_CHECKING:
+    from .ratelimit import RateLimiter
+    from .sms_deleter import SentReconciler
 
 COUNTRY_CODE = re.compile("^\\+\\d+")
+UNDISCLOSED = "undisclosed-recipients:;"
 
 
 class SendSMS:
@@ -19,8 +26,11 @@ class SendSMS:
 
     """
 
-    def __init__(self, **kwargs: "Unpack[EgressConfig]"):
-        """Loads all the necessary args, creates a connection with Gmail host based on chosen encryption type.
+    def __init__(self, config: EgressConfig = None, **kwargs: "Unpack[EgressConfig]"):
+        """Loads all the necessary args, the connection with Gmail host is created on first use.
+
+        Args:
+            config: Prebuilt ``EgressConfig`` to skip loading the settings, keyword arguments override its values.
 
         Keyword Args:
             gmail_user: Gmail username to authenticate SMTP lib.
@@ -28,10 +38,15 @@ class SendSMS:
             timeout: Connection timeout for SMTP lib.
             encryption: Type of encryption to be used.
             gmail_host: Hostname for gmail's smtp server.
+            rate_limit: Starting rate in messages per second, that adapts to the throttling by Gmail.
+            rate_limit_db: SQLite database file, to share the rate limit across processes.
         """
         self.server, self.error = None, None
-        self.env = EgressConfig(**kwargs)
+        self.env = egress_config(config, **kwargs)
         self._authenticated = False
+
+    def create_connection(self) -> None:
+        """Creates SSL/TLS connection based on the request parameter."""
         if self.env.encryption == Encryption.TLS:
             self.create_tls_connection(
                 host=self.env.gmail_host, timeout=self.env.timeout
@@ -43,16 +58,23 @@ class SendSMS:
 
     def create_ssl_connection(self, host: str, timeout: Union[int, float]) -> None:
         """Create a connection using SSL encryption."""
+        metrics.lookup(host=host, port=465)
         try:
-            self.server = smtplib.SMTP_SSL(host=host, port=465, timeout=timeout)
+            with metrics.phase("smtp.connect", host=host, encryption=Encryption.SSL):
+                self.server = smtplib.SMTP_SSL(
+                    host=host, port=465, timeout=timeout, context=tls.context()
+                )
         except (smtplib.SMTPException, socket.error) as error:
             self.error = error.__str__()
 
     def create_tls_connection(self, host: str, timeout: Union[int, float]) -> None:
         """Create a connection using TLS encryption."""
+        metrics.lookup(host=host, port=587)
         try:
-            self.server = smtplib.SMTP(host=host, port=587, timeout=timeout)
-            self.server.starttls()
+            with metrics.phase("smtp.connect", host=host, encryption=Encryption.TLS):
+                self.server = smtplib.SMTP(host=host, port=587, timeout=timeout)
+            with metrics.phase("smtp.starttls", host=host):
+                self.server.starttls(context=tls.context())
         except (smtplib.SMTPException, socket.error) as error:
             self.error = error.__str__()
 
@@ -64,6 +86,8 @@ class SendSMS:
             Response:
             A custom response object with properties: ok, status and body to the user.
         """
+        if self.server is None:
+            self.create_connection()
         if self.server is None:
             return Response(
                 dictionary={
@@ -74,7 +98,10 @@ class SendSMS:
                 }
             )
         try:
-            self.server.login(user=self.env.gmail_user, password=self.env.gmail_pass)
+            with metrics.phase("smtp.auth", user=self.env.gmail_user):
+                self.server.login(
+                    user=self.env.gmail_user, password=self.env.gmail_pass
+                )
             self._authenticated = True
             return Response(
                 dictionary={"ok": True, "status": 200, "body": "authentication success"}
@@ -88,11 +115,172 @@ class SendSMS:
                 dictionary={"ok": False, "status": 503, "body": error.__str__()}
             )
 
+    @property
+    def reconciler(self) -> "SentReconciler":
+        """Background reconciler that deletes the sent messages from GMAIL's sent items.
+
+        Returns:
+            SentReconciler:
+            Reconciler shared by all the objects using the same Gmail account.
+        """
+        from .sms_deleter import SentReconciler
+
+        return SentReconciler.shared(
+            username=self.env.gmail_user, password=self.env.gmail_pass
+        )
+
+    @property
+    def limiter(self) -> Union["RateLimiter", None]:
+        """Rate limiter shared by all the objects using the same Gmail account, when ``rate_limit`` is set.
+
+        Returns:
+            RateLimiter:
+            Rate limiter for the account, or ``None`` when sending is not rate limited.
+        """
+        if not self.env.rate_limit:
+            return None
+        from .ratelimit import RateLimiter
+
+        return RateLimiter.shared(
+            key=self.env.gmail_user,
+            path=self.env.rate_limit_db,
+            rate=self.env.rate_limit,
+        )
+
+    def _backoff(self, error: smtplib.SMTPException) -> bool:
+        """Prepares to send a message again after a temporary failure, when sending is rate limited.
+
+        See Also:
+            The rate limiter has slowed down already, so the next attempt waits for it instead of retrying right away.
+
+        Returns:
+            bool:
+            Returns ``True`` if the message should be sent again.
+        """
+        limiter = self.limiter
+        if limiter is None or not limiter.temporary(error):
+            return False
+        metrics.count("retries")
+        if getattr(error, "smtp_code", None) == 421:  # server closes the connection
+            return self.reconnect().ok
+        return True
+
+    def _sendmail(self, to_addrs: List[str], msg: str) -> Dict[str, Tuple[int, bytes]]:
+        """Sends a message within the rate limit, and adapts the rate to the reply from the server.
+
+        Returns:
+            Dict[str, Tuple[int, bytes]]:
+            Recipients that were refused, along with the SMTP code and the error.
+        """
+        limiter = self.limiter
+        if limiter:
+            limiter.acquire()
+        try:
+            with metrics.phase("smtp.data", recipients=len(to_addrs), size=len(msg)):
+                refused = self.server.sendmail(
+                    from_addr=self.env.gmail_user, to_addrs=to_addrs, msg=msg
+                )
+        except smtplib.SMTPException as error:
+            if limiter and limiter.temporary(error):
+                limiter.throttled()
+            raise
+        if limiter:
+            limiter.success()
+        return refused
+
+    def reconnect(self) -> Response:
+        """Drops the current connection, then connects and authenticates again.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status and body to the user.
+        """
+        if self.server:
+            self.server.close()
+        self.server, self._authenticated = None, False
+        return self.authenticate
+
+    def close(self) -> None:
+        """Ends the session with ``QUIT``, a new connection is created if the object is used again."""
+        server, self.server, self._authenticated = self.server, None, False
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def __enter__(self):
+        """Returns the object itself, which connects on first use."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Ends the session."""
+        self.close()
+
     def __del__(self):
         """Destructor has been called to close the connection and logout."""
-        if self.server:
+        if getattr(self, "server", None):
             self.server.close()
 
+    @staticmethod
+    def gateway_address(
+        phone: str, country_code: str = None, sms_gateway: SMSGateway = None
+    ) -> str:
+        """Forms the email address of the phone number using the SMS gateway of the carrier.
+
+        Args:
+            phone: Phone number.
+            country_code: Country code of the phone number. Defaults to ``+1``
+            sms_gateway: Takes the SMS gateway of the carrier as an argument. Defaults to ``tmomail.net``
+
+        Returns:
+            str:
+            Email address of the phone number.
+        """
+        if not all((phone, len(phone) == 10)):
+            raise ValueError("\n\tcannot proceed without a valid phone number")
+        if not sms_gateway:
+            sms_gateway = SMSGateway.tmobile
+        if not country_code:
+            country_code = "+1"
+        if COUNTRY_CODE.match(country_code):
+            return country_code + phone + "@" + sms_gateway
+        raise ValueError(
+            f"\n\tcountry code should match the pattern {COUNTRY_CODE.pattern}"
+        )
+
+    def compose(self, to: str, subject: str, body: str) -> str:
+        """Creates the raw message that is sent to the SMS gateway.
+
+        Args:
+            to: To address of the message.
+            subject: Subject line for the message.
+            body: Content of the message.
+
+        Returns:
+            str:
+            Raw message with the headers and the body.
+        """
+        return (
+            f"From: {self.env.gmail_user}\n"
+            + f"To: {to}\n"
+            + f"Subject: {subject}\n"
+            + body
+        )
+
+    @staticmethod
+    def _oversize(message: str, body: str) -> Response:
+        """Response for a message that is larger than what the SMS gateway can handle."""
+        return Response(
+            dictionary={
+                "ok": False,
+                "status": 413,
+                "body": f"Payload length: {len(message):,}, which is more than the optimal size: 428. "
+                f"Message length: {len(body):,}",
+            }
+        )
+
     def send_sms(
         self,
         message: str,
@@ -113,6 +301,10 @@ class SendSMS:
             delete_sent: Boolean flag to delete the message from GMAIL's sent items. Defaults to ``False``.
 
         See Also:
+            - Messages to be deleted are queued in the ``reconciler``, which deletes them in batches in the background.
+            - Use ``reconciler.flush()`` to wait for the deletion.
+            - The ``extra`` property only says that the message was queued, the information of the deleted messages is
+              in ``reconciler.deleted`` and the ones that could not be deleted are in ``reconciler.failed``
             - Encodes body of the message to `ascii` with `ignore` flag and then decodes it.
             - This is done to ignore special characters (like °) without raising `UnicodeEncodeError`
 
@@ -123,66 +315,194 @@ class SendSMS:
             Response:
             A custom response object with properties: ok, status and body to the user.
         """
-        if not all((phone, len(phone) == 10)):
-            raise ValueError("\n\tcannot proceed without a valid phone number")
-        if not sms_gateway:
-            sms_gateway = SMSGateway.tmobile
-        if not country_code:
-            country_code = "+1"
-        if COUNTRY_CODE.match(country_code):
-            to = country_code + phone + "@" + sms_gateway
-        else:
-            raise ValueError(
-                f"\n\tcountry code should match the pattern {COUNTRY_CODE.pattern}"
-            )
+        to = self.gateway_address(
+            phone=phone, country_code=country_code, sms_gateway=sms_gateway
+        )
         body = f"\n{message}".encode("ascii", "ignore").decode("ascii")
         subject = subject or f"Message from {self.env.gmail_user}"
         if not self._authenticated:
             status = self.authenticate
             if not status.ok:
                 return status
-        message = (
-            f"From: {self.env.gmail_user}\n"
-            + f"To: {to}\n"
-            + f"Subject: {subject}\n"
-            + body
-        )
+        message = self.compose(to=to, subject=subject, body=body)
         if len(message) > 428:
-            return Response(
-                dictionary={
-                    "ok": False,
-                    "status": 413,
-                    "body": f"Payload length: {len(message):,}, which is more than the optimal size: 428. "
-                    f"Message length: {len(body):,}",
-                }
-            )
+            return self._oversize(message=message, body=body)
 
-        self.server.sendmail(from_addr=self.env.gmail_user, to_addrs=to, msg=message)
+        for attempt in range(2):
+            try:
+                self._sendmail(to_addrs=[to], msg=message)
+                break
+            except smtplib.SMTPServerDisconnected as error:
+                metrics.error(error)
+                if attempt:
+                    raise
+                metrics.count("retries")
+                status = self.reconnect()
+                if not status.ok:
+                    return status
+            except smtplib.SMTPException as error:
+                metrics.error(error)
+                if attempt or not self._backoff(error):
+                    raise
+        metrics.count("messages")
+        metrics.count("bytes_out", len(message))
 
         if delete_sent:
-            if delete_response := DeleteSent(
-                username=self.env.gmail_user,
-                password=self.env.gmail_pass,
-                subject=subject,
-                body=body,
-                to=to,
-            ).delete_sent():
-                return Response(
-                    dictionary={
-                        "ok": True,
-                        "status": 200,
-                        "body": f"SMS has been sent to {to}",
-                        "extra": delete_response,
-                    }
-                )
+            self.reconciler.submit(subject=subject, body=body, to=to)
             return Response(
                 dictionary={
                     "ok": True,
-                    "status": 206,
+                    "status": 200,
                     "body": f"SMS has been sent to {to}",
-                    "extra": "Failed to locate and delete the SMS from Sent Mail.",
+                    "extra": "Queued for deletion from Sent Mail.",
                 }
             )
         return Response(
             dictionary={"ok": True, "status": 200, "body": f"SMS has been sent to {to}"}
         )
+
+    def send_bulk(
+        self,
+        message: str,
+        phones: Union[Iterable[str], Dict[str, str]],
+        country_code: str = None,
+        subject: str = None,
+        sms_gateway: SMSGateway = None,
+        delete_sent: bool = False,
+        batch_size: int = 100,
+    ) -> Response:
+        """Sends the same text message to multiple phone numbers, using one transaction per carrier.
+
+        Args:
+            message: Content of the message.
+            phones: Phone numbers, or a dictionary of phone numbers and the SMS gateway of their carrier.
+            country_code: Country code of the phone numbers.
+            subject: Subject line for the message. Defaults to "Message from email address."
+            sms_gateway: SMS gateway for the phone numbers that don't have one. Defaults to ``tmomail.net``
+            delete_sent: Boolean flag to delete the messages from GMAIL's sent items. Defaults to ``False``.
+            batch_size: Maximum number of recipients in a single transaction.
+
+        See Also:
+            - Recipients are grouped by their SMS gateway, and each group is sent as one message with multiple
+              ``RCPT`` commands, so the number of round trips scales with the carriers and not the phone numbers.
+            - All the messages are sent over the same authenticated session.
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status and body to the user.
+            The ``extra`` property holds a response object for each gateway address.
+        """
+        if not isinstance(phones, dict):
+            phones = dict.fromkeys(phones, sms_gateway)
+        carriers: Dict[str, List[str]] = {}
+        for phone, gateway in phones.items():
+            to = self.gateway_address(
+                phone=phone,
+                country_code=country_code,
+                sms_gateway=gateway or sms_gateway,
+            )
+            carriers.setdefault(to.split("@")[-1], []).append(to)
+        body = f"\n{message}".encode("ascii", "ignore").decode("ascii")
+        subject = subject or f"Message from {self.env.gmail_user}"
+        payload = self.compose(to=UNDISCLOSED, subject=subject, body=body)
+        if len(payload) > 428:
+            return self._oversize(message=payload, body=body)
+        if not self._authenticated:
+            status = self.authenticate
+            if not status.ok:
+                return status
+
+        results: Dict[str, Response] = {}
+        for recipients in carriers.values():
+            for index in range(0, len(recipients), batch_size):
+                batch = recipients[index : index + batch_size]
+                results.update(self._send_batch(recipients=batch, payload=payload))
+                if delete_sent and any(results[to].ok for to in batch):
+                    self.reconciler.submit(subject=subject, body=body, to=UNDISCLOSED)
+
+        sent = sum(1 for result in results.values() if result.ok)
+        if sent == len(results):
+            status = 200
+        elif sent:
+            status = 207
+        else:
+            status = 503
+        return Response(
+            dictionary={
+                "ok": bool(sent),
+                "status": status,
+                "body": f"SMS has been sent to {sent} of {len(results)} recipients",
+                "extra": results,
+            }
+        )
+
+    def _send_batch(self, recipients: List[str], payload: str) -> Dict[str, Response]:
+        """Sends the payload to a batch of recipients in a single transaction, and reconnects once if disconnected.
+
+        Args:
+            recipients: Gateway addresses of the recipients.
+            payload: Raw message to be sent.
+
+        Returns:
+            Dict[str, Response]:
+            Response for each recipient in the batch.
+        """
+        for attempt in range(2):
+            try:
+                refused = self._sendmail(to_addrs=recipients, msg=payload)
+                break
+            except smtplib.SMTPServerDisconnected as error:
+                metrics.error(error)
+                if attempt:
+                    return self._failed(recipients, 503, error.__str__())
+                metrics.count("retries")
+                status = self.reconnect()
+                if not status.ok:
+                    return self._failed(recipients, status.status, status.body)
+            except smtplib.SMTPRecipientsRefused as error:
+                if not attempt and self._backoff(error):
+                    continue
+                refused = error.recipients
+                break
+            except smtplib.SMTPResponseException as error:
+                metrics.error(error)
+                if not attempt and self._backoff(error):
+                    continue
+                return self._failed(recipients, error.smtp_code, error.smtp_error)
+        for code, _ in refused.values():
+            metrics.count("errors", status=code)
+        if len(refused) < len(recipients):
+            metrics.count("messages")
+            metrics.count("bytes_out", len(payload))
+        results = {}
+        for to in recipients:
+            if to in refused:
+                code, reason = refused[to]
+                results[to] = Response(
+                    dictionary={
+                        "ok": False,
+                        "status": code,
+                        "body": reason.decode(errors="replace"),
+                    }
+                )
+            else:
+                results[to] = Response(
+                    dictionary={
+                        "ok": True,
+                        "status": 200,
+                        "body": f"SMS has been sent to {to}",
+                    }
+                )
+        return results
+
+    @staticmethod
+    def _failed(
+        recipients: List[str], status: int, body: Union[str, bytes]
+    ) -> Dict[str, Response]:
+        """Creates the same failed response for all the recipients in a batch."""
+        if isinstance(body, bytes):
+            body = body.decode(errors="replace")
+        return {
+            to: Response(dictionary={"ok": False, "status": status, "body": body})
+            for to in recipients
+        }
@@ -0,0 +1,402 @@
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Iterable, List, Tuple, Union
+
+from .models.config import EgressConfig, egress_config
+from .models.responder import Response
+from .send_email import SendEmail
+
+default_logger = logging.getLogger("sharding")
+
+# Gmail replies with 421 and 454 when an account is sending too fast, and with 550 5.4.5 once the daily quota is used up
+THROTTLE_CODES = (421, 454)
+QUOTA_EXCEEDED = b"5.4.5"
+
+
+def throttled(code: int, error: Union[bytes, str]) -> bool:
+    """Checks if an SMTP reply means that the account is throttled.
+
+    Args:
+        code: SMTP reply code.
+        error: SMTP reply text.
+
+    Returns:
+        bool:
+        Returns ``True`` if the account should stop sending for a while.
+    """
+    if isinstance(error, str):
+        error = error.encode()
+    return code in THROTTLE_CODES or (code == 550 and QUOTA_EXCEEDED in error)
+
+
+def recipient_count(*addresses: Union[str, List[str], None]) -> int:
+    """Counts the recipients of an email, since Gmail's limits apply to recipients and not messages."""
+    return sum(
+        (1 if isinstance(address, str) else len(address))
+        for address in addresses
+        if address
+    )
+
+
+class Strategy(str, Enum):
+    """Wrapper for the strategies to pick an account for the next email."""
+
+    round_robin: str = "round_robin"
+    least_loaded: str = "least_loaded"
+
+
+class Account:
+    """Sending account of a ``ShardedSender`` along with its limits and usage.
+
+    >>> Account
+
+    """
+
+    def __init__(
+        self,
+        config: EgressConfig = None,
+        weight: int = 1,
+        daily_quota: int = 500,
+        per_minute: int = 60,
+        **kwargs,
+    ):
+        """Loads the settings for the account, the connection is created on first use.
+
+        Args:
+            config: Prebuilt ``EgressConfig`` to skip loading the settings, keyword arguments override its values.
+            weight: Share of the emails sent through this account, relative to the other accounts.
+            daily_quota: Number of recipients that the account can send to, in any 24-hour window.
+            per_minute: Number of emails that the account can send in any 60-second window.
+
+        Keyword Args:
+            gmail_user: Gmail username to authenticate SMTP lib.
+            gmail_pass: Gmail password to authenticate SMTP lib.
+            timeout: Connection timeout for SMTP lib.
+            encryption: Type of encryption to be used.
+            gmail_host: Hostname for gmail's smtp server.
+        """
+        if weight < 1:
+            raise ValueError("weight must be a positive integer")
+        self.env = egress_config(config, **kwargs)
+        self.sender = SendEmail(config=self.env)
+        self.weight = weight
+        self.daily_quota = daily_quota
+        self.per_minute = per_minute
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.drained_until = 0.0
+        self.throttles = 0
+        self.current = 0  # for smooth weighted round-robin
+        self._day: Deque[Tuple[float, int]] = deque()
+        self._day_total = 0
+        self._minute: Deque[float] = deque()
+
+    @property
+    def user(self) -> str:
+        """Username of the account."""
+        return self.env.gmail_user
+
+    def _expire(self, now: float) -> None:
+        """Drops the sends that are outside the quota windows."""
+        while self._day and self._day[0][0] <= now - 86_400:
+            self._day_total -= self._day.popleft()[1]
+        while self._minute and self._minute[0] <= now - 60:
+            self._minute.popleft()
+
+    def usage(self, now: float) -> float:
+        """Fraction of the daily quota or the rate limit that is used up, whichever is higher."""
+        self._expire(now)
+        return max(
+            self._day_total / self.daily_quota, len(self._minute) / self.per_minute
+        )
+
+    def available(self, now: float, recipients: int = 1) -> bool:
+        """Checks if the account is not drained, and can send to the given number of recipients within its limits."""
+        self._expire(now)
+        return (
+            now >= self.drained_until
+            and self._day_total + recipients <= self.daily_quota
+            and len(self._minute) < self.per_minute
+        )
+
+    def next_available(self, now: float, recipients: int = 1) -> float:
+        """Seconds until the account can send to the given number of recipients, assuming no other sends."""
+        self._expire(now)
+        wait = max(0.0, self.drained_until - now)
+        if len(self._minute) >= self.per_minute:
+            wait = max(wait, self._minute[0] + 60 - now)
+        excess = self._day_total + recipients - self.daily_quota
+        for sent_at, count in self._day:
+            if excess <= 0:
+                break
+            excess -= count
+            wait = max(wait, sent_at + 86_400 - now)
+        return wait
+
+    def reserve(self, now: float, recipients: int) -> float:
+        """Counts a send against the limits of the account, before it is sent.
+
+        Returns:
+            float:
+            Time of the reservation, to give it back with ``release``
+        """
+        self._day.append((now, recipients))
+        self._day_total += recipients
+        self._minute.append(now)
+        return now
+
+    def release(self, reserved_at: float, recipients: int) -> None:
+        """Gives back the limits reserved for a send that did not go through, unless they have expired already."""
+        try:
+            self._day.remove((reserved_at, recipients))
+        except ValueError:
+            return
+        self._day_total -= recipients
+        try:
+            self._minute.remove(reserved_at)
+        except ValueError:
+            pass
+
+    def stats(self, now: float = None) -> Dict[str, Any]:
+        """Current usage and state of the account."""
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        return dict(
+            user=self.user,
+            weight=self.weight,
+            sent_today=self._day_total,
+            daily_quota=self.daily_quota,
+            sent_last_minute=len(self._minute),
+            per_minute=self.per_minute,
+            in_flight=self.in_flight,
+            throttles=self.throttles,
+            drained_for=max(0.0, self.drained_until - now),
+        )
+
+
+class ShardedSender:
+    """Spreads emails across several Gmail accounts, to send more than the limits of a single account.
+
+    >>> ShardedSender
+
+    See Also:
+        - Each account has a daily quota of recipients and a per-minute rate, which are tracked locally.
+        - An account that is throttled by Gmail (``421``, ``454`` or ``550 5.4.5``) is drained for a while,
+          and the email is sent through the next account instead.
+    """
+
+    def __init__(
+        self,
+        accounts: Iterable[Union[Account, EgressConfig, Dict[str, Any]]],
+        strategy: Union[Strategy, str] = Strategy.round_robin,
+        cooldown: Union[int, float] = 60,
+        max_cooldown: Union[int, float] = 3_600,
+        quota_cooldown: Union[int, float] = 3_600,
+        logger: logging.Logger = default_logger,
+    ):
+        """Loads the accounts, connections are created on first use.
+
+        Args:
+            accounts: ``Account`` objects, prebuilt ``EgressConfig`` or keyword arguments for ``Account``
+            strategy: Weighted round-robin, or the account that has used the least of its limits.
+            cooldown: Seconds that an account is drained for after it is throttled, doubled for every throttle in a row.
+            max_cooldown: Maximum seconds that a throttled account is drained for.
+            quota_cooldown: Seconds that an account is drained for after Gmail reports its daily quota as used up.
+            logger: Bring your own logger.
+        """
+        self.accounts: List[Account] = []
+        for account in accounts:
+            if isinstance(account, dict):
+                account = Account(**account)
+            elif isinstance(account, EgressConfig):
+                account = Account(config=account)
+            self.accounts.append(account)
+        if not self.accounts:
+            raise ValueError("at least one account is required")
+        self.strategy = Strategy(strategy)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.quota_cooldown = quota_cooldown
+        self.logger = logger
+        self._lock = threading.Lock()
+
+    def _select(
+        self, recipients: int, exclude: List[Account]
+    ) -> Union[Tuple[Account, float], None]:
+        """Picks the account for the next email, among the ones that are available and were not tried already.
+
+        Returns:
+            Tuple[Account, float]:
+            Account and the time its limits were reserved at, or ``None`` if no account is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                account
+                for account in self.accounts
+                if account not in exclude and account.available(now, recipients)
+            ]
+            if not candidates:
+                return None
+            if self.strategy is Strategy.least_loaded:
+                account = min(
+                    candidates,
+                    key=lambda each: (each.in_flight, each.usage(now) / each.weight),
+                )
+            else:
+                # smooth weighted round-robin, spreads the heavier accounts instead of sending to them in bursts
+                total = 0
+                for each in candidates:
+                    each.current += each.weight
+                    total += each.weight
+                account = max(candidates, key=lambda each: each.current)
+                account.current -= total
+            account.in_flight += 1
+            # reserved right away, so that concurrent sends do not go over the limits
+            return account, account.reserve(now, recipients)
+
+    def _done(
+        self, account: Account, reserved_at: float, recipients: int, sent: bool
+    ) -> None:
+        """Frees up the account, and gives back the reserved limits if the email was not sent."""
+        with self._lock:
+            account.in_flight -= 1
+            if sent:
+                account.throttles = 0
+            else:
+                account.release(reserved_at, recipients)
+
+    def drain(self, account: Account, duration: Union[int, float] = None) -> None:
+        """Stops sending through an account for a while, the emails already in progress are left to finish.
+
+        Args:
+            account: Account to drain.
+            duration: Seconds to drain the account for, defaults to the cooldown based on the throttles in a row.
+        """
+        with self._lock:
+            account.throttles += 1
+            if duration is None:
+                duration = min(
+                    self.max_cooldown, self.cooldown * 2 ** (account.throttles - 1)
+                )
+            account.drained_until = max(
+                account.drained_until, time.monotonic() + duration
+            )
+        self.logger.warning("Draining %s for %.0fs", account.user, duration)
+        # waits for the email in progress on the connection, if any
+        with account.lock:
+            account.sender.close()
+
+    def _dispatch(
+        self, send: Callable[[SendEmail], Response], recipients: int
+    ) -> Response:
+        """Sends an email through the selected account, and fails over to the next one when it is throttled."""
+        tried = []
+        while selected := self._select(recipients, exclude=tried):
+            account, reserved_at = selected
+            tried.append(account)
+            sent = False
+            try:
+                with account.lock:
+                    response = send(account.sender)
+                sent = response.ok
+            except smtplib.SMTPRecipientsRefused as error:
+                codes = list(error.recipients.values())
+                if not any(throttled(code, text) for code, text in codes):
+                    raise
+                self._throttled(account, *codes[0])
+                continue
+            except smtplib.SMTPResponseException as error:
+                if not throttled(error.smtp_code, error.smtp_error):
+                    raise
+                self._throttled(account, error.smtp_code, error.smtp_error)
+                continue
+            finally:
+                self._done(account, reserved_at, recipients, sent=sent)
+            if sent:
+                # extra is left to the sender, like the Message-ID of an email that was sent already
+                response.raw["account"] = account.user
+                return response
+            if (
+                response.status == 422
+            ):  # email could not be formed, same for every account
+                return response
+            # failed to connect or authenticate, which is also how Gmail rejects accounts that log in too often
+            self.logger.warning("Failing over from %s: %s", account.user, response.body)
+            self.drain(account)
+        now = time.monotonic()
+        wait = min(account.next_available(now, recipients) for account in self.accounts)
+        return Response(
+            dictionary={
+                "ok": False,
+                "status": 429,
+                "body": f"All accounts are throttled or over their limits, next available in {wait:.0f}s",
+                "extra": wait,
+            }
+        )
+
+    def _throttled(self, account: Account, code: int, error: Union[bytes, str]) -> None:
+        """Drains an account that was throttled by Gmail."""
+        self.logger.warning("%s was throttled with %d: %r", account.user, code, error)
+        if code == 550:
+            self.drain(account, duration=self.quota_cooldown)
+        else:
+            self.drain(account)
+
+    def send_email(self, **kwargs) -> Response:
+        """Sends an email through one of the accounts.
+
+        Keyword Args:
+            Arguments for ``SendEmail.send_email``
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status, body, extra and the account used.
+        """
+        return self._dispatch(
+            lambda sender: sender.send_email(**kwargs),
+            recipient_count(
+                kwargs.get("recipient"), kwargs.get("cc"), kwargs.get("bcc")
+            ),
+        )
+
+    def send_template(self, **kwargs) -> Response:
+        """Sends a precompiled template through one of the accounts.
+
+        Keyword Args:
+            Arguments for ``SendEmail.send_template``
+
+        Returns:
+            Response:
+            A custom response object with properties: ok, status, body, extra and the account used.
+        """
+        return self._dispatch(
+            lambda sender: sender.send_template(**kwargs),
+            recipient_count(
+                kwargs.get("recipient"), kwargs.get("cc"), kwargs.get("bcc")
+            ),
+        )
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Current usage and state of every account."""
+        now = time.monotonic()
+        with self._lock:
+            return [account.stats(now) for account in self.accounts]
+
+    def close(self) -> None:
+        """Ends the session of every account."""
+        for account in self.accounts:
+            with account.lock:
+                account.sender.close()
+
+    def __enter__(self):
+        """Returns the object itself, accounts connect on first use."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Ends the session of every account."""
+        self.close()
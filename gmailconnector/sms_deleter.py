@@ -1,10 +1,82 @@
+import atexit
+import datetime
 import email
 import imaplib
-from concurrent.futures import ThreadPoolExecutor
+import queue
+import re
+import threading
+import warnings
+from collections import deque
 from email.header import decode_header, make_header
-from typing import Dict, Union
+from email.message import Message
+from typing import Deque, Dict, Iterable, List, Union
 
-from .models.options import Folder
+from . import compression, tls
+from .instrumentation import metrics
+from .models.options import Condition, Folder
+from .uids import compress, parse, uid_sets
+
+UID = re.compile(rb"UID (\d+)")
+BATCH_SIZE = 50
+
+
+def matches(
+    original_email: Message, username: str, subject: str, body: str, to: str
+) -> bool:
+    """Checks if an email from the sent items is the SMS that was sent.
+
+    Args:
+        original_email: Email from the sent items.
+        username: Gmail username that sent the SMS.
+        subject: Subject of the SMS.
+        body: Body of the SMS.
+        to: To address of the SMS.
+
+    Returns:
+        bool:
+        Boolean flag to indicate whether the email matches the SMS.
+    """
+    sender = str(make_header(decode_header((original_email["From"]).split(" <")[0])))
+    sub = str(make_header(decode_header(original_email["Subject"])))
+    recipient = str(make_header(decode_header(original_email["To"])))
+    return (
+        recipient == to
+        and sub == subject
+        and sender == username
+        and original_email.__dict__.get("_payload", "").strip() == body.strip()
+    )
+
+
+def search_subject(mail: imaplib.IMAP4, subject: str, *criteria: str) -> tuple:
+    """Runs ``UID SEARCH`` for the emails with a subject, along with other criteria.
+
+    Args:
+        mail: IMAP session with the folder selected.
+        subject: Subject of the emails, as it was sent.
+        *criteria: Other search keys, like ``SINCE``
+
+    See Also:
+        - Quotes and backslashes are escaped, and a subject that is not ASCII is sent as a ``UTF-8`` literal.
+        - ``imaplib`` encodes commands as ASCII, so the literal is the only way to send other characters.
+
+    Returns:
+        tuple:
+        Return code and the data from the server.
+    """
+    subject = subject.replace("\r", " ").replace("\n", " ")
+    if subject.isascii():
+        escaped = subject.replace("\\", "\\\\").replace('"', '\\"')
+        return mail.uid("SEARCH", None, *criteria, f'SUBJECT "{escaped}"')
+    mail.literal = subject.encode()
+    return mail.uid("SEARCH", "CHARSET", "UTF-8", *criteria, "SUBJECT")
+
+
+def summary(original_email: Message) -> Dict[str, str]:
+    """Information about an email that was deleted from the sent items."""
+    return dict(
+        msg_id=original_email["Message-ID"],
+        msg_context=" ".join((original_email["Received"] or "").split()),
+    )
 
 
 class DeleteSent:
@@ -23,12 +95,14 @@ class DeleteSent:
             subject: Subject of the email to be deleted.
             body: Body of the email to be deleted.
             to: To address of the email to be deleted.
+            compress: Boolean flag to compress the connection with ``COMPRESS=DEFLATE``, when the server supports it.
         """
         self.username = kwargs.get("username")
         self.password = kwargs.get("password")
         self.subject = kwargs.get("subject")
         self.body = kwargs.get("body")
         self.to = kwargs.get("to")
+        self.compress = kwargs.get("compress", False)
         self.mail = None
         self.error = None
         self.create_ssl_connection()
@@ -36,69 +110,381 @@ class DeleteSent:
     def create_ssl_connection(self) -> None:
         """Creates a connection using SSL encryption and selects the sent folder."""
         try:
-            self.mail = imaplib.IMAP4_SSL("imap.gmail.com")
-            self.mail.login(user=self.username, password=self.password)
+            with metrics.phase("imap.connect", host="imap.gmail.com"):
+                self.mail = imaplib.IMAP4_SSL(
+                    "imap.gmail.com", ssl_context=tls.context()
+                )
+            with metrics.phase("imap.auth", user=self.username):
+                self.mail.login(user=self.username, password=self.password)
+            if self.compress:
+                compression.enable(self.mail)
             self.mail.list()
             self.mail.select(Folder.sent)
         except Exception as error:
             self.error = error.__str__()
 
-    def thread_executor(self, item_id: Union[bytes, str]) -> Dict[str, str]:
-        """Gets invoked in multiple threads, to set the flag as ``Deleted`` for the message which was just sent.
+    def delete_sent(self) -> Union[Dict[str, str], None]:
+        """Deletes the email from GMAIL's sent items right after sending the message.
+
+        See Also:
+            - Candidates are searched by subject, and fetched newest first in batches with ``UID FETCH``
+            - The match is deleted with one ``UID STORE`` and one ``EXPUNGE``
+
+        Warnings:
+            Time taken for deletion depends on the number of emails with the same subject in the ``Sent`` folder.
+        """
+        if self.mail is None:
+            return
+        try:
+            return self._delete()
+        except imaplib.IMAP4.error as error:
+            self.error = error.__str__()
+
+    def _delete(self) -> Union[Dict[str, str], None]:
+        """Searches, fetches and deletes the email for ``delete_sent``"""
+        return_code, messages = search_subject(self.mail, self.subject)
+        if return_code != "OK":
+            return
+        uids = parse(messages)
+        for end in range(len(uids), 0, -BATCH_SIZE):
+            uid_set = compress(uids[max(0, end - BATCH_SIZE) : end])
+            return_code, data = self.mail.uid("FETCH", uid_set, "(BODY.PEEK[])")
+            if return_code != "OK":
+                return
+            if deleted := self._delete_match(reversed(data)):
+                self.mail.close()
+                self.mail.logout()
+                return deleted
+
+    def _delete_match(
+        self, data: Iterable[Union[bytes, tuple]]
+    ) -> Union[Dict[str, str], None]:
+        """Deletes the first message of a ``FETCH`` response that matches the email, with ``UID STORE`` and ``EXPUNGE``
 
         Args:
-            item_id: Takes the ID of the message as an argument.
+            data: Response parts with the ``UID`` and the content of each message.
+
+        Returns:
+            Dict[str, str]:
+            Information about the email that was deleted, or ``None`` if none of the messages matched.
         """
-        dummy, data = self.mail.fetch(item_id, "(RFC822)")
         for response_part in data:
             if not isinstance(response_part, tuple):
                 continue
-            original_email = email.message_from_bytes(
-                response_part[1]
-            )  # gets the raw content
-            sender = str(
-                make_header(decode_header((original_email["From"]).split(" <")[0]))
-            )
-            sub = str(make_header(decode_header(original_email["Subject"])))
-            to = str(make_header(decode_header(original_email["To"])))
-            if (
-                to == self.to
-                and sub == self.subject
-                and sender == self.username
-                and original_email.__dict__.get("_payload", "").strip()
-                == self.body.strip()
+            original_email = email.message_from_bytes(response_part[1])
+            if not matches(
+                original_email,
+                username=self.username,
+                subject=self.subject,
+                body=self.body,
+                to=self.to,
             ):
-                self.mail.store(item_id.decode("UTF-8"), "+FLAGS", "\\Deleted")
+                continue
+            uid = UID.search(response_part[0]).group(1).decode()
+            self.mail.uid("STORE", uid, "+FLAGS.SILENT", "(\\Deleted)")
+            if "UIDPLUS" in self.mail.capabilities:
+                self.mail.uid("EXPUNGE", uid)
+            else:
                 self.mail.expunge()
-                return dict(
-                    msg_id=original_email["Message-ID"],
-                    msg_context=" ".join(original_email["Received"].split()),
-                )
+            return summary(original_email)
 
-    def delete_sent(self) -> Union[Dict[str, str], None]:
-        """Deletes the email from GMAIL's sent items right after sending the message.
+    def thread_executor(
+        self, item_id: Union[bytes, str]
+    ) -> Union[Dict[str, str], None]:
+        """Deletes a message from the sent items if it is the email, kept for callers of the earlier versions.
+
+        Args:
+            item_id: Sequence number of the message in the ``Sent`` folder.
 
         See Also:
-            Invokes ``thread_executor`` to sweep through sent items to delete the email.
+            Deprecated, ``delete_sent`` searches for the email by its subject instead of checking every message.
 
-        Warnings:
-            Time taken for deletion depends on the number of existing emails in the ``Sent`` folder.
+        Returns:
+            Dict[str, str]:
+            Information about the email that was deleted, or ``None`` if the message is not the email.
+        """
+        warnings.warn(
+            "DeleteSent.thread_executor is deprecated, use DeleteSent.delete_sent instead",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        if isinstance(item_id, bytes):
+            item_id = item_id.decode()
+        return_code, data = self.mail.fetch(item_id, "(UID BODY.PEEK[])")
+        if return_code != "OK":
+            return
+        return self._delete_match(data)
+
+
+class SentReconciler:
+    """Deletes the SMS emails from SentItems in the background, in batches over a single IMAP session.
+
+    >>> SentReconciler
+
+    """
+
+    _shared: Dict[str, "SentReconciler"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        interval: Union[int, float] = 2,
+        max_attempts: int = 5,
+        compress: bool = False,
+    ):
+        """Initiates the queue of messages to be deleted and starts the background thread.
+
+        Args:
+            username: Gmail username to authenticate IMAP lib.
+            password: Gmail password to authenticate IMAP lib.
+            interval: Seconds to wait for more messages before each batch.
+            max_attempts: Number of batches to look for a message, before giving up on it.
+            compress: Boolean flag to compress the connection with ``COMPRESS=DEFLATE``, when the server supports it.
+        """
+        self.username = username
+        self.password = password
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.compress = compress
+        self.mail = None
+        self.error = None
+        self.deleted: Deque[Dict[str, str]] = deque(maxlen=1_000)
+        self.failed: Deque[Dict[str, str]] = deque(maxlen=1_000)
+        self._queue = queue.Queue()
+        self._pending: List[dict] = []
+        self._outstanding = 0
+        self._idle = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="SentReconciler", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def shared(
+        cls, username: str, password: str, compress: bool = False
+    ) -> "SentReconciler":
+        """Returns the reconciler for a Gmail account, which is shared by all the objects within the process.
+
+        Args:
+            username: Gmail username to authenticate IMAP lib.
+            password: Gmail password to authenticate IMAP lib.
+            compress: Boolean flag to compress the connection, used only when the reconciler is created.
+
+        Returns:
+            SentReconciler:
+            Running reconciler for the account.
+        """
+        with cls._shared_lock:
+            reconciler = cls._shared.get(username)
+            if reconciler is None or reconciler._stop.is_set():
+                reconciler = cls._shared[username] = cls(
+                    username=username, password=password, compress=compress
+                )
+            return reconciler
+
+    def submit(self, subject: str, body: str, to: str) -> None:
+        """Queues a message that was just sent, to be deleted from the sent items.
+
+        Args:
+            subject: Subject of the email to be deleted.
+            body: Body of the email to be deleted.
+            to: To address of the email to be deleted.
         """
+        with self._idle:
+            self._outstanding += 1
+        self._queue.put(dict(subject=subject, body=body, to=to, attempts=0))
+
+    def flush(self, timeout: Union[int, float] = None) -> bool:
+        """Processes the queued messages right away and waits for them to be deleted or given up on.
+
+        Args:
+            timeout: Maximum number of seconds to wait.
+
+        Returns:
+            bool:
+            Boolean flag to indicate whether all the queued messages were processed.
+        """
+        self._wake.set()
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._outstanding, timeout=timeout)
+
+    def close(self, timeout: Union[int, float] = None) -> None:
+        """Flushes the queued messages, stops the background thread and logs out.
+
+        Args:
+            timeout: Maximum number of seconds to wait for the queued messages. Defaults to all attempts.
+        """
+        if self._stop.is_set():
+            return
+        atexit.unregister(self.close)
+        if timeout is None:
+            timeout = self.interval * (self.max_attempts + 1)
+        self.flush(timeout=timeout)
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=timeout)
+        self.disconnect()
+
+    def connect(self) -> None:
+        """Creates a connection using SSL encryption and selects the sent folder."""
+        metrics.lookup(host="imap.gmail.com", port=993)
+        try:
+            with metrics.phase("imap.connect", host="imap.gmail.com"):
+                self.mail = imaplib.IMAP4_SSL(
+                    "imap.gmail.com", ssl_context=tls.context()
+                )
+            with metrics.phase("imap.auth", user=self.username):
+                self.mail.login(user=self.username, password=self.password)
+            if self.compress:
+                compression.enable(self.mail)
+            self.mail.list()
+            self.mail.select(Folder.sent)
+            self.error = None
+        except Exception as error:
+            self.mail = None
+            self.error = error.__str__()
+
+    def disconnect(self) -> None:
+        """Closes the connection and logs out, ignoring errors from a connection that is already dead."""
         if self.mail is None:
             return
-        return_code, messages = self.mail.search(
-            None, "ALL"
-        )  # Includes SEEN and UNSEEN, although sent is always SEEN
-        if return_code != "OK":
+        try:
+            self.mail.close()
+            self.mail.logout()
+        except Exception:
+            pass
+        self.mail = None
+
+    def _run(self) -> None:
+        """Collects the queued messages and deletes them in batches until stopped."""
+        while not self._stop.is_set():
+            self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            while True:
+                try:
+                    self._pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not self._pending:
+                continue
+            try:
+                self.reconcile()
+            # anything else, like a reply that cannot be parsed, must not stop the thread either
+            except Exception as error:
+                metrics.error(error)
+                self.error = error.__str__() or type(error).__name__
+                self.disconnect()
+            self._expire()
+
+    def reconcile(self) -> None:
+        """Locates the pending messages in the sent items and deletes all of them at once.
+
+        See Also:
+            - Candidates are searched once per distinct subject, and fetched with ``UID FETCH`` over compressed sets
+            - Matched messages are deleted using ``UID STORE`` over compressed sets of UIDs, followed by one ``EXPUNGE``
+        """
+        if self.mail is None:
+            self.connect()
+            if self.mail is None:
+                return
+        since = (datetime.date.today() - datetime.timedelta(days=1)).strftime(
+            "%d-%b-%Y"
+        )
+        found: Dict[bytes, dict] = {}
+        for subject in {item["subject"] for item in self._pending}:
+            try:
+                data = self._candidates(subject, since)
+            except imaplib.IMAP4.abort:
+                raise
+            except imaplib.IMAP4.error as error:
+                # the server refused the search for this subject, which fails the same way on every attempt
+                metrics.error(error)
+                self._fail(
+                    [item for item in self._pending if item["subject"] == subject],
+                    error=error.__str__(),
+                )
+                continue
+            for response_part in data:
+                if not isinstance(response_part, tuple):
+                    continue
+                metrics.count("bytes_in", len(response_part[1]))
+                uid = UID.search(response_part[0])
+                if not uid or uid.group(1) in found:
+                    continue
+                original_email = email.message_from_bytes(response_part[1])
+                for item in self._pending:
+                    if item.get("uid") is None and matches(
+                        original_email,
+                        username=self.username,
+                        subject=item["subject"],
+                        body=item["body"],
+                        to=item["to"],
+                    ):
+                        item["uid"] = uid.group(1)
+                        found[uid.group(1)] = summary(original_email)
+                        break
+        if not found:
             return
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            for deleted in executor.map(
-                self.thread_executor, sorted(messages[0].split(), reverse=True)
-            ):
-                if (
-                    deleted
-                ):  # Indicates the message sent has been deleted, so no need to loop through entire sent items
-                    executor.shutdown(cancel_futures=True)
-                    self.mail.close()
-                    self.mail.logout()
-                    return deleted
+        uids = parse(found)
+        for uid_set in uid_sets(uids):
+            with metrics.phase("imap.store", folder=Folder.sent, messages=len(uids)):
+                self.mail.uid("STORE", uid_set, "+FLAGS.SILENT", "(\\Deleted)")
+        with metrics.phase("imap.expunge", folder=Folder.sent):
+            if "UIDPLUS" in self.mail.capabilities:
+                # leaves alone the messages flagged as deleted by someone else
+                for uid_set in uid_sets(uids):
+                    self.mail.uid("EXPUNGE", uid_set)
+            else:
+                self.mail.expunge()
+        self.deleted.extend(found.values())
+        self._resolve([item for item in self._pending if item.get("uid")])
+
+    def _candidates(self, subject: str, since: str) -> list:
+        """Searches the sent items since a date for a subject, and fetches the messages found."""
+        with metrics.phase("imap.search", folder=Folder.sent):
+            return_code, messages = search_subject(
+                self.mail, subject, Condition.since(since)
+            )
+        if return_code != "OK" or not messages[0]:
+            return []
+        data = []
+        for uid_set in uid_sets(parse(messages)):
+            with metrics.phase("imap.fetch", folder=Folder.sent):
+                return_code, fetched = self.mail.uid("FETCH", uid_set, "(BODY.PEEK[])")
+            if return_code == "OK":
+                data.extend(fetched)
+        return data
+
+    def _expire(self) -> None:
+        """Counts an attempt for the messages that are still pending, and gives up on the ones out of attempts."""
+        expired = []
+        for item in self._pending:
+            item["attempts"] += 1
+            if item["attempts"] >= self.max_attempts:
+                expired.append(item)
+        self._fail(
+            expired, error=self.error or "Failed to locate the SMS in Sent Mail."
+        )
+
+    def _fail(self, items: List[dict], error: str) -> None:
+        """Gives up on the items, and records them along with the error."""
+        for item in items:
+            self.failed.append(
+                dict(to=item["to"], subject=item["subject"], error=error)
+            )
+        self._resolve(items)
+
+    def _resolve(self, items: List[dict]) -> None:
+        """Removes the items from pending and notifies the threads waiting in flush."""
+        if not items:
+            return
+        resolved = {id(item) for item in items}
+        self._pending = [item for item in self._pending if id(item) not in resolved]
+        with self._idle:
+            self._outstanding -= len(items)
+            self._idle.notify_all()
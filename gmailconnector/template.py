@@ -0,0 +1,288 @@
+import base64
+import io
+import os
+import random
+import string
+import sys
+from email.generator import BytesGenerator
+from email.header import Header
+from email.mime.application import MIMEApplication
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+CRLF = b"\r\n"
+
+
+def attachment_list(
+    attachment: Union[str, list] = None,
+    filename: Union[str, list] = None,
+    custom_attachment: Dict[Union[str, os.PathLike], str] = None,
+) -> Tuple[list, list]:
+    """Converts the different ways of passing attachments into lists of attachments and filenames.
+
+    Args:
+        attachment: Name of the file that has to be attached.
+        filename: Custom name of the attachment.
+        custom_attachment: Dictionary of the filepath as key and the custom name for the attachment as value.
+
+    Returns:
+        Tuple[list, list]:
+        Returns a tuple of attachments and their custom filenames.
+    """
+    if custom_attachment:
+        return list(custom_attachment.keys()), list(custom_attachment.values())
+    attachments = (
+        [attachment]
+        if isinstance(attachment, str)
+        else attachment if attachment else []
+    )
+    filenames = (
+        [filename] if isinstance(filename, str) else filename if filename else []
+    )
+    return attachments, filenames
+
+
+def attachment_filename(attachment: str, filename: Optional[str]) -> str:
+    """Gets the name with which the file has to be attached.
+
+    Args:
+        attachment: Name of the file that has to be attached.
+        filename: Custom name of the attachment.
+
+    Returns:
+        str:
+        Filename for the attachment.
+    """
+    if filename and "." in filename:  # filename is passed with an extn
+        return filename
+    if filename and "." in attachment:  # file name's extn is got from attachment name
+        return f"{filename}.{attachment.split('.')[-1]}"
+    if filename:  # filename is passed without an extn so proceeding with the same
+        return filename
+    return attachment.split(os.path.sep)[
+        -1
+    ].strip()  # rips path from attachment as filename
+
+
+def attachment_error(attachment: str) -> Optional[str]:
+    """Checks if the file can be attached.
+
+    Args:
+        attachment: Name of the file that has to be attached.
+
+    Returns:
+        str:
+        Reason why the file cannot be attached, ``None`` if it can be.
+    """
+    if not os.path.isfile(attachment):
+        return "FILE NOT FOUND"
+    if os.path.getsize(attachment) / 1e6 > 25:
+        return "FILE SIZE OVER 25 MB"
+
+
+def attachment_part(attachment: str, filename: str) -> MIMEApplication:
+    """Creates the MIME part for a file.
+
+    Args:
+        attachment: Name of the file that has to be attached.
+        filename: Name with which the file has to be attached.
+
+    Returns:
+        MIMEApplication:
+        MIME part with the content of the file.
+    """
+    with open(attachment, "rb") as file:
+        attribute = MIMEApplication(file.read(), _subtype=attachment.split(".")[-1])
+    attribute.add_header("Content-Disposition", "attachment", filename=filename)
+    return attribute
+
+
+def text_part(text: str, subtype: str) -> bytes:
+    """Encodes a text part with its headers, the same way as ``MIMEText``.
+
+    Args:
+        text: Content of the part.
+        subtype: Subtype of the content, ``plain`` or ``html``.
+
+    Returns:
+        bytes:
+        Encoded part with ``CRLF`` line endings.
+    """
+    try:
+        payload = text.encode("ascii").replace(CRLF, b"\n").replace(b"\n", CRLF)
+        charset, encoding = b"us-ascii", b"7bit"
+    except UnicodeEncodeError:
+        payload = base64.encodebytes(text.encode("utf-8")).replace(b"\n", CRLF)
+        charset, encoding = b"utf-8", b"base64"
+    return b"".join(
+        (
+            b'Content-Type: text/%s; charset="%s"\r\n' % (subtype.encode(), charset),
+            b"MIME-Version: 1.0\r\n",
+            b"Content-Transfer-Encoding: %s\r\n\r\n" % encoding,
+            payload.rstrip(CRLF) if encoding == b"base64" else payload,
+        )
+    )
+
+
+def header_value(value: str) -> bytes:
+    """Encodes a header value, using RFC 2047 encoding for non-ascii values."""
+    value = value.replace("\r", " ").replace("\n", " ")
+    try:
+        return value.encode("ascii")
+    except UnicodeEncodeError:
+        return Header(value, "utf-8").encode(linesep="\r\n").encode("ascii")
+
+
+def identifiers(text: str) -> Tuple[str, ...]:
+    """Gets the names of the placeholders in a ``string.Template``."""
+    names = []
+    for match in string.Template.pattern.finditer(text):
+        name = match.group("named") or match.group("braced")
+        if name and name not in names:
+            names.append(name)
+    return tuple(names)
+
+
+class _Part:
+    """Part of a template that is encoded once, or rendered only when its placeholders change."""
+
+    def __init__(self, text: str, encoder: Callable[[str], bytes]):
+        """Encodes the text right away if there are no placeholders in it."""
+        self.names = identifiers(text)
+        self.static = None if self.names else encoder(text)
+        template = string.Template(text)
+        self._render = lru_cache(maxsize=256)(
+            lambda values: encoder(template.substitute(dict(zip(self.names, values))))
+        )
+
+    def render(self, variables: Dict[str, Any]) -> bytes:
+        """Returns the encoded part for the given variables."""
+        if self.static is not None:
+            return self.static
+        return self._render(tuple(str(variables[name]) for name in self.names))
+
+
+class EmailTemplate:
+    """Precompiles a message to be sent to multiple recipients with different values for its placeholders.
+
+    >>> EmailTemplate
+
+    """
+
+    def __init__(
+        self,
+        subject: str,
+        body: str = None,
+        html_body: str = None,
+        attachment: Union[str, list] = None,
+        filename: Union[str, list] = None,
+        custom_attachment: Dict[Union[str, os.PathLike], str] = None,
+        sender: str = "GmailConnector",
+    ):
+        """Encodes the static parts of the message, including the attachments, once.
+
+        Args:
+            subject: Subject line of the email.
+            body: Body of the email. Defaults to ``None``.
+            html_body: Body of the email. Defaults to ``None``.
+            attachment: Name of the file that has to be attached.
+            filename: Custom name of the attachment.
+            custom_attachment: Dictionary of the filepath as key and the custom name for the attachment as value.
+            sender: Add sender name to the email.
+
+        See Also:
+            - Subject and body can have placeholders in the format of ``string.Template``, like ``$name``
+            - A literal ``$`` in a subject or body with placeholders has to be written as ``$$``, like ``costs $$5``
+            - Parts with placeholders are cached based on the values used, so repeated values are not re-encoded.
+        """
+        self.sender = sender
+        self.unattached: Dict[str, List[str]] = {
+            "FILE NOT FOUND": [],
+            "FILE SIZE OVER 25 MB": [],
+        }
+        self.boundary = ("=" * 15) + repr(random.randrange(sys.maxsize)) + "=="
+        self._delimiter = b"--%s\r\n" % self.boundary.encode()
+        self._head = (
+            b'Content-Type: multipart/mixed; boundary="%s"\r\n'
+            b"MIME-Version: 1.0\r\n" % self.boundary.encode()
+        )
+        self._tail = b"--%s--\r\n" % self.boundary.encode()
+        self._subject = _Part(text=subject, encoder=header_value)
+        self._parts: List[_Part] = []
+        if body:
+            self._parts.append(
+                _Part(text=body, encoder=lambda t: text_part(t, "plain"))
+            )
+        if html_body:
+            self._parts.append(
+                _Part(text=html_body, encoder=lambda t: text_part(t, "html"))
+            )
+        self._attachments: List[bytes] = []
+        attachments, filenames = attachment_list(
+            attachment=attachment,
+            filename=filename,
+            custom_attachment=custom_attachment,
+        )
+        for index, attachment_ in enumerate(attachments):
+            try:
+                name = filenames[index]
+            except IndexError:
+                name = None
+            name = attachment_filename(attachment=attachment_, filename=name)
+            if error := attachment_error(attachment=attachment_):
+                self.unattached[error].append(name)
+                continue
+            part = attachment_part(attachment=attachment_, filename=name)
+            buffer = io.BytesIO()
+            BytesGenerator(
+                buffer, mangle_from_=False, policy=part.policy.clone(linesep="\r\n")
+            ).flatten(part)
+            self._attachments.append(buffer.getvalue().rstrip(CRLF))
+
+    def render(
+        self,
+        from_addr: str,
+        recipient: List[str],
+        cc: List[str] = None,
+        variables: Dict[str, Any] = None,
+    ) -> bytes:
+        """Renders the message for a recipient.
+
+        Args:
+            from_addr: Email address of the sender.
+            recipient: Email addresses of the recipients.
+            cc: Email addresses of the recipients to whom the email has to be CC'd.
+            variables: Values for the placeholders in the subject and body.
+
+        Raises:
+            KeyError:
+            If a value for a placeholder is missing.
+            ValueError:
+            If a ``$`` is not followed by a valid placeholder name.
+
+        Returns:
+            bytes:
+            Message ready to be sent over SMTP, with ``CRLF`` line endings.
+        """
+        variables = variables or {}
+        segments = [
+            self._head,
+            b"Subject: ",
+            self._subject.render(variables),
+            CRLF,
+            b"From: ",
+            header_value(f"{self.sender} <{from_addr}>"),
+            CRLF,
+            b"To: ",
+            ",".join(recipient).encode(),
+            CRLF,
+        ]
+        if cc:
+            segments.extend((b"Cc: ", ",".join(cc).encode(), CRLF))
+        segments.append(CRLF)
+        for part in self._parts:
+            segments.extend((self._delimiter, part.render(variables), CRLF))
+        for part in self._attachments:
+            segments.extend((self._delimiter, part, CRLF))
+        segments.append(self._tail)
+        return b"".join(segments)
@@ -0,0 +1,142 @@
+"""Shared ``SSLContext`` for the SMTP and IMAP connections, that resumes TLS sessions across connections."""
+
+import ssl
+import threading
+from typing import Dict, Tuple, Union
+
+from .instrumentation import metrics
+
+
+class ResumableSocket(ssl.SSLSocket):
+    """SSL socket that hands its session back to the context when it is closed.
+
+    See Also:
+        With TLS 1.3, the session ticket arrives after the handshake, so the session is taken at close instead.
+    """
+
+    session_key: Tuple[str, int] = None
+
+    def keep_session(self) -> None:
+        """Hands the session to the context, to be resumed by the next connection to the same server."""
+        context = self.context
+        if self.session_key and isinstance(context, SharedContext):
+            try:
+                session = self.session
+            except (ValueError, OSError):
+                session = None
+            if session is not None:
+                context.store(self.session_key, session)
+
+    def shutdown(self, how: int) -> None:
+        """Keeps the session before shutting down, which drops the TLS state as done by ``imaplib``"""
+        self.keep_session()
+        super().shutdown(how)
+
+    def close(self) -> None:
+        """Keeps the session before closing the socket, as done by ``smtplib``"""
+        self.keep_session()
+        super().close()
+
+
+class SharedContext(ssl.SSLContext):
+    """Client ``SSLContext`` that keeps the last TLS session for each server, and offers it on the next connection.
+
+    >>> SharedContext
+
+    See Also:
+        - A resumed handshake skips the certificate exchange and verification, and the key exchange of a full one.
+        - Counts ``tls_handshakes`` with the label ``resumed``, when instrumentation is enabled.
+    """
+
+    sslsocket_class = ResumableSocket
+
+    def __init__(self, *args, **kwargs):
+        """Creates the context with an empty session cache."""
+        super().__init__()
+        self.sessions: Dict[Tuple[str, int], ssl.SSLSession] = {}
+        self.sessions_lock = threading.Lock()
+
+    def store(self, key: Tuple[str, int], session: ssl.SSLSession) -> None:
+        """Keeps a session to be resumed, replacing the previous one for the server."""
+        with self.sessions_lock:
+            self.sessions[key] = session
+
+    def wrap_socket(
+        self,
+        sock,
+        *args,
+        server_hostname: str = None,
+        session: ssl.SSLSession = None,
+        **kwargs,
+    ) -> ssl.SSLSocket:
+        """Wraps the socket with the cached session of the server, and counts whether the handshake resumed it."""
+        try:
+            key = (server_hostname, sock.getpeername()[1])
+        except (OSError, IndexError):
+            key = None
+        if session is None and key:
+            with self.sessions_lock:
+                session = self.sessions.pop(
+                    key, None
+                )  # TLS 1.3 tickets are meant to be used only once
+        wrapped = super().wrap_socket(
+            sock, *args, server_hostname=server_hostname, session=session, **kwargs
+        )
+        wrapped.session_key = key
+        if key and kwargs.get("do_handshake_on_connect", True):
+            metrics.count("tls_handshakes", resumed=wrapped.session_reused)
+        return wrapped
+
+
+_context: Union[ssl.SSLContext, None] = None
+_lock = threading.Lock()
+
+
+def create_context(
+    cafile: str = None, minimum_version: ssl.TLSVersion = ssl.TLSVersion.TLSv1_2
+) -> SharedContext:
+    """Creates a context with the same verification as ``ssl.create_default_context``, along with session resumption.
+
+    Args:
+        cafile: File with the certificates to trust, defaults to the system certificates.
+        minimum_version: Lowest TLS version accepted.
+
+    Returns:
+        SharedContext:
+        Context that verifies the certificate and the hostname of the server.
+    """
+    context = SharedContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = minimum_version
+    if cafile:
+        context.load_verify_locations(cafile=cafile)
+    else:
+        context.load_default_certs()
+    return context
+
+
+def context() -> ssl.SSLContext:
+    """Returns the context shared by all the connections, created on first use.
+
+    See Also:
+        Loading the system certificates takes a while, which is done only once per process.
+    """
+    global _context
+    if _context is None:
+        with _lock:
+            if _context is None:
+                _context = create_context()
+    return _context
+
+
+def set_context(value: Union[ssl.SSLContext, None]) -> None:
+    """Replaces the shared context, like one built with ``create_context`` for a private CA.
+
+    Args:
+        value: Context to use for all the connections created from here on, ``None`` to go back to the default.
+
+    See Also:
+        A plain ``ssl.SSLContext`` is shared as is, but only a ``SharedContext`` resumes sessions.
+    """
+    global _context
+    with _lock:
+        _context = value
@@ -0,0 +1,108 @@
+"""Helpers to turn lists of UIDs into compact IMAP sequence sets like ``1:500,720,900:950``, and back."""
+
+from collections.abc import Generator
+from typing import Iterable, List, Union
+
+# RFC 7162 recommends that clients keep command lines under 8192 octets
+MAX_LENGTH = 8000
+
+
+def parse(messages: Union[List[bytes], Iterable[Union[int, str, bytes]]]) -> List[int]:
+    """Reads the UIDs from the body of a search response, or from any iterable of UIDs.
+
+    Args:
+        messages: Body of ``ReadEmail.instantiate`` like ``[b"1 2 3"]``, or UIDs as integers, strings or bytes.
+
+    Returns:
+        List[int]:
+        Sorted list of unique UIDs.
+    """
+    if isinstance(messages, (str, bytes)):
+        messages = [messages]
+    uids = set()
+    for each in messages:
+        if isinstance(each, int):
+            uids.add(each)
+        else:
+            uids.update(int(uid) for uid in each.split())
+    return sorted(uids)
+
+
+def ranges(uids: Iterable[int]) -> Generator[str]:
+    """Yields the runs of consecutive UIDs as ``start:end``, or as a single UID."""
+    start = end = None
+    for uid in sorted(set(uids)):
+        if end is not None and uid == end + 1:
+            end = uid
+            continue
+        if start is not None:
+            yield f"{start}:{end}" if end > start else str(start)
+        start = end = uid
+    if start is not None:
+        yield f"{start}:{end}" if end > start else str(start)
+
+
+def compress(uids: Iterable[int]) -> str:
+    """Compresses UIDs into an IMAP sequence set.
+
+    Examples:
+        >>> compress([1, 2, 3, 7, 9, 10])
+        '1:3,7,9:10'
+    """
+    return ",".join(ranges(uids))
+
+
+def expand(uid_set: Union[str, bytes]) -> List[int]:
+    """Expands an IMAP sequence set without ``*`` into the UIDs.
+
+    Examples:
+        >>> expand('1:3,7')
+        [1, 2, 3, 7]
+    """
+    if isinstance(uid_set, bytes):
+        uid_set = uid_set.decode()
+    uids = []
+    for item in uid_set.split(","):
+        start, _, end = item.partition(":")
+        start, end = int(start), int(end or start)
+        uids.extend(range(min(start, end), max(start, end) + 1))
+    return uids
+
+
+def uid_sets(
+    uids: Iterable[int], size: int = None, max_length: int = MAX_LENGTH
+) -> Generator[str]:
+    """Splits the UIDs into compressed sets, that are short enough to be sent in a single command.
+
+    Args:
+        uids: UIDs to be split.
+        size: Maximum number of UIDs in each set, unlimited by default.
+        max_length: Maximum length of each set in characters.
+
+    Yields:
+        str:
+        Compressed sequence set.
+    """
+    pieces, length, count = [], 0, 0
+    for piece in ranges(uids):
+        start, _, end = piece.partition(":")
+        start, end = int(start), int(end or start)
+        while start <= end:
+            # a range is split when it would take the set over the number of UIDs
+            take = (
+                end - start + 1 if size is None else min(end - start + 1, size - count)
+            )
+            part = f"{start}:{start + take - 1}" if take > 1 else str(start)
+            if pieces and length + len(part) + 1 > max_length:
+                yield ",".join(pieces)
+                pieces, length, count = [], 0, 0
+                continue
+            pieces.append(part)
+            length += len(part) + 1
+            count += take
+            start += take
+            if size is not None and count >= size:
+                yield ",".join(pieces)
+                pieces, length, count = [], 0, 0
+    if pieces:
+        yield ",".join(pieces)
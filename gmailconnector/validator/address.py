@@ -1,11 +1,41 @@
 import ipaddress
-from typing import Union
-
-from idna.core import IDNAError
-from idna.core import encode as idna_encode
+import re
+from functools import lru_cache
+from typing import Iterable, List, Union
 
 from .exceptions import AddressFormatError
 
+# Pure ASCII LDH (letters, digits, hyphen) domain, that is already in its IDNA form
+LDH_DOMAIN = re.compile(
+    r"^(?:(?!-)(?!..--)[A-Za-z0-9-]{1,63}(?<!-)\.)*(?!-)(?!..--)[A-Za-z0-9-]{1,63}(?<!-)$"
+)
+
+
+@lru_cache(maxsize=4096)
+def encode_domain(domain: str) -> str:
+    """Encodes the domain into IDNA format, skipping the encoder for domains that are already ASCII LDH.
+
+    Args:
+        domain: Domain part of the email address.
+
+    Raises:
+        AddressFormatError:
+        If the domain cannot be converted into IDNA format.
+
+    Returns:
+        str:
+        IDNA (ASCII compatible) version of the domain.
+    """
+    if len(domain) <= 253 and LDH_DOMAIN.match(domain):
+        return domain
+    from idna.core import IDNAError
+    from idna.core import encode as idna_encode
+
+    try:
+        return idna_encode(domain).decode("ascii")
+    except IDNAError as error:
+        raise AddressFormatError(error)
+
 
 class EmailAddress:
     """Initiates ValidateAddress object to split the address into user and domin to further validate.
@@ -27,10 +57,42 @@ class EmailAddress:
             raise AddressFormatError
         if not self._user:
             raise AddressFormatError("Empty user")
-        try:
-            self._domain = idna_encode(self._domain).decode("ascii")
-        except IDNAError as error:
-            raise AddressFormatError(error)
+        self._domain = encode_domain(self._domain)
+
+    @classmethod
+    def parse_many(cls, addresses: Iterable[str]) -> List["EmailAddress"]:
+        """Parses a list of email addresses, encoding each distinct domain only once.
+
+        Args:
+            addresses: Iterable of email addresses as strings.
+
+        Raises:
+            AddressFormatError:
+            For the first address that is invalid, same as parsing them one at a time.
+
+        Returns:
+            List[EmailAddress]:
+            List of ``EmailAddress`` objects in the same order as received.
+        """
+        encoded = {}
+        parsed = []
+        for address in addresses:
+            try:
+                user, domain = address.rsplit("@", 1)
+            except ValueError:
+                raise AddressFormatError
+            if not user:
+                raise AddressFormatError("Empty user")
+            if domain not in encoded:
+                encoded[domain] = encode_domain(domain)
+            instance = cls.__new__(cls)
+            instance._address, instance._user, instance._domain = (
+                address,
+                user,
+                encoded[domain],
+            )
+            parsed.append(instance)
+        return parsed
 
     @property
     def user(self) -> str:
@@ -2,13 +2,15 @@ import logging
 import socket
 from collections.abc import Generator
 from ipaddress import IPv4Address, IPv6Address
-from typing import Iterable, Union
-
-from dns.rdtypes.ANY.MX import MX
-from dns.resolver import NXDOMAIN, Answer, NoAnswer, resolve
+from typing import TYPE_CHECKING, Iterable, Union
 
+from ..instrumentation import metrics
 from .exceptions import InvalidDomain, NotMailServer, UnresponsiveMailServer
 
+if TYPE_CHECKING:  # dnspython is imported on first lookup
+    from dns.rdtypes.ANY.MX import MX
+    from dns.resolver import Answer
+
 default_logger = logging.getLogger("validator")
 
 
@@ -25,8 +27,11 @@ def get_mx_records(
         IPv4Address:
         IP addresses of the mail exchange servers from authoritative/non-authoritative answer section.
     """
+    from dns.resolver import NXDOMAIN, NoAnswer, resolve
+
     try:
-        resolved: Iterable[Answer] = resolve(domain, "MX")
+        with metrics.phase("dns.mx", domain=domain):
+            resolved: Iterable["Answer"] = resolve(domain, "MX")
     except NXDOMAIN as error:
         raise InvalidDomain(error)
     except NoAnswer as error:
@@ -34,13 +39,15 @@ def get_mx_records(
     if not resolved:
         raise NotMailServer(f"Domain {domain!r} is not a mail server.")
     for record in resolved:
-        record: MX = record
+        record: "MX" = record
         if record.exchange.to_text().strip() == ".":
             raise UnresponsiveMailServer(
                 f"Domain {domain!r} appears to be valid, but failed to resolve IP addresses."
             )
+        exchange = record.exchange.to_text(omit_final_dot=True)
         try:
-            ip = socket.gethostbyname(record.exchange.to_text())
+            with metrics.phase("dns.a", host=exchange):
+                ip = socket.gethostbyname(exchange)
         except socket.error as error:
             logger.error(error)
             raise UnresponsiveMailServer(error)
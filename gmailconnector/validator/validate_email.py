@@ -4,6 +4,7 @@ import smtplib
 import socket
 from typing import Union
 
+from ..instrumentation import metrics
 from ..models.responder import Response
 from .address import EmailAddress
 from .domain import get_mx_records
@@ -100,13 +101,18 @@ def validate_email(
         for record in get_mx_records(domain=address.domain):
             logger.info(f"Trying {record}...")
             try:
-                server.connect(host=record)
+                with metrics.phase("smtp.connect", host=record, port=25):
+                    server.connect(host=record)
             except socket.error as error:
                 logger.error(error)
+                metrics.error(error)
                 continue
-            server.ehlo_or_helo_if_needed()
-            server.mail(sender=sender or address.email)
-            code, msg = server.rcpt(recip=address.email)
+            with metrics.phase("smtp.rcpt", host=record):
+                server.ehlo_or_helo_if_needed()
+                server.mail(sender=sender or address.email)
+                code, msg = server.rcpt(recip=address.email)
+            if code >= 400:
+                metrics.count("errors", status=code)
             msg = re.sub(r"\d+.\d+.\d+", "", msg.decode(encoding="utf-8")).strip()
             msg = (
                 " ".join(msg.splitlines()).replace("  ", " ").strip()